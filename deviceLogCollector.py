@@ -23,14 +23,34 @@ This script calls Template Programmer & Network Device APIs and deploy an EEM Sc
 BTTracelogs automatically and send them to FTP server whenever there is error seen in the tracelogs.
 All simplify REST request functions and get authentication token function are in dnac-api-helper.py
 Controller ip, username and password are defined in dnac_config.py
+With --clusters several controllers are driven at once, each deploys to the devices in its own inventory
 """
 
 from dnac_api_helper import *
 from dnac_template_helper import *
+from dnac_device_helper import *
+from dnac_async_helper import AsyncDnacClient
+from dnac_clusters import cluster_candidates, load_cluster_profiles, run_on_clusters
+from dnac_guestshell_agent import AGENT_FILES, AGENT_FTP_DIR, AGENT_HOME, CLI_LEVELS, DECODE_COMMAND, LEVELS, level_number
+from dnac_stagger import DELAY_PARAM, stagger_params
+from dnac_deploy_tracker import DeploymentTracker
+from dnac_template_pipeline import *
+from dnac_inventory import DeviceInventory
+from dnac_workflow import Workflow
 import dnac_config
+import argparse
+import asyncio
+import cProfile
+import functools
+import hashlib
 import json
-import time
+import os
+import logging
 import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
 
 
 def get_network_device_id(device_ip = dnac_config.DEVICE_IP):
@@ -42,33 +62,99 @@ def get_network_device_id(device_ip = dnac_config.DEVICE_IP):
     :return: Returns device UUID
     '''
 
-    try:
-        # The request and response of GET network-device/ip-address/ API
-        resp = get(api="network-device/ip-address/"+device_ip)
-        status = resp.status_code
-        device = resp.text
+    # The request and response of GET network-device/ip-address/ API
+    resp = get(api="network-device/ip-address/"+device_ip)
+    result = parse_response(resp, 200, "Something wrong, cannot get network device information")
 
-    except ValueError:
-        print("Something wrong, cannot get network device information")
+    if not result.response:  # Response is empty, no network-device is discovered.
+        logger.error("No network device found with IP %s !", device_ip)
         sys.exit()
+    logger.info("Device UUID: %s", result.response["instanceUuid"])
+    return result.response["instanceUuid"]
 
-    if status != 200:
-        print(resp.text)
-        sys.exit()
 
-    if device == []:  # Response is empty, no network-device is discovered.
-        print("No network device found with IP {} !".format(device_ip))
-        sys.exit()
-    else:
-        device_json = json.loads(device)
-        print(json.dumps(device_json, indent=4, sort_keys=True))
-        print(resp.json()["response"]["instanceUuid"])
-        return resp.json()["response"]["instanceUuid"]
+# Template parameters of the parameterized EEM Script, in the order of create_eem_script arguments
+EEM_TEMPLATE_PARAMS = [
+    ("process_name", "IOS process name for which logs are collected"),
+    ("ftp_server", "FTP Server IP address where logs are copied"),
+    ("ftp_username", "FTP Server username"),
+    ("ftp_password", "FTP Server password"),
+    ("query_interval", "EEM run interval in seconds"),
+]
+
+
+# Ways of starting the EEM Script
+#  timer:  every query_interval seconds, collect if the error trace of the process has errors
+#  syslog: on a syslog message matching syslog_pattern, collect right away
+#  crash:  on the process manager message that the process failed or was held down, collect right away
+EEM_TRIGGERS = ("timer", "syslog", "crash")
+
+# Seconds a run of the EEM Script or a pass of the guest shell agent may take before EEM stops it,
+# the delay of a staggered script comes on top
+EEM_MAXRUN = 300
+
+
+def create_eem_template_params(trigger=dnac_config.EEM_TRIGGER, staggered=False):
+    '''
+    Method to create the templateParams definitions of the parameterized EEM Script.
+    :param trigger: EEM trigger, query_interval is only a parameter of the timer trigger
+    :param staggered: Add the per-device delay of a staggered script (dnac_stagger.DELAY_PARAM)
+    :return: List of template parameter definitions
+    '''
+    definitions = [(name, description) for name, description in EEM_TEMPLATE_PARAMS
+                   if trigger == "timer" or name != "query_interval"]
+    if staggered:
+        definitions.append((DELAY_PARAM, "Seconds the EEM waits before it collects, spreads the fleet"))
+    # Numbered once the parameters the trigger does not use are left out, so the order has no gaps
+    return [{"parameterName": name,
+             "dataType": "STRING",
+             "displayName": name,
+             "description": description,
+             "required": True,
+             "order": order} for order, (name, description) in enumerate(definitions, 1)]
+
+
+def create_eem_param_values(ios_process=dnac_config.PROCESS_NAME,ftp_server_ip=dnac_config.FTP_SERVER,
+                            ftp_user=dnac_config.FTP_USERNAME, ftp_pass=dnac_config.FTP_PASSWORD,
+                            query_interval=dnac_config.QUERY_INTERVAL, trigger=dnac_config.EEM_TRIGGER):
+    '''
+    Method to create the deploy time values of the parameterized EEM Script. Arguments as for create_eem_script.
+    :return: Dict of template parameter name to value
+    '''
+    values = [ios_process, ftp_server_ip, ftp_user, ftp_pass, query_interval]
+    return dict((name, value) for (name, description), value in zip(EEM_TEMPLATE_PARAMS, values)
+                if trigger == "timer" or name != "query_interval")
+
+
+def label_actions(actions, first=100, step=5):
+    '''
+    Give EEM applet actions their labels. EEM runs actions in the string order of their labels,
+    so labels are numbers of equal width.
+    :param actions: List of actions without label, actions inside an if/else block start with a space
+    :param first: Label of the first action
+    :param step: Gap between two labels
+    :return: List of labelled action lines
+    '''
+    return ["action " + str(first + index * step).zfill(3) + " " + action for index, action in enumerate(actions)]
+
+
+def eem_variable(name):
+    '''
+    Reference to a variable the applet keeps itself. EEM reserves names starting with "_" for its own
+    variables, so ours start with "dnac_"; Velocity would take $dnac_name for a template variable, so the
+    reference is unparsed Velocity content that reaches the device as $dnac_name.
+    :param name: Variable name, e.g. dnac_signature
+    :return: Velocity literal of the reference
+    '''
+    return "#[[$" + name + "]]#"
 
 
 def create_eem_script(ios_process=dnac_config.PROCESS_NAME,ftp_server_ip=dnac_config.FTP_SERVER,
                       ftp_user=dnac_config.FTP_USERNAME, ftp_pass=dnac_config.FTP_PASSWORD,
-                      query_interval=dnac_config.QUERY_INTERVAL):
+                      query_interval=dnac_config.QUERY_INTERVAL, parameterized=False,
+                      trigger=dnac_config.EEM_TRIGGER, syslog_pattern=dnac_config.SYSLOG_PATTERN,
+                      cooldown=dnac_config.COLLECT_COOLDOWN, new_errors_only=dnac_config.COLLECT_NEW_ERRORS_ONLY,
+                      spread=0, decode_level=dnac_config.DECODE_LEVEL):
     '''
     Method to Create a Event Manager Script that will be pushed to the device via Template Programmer.
     :param ios_process: IOS Process Name for which Logs need to be collected.Configured via dnac_config.PROCESS_NAME
@@ -76,114 +162,525 @@ def create_eem_script(ios_process=dnac_config.PROCESS_NAME,ftp_server_ip=dnac_co
     :param ftp_user: FTP Server username. Configured via dnac_config.FTP_USERNAME
     :param ftp_pass: FTP Server password. Configured via dnac_config.FTP_PASSWORD
     :param query_interval: EEM Run interval in seconds
+    :param parameterized: Leave the values above as Velocity variables (EEM_TEMPLATE_PARAMS) that are filled
+                          in per device at deploy time, so one committed version serves every device and process.
+    :param trigger: One of EEM_TRIGGERS. Configured via dnac_config.EEM_TRIGGER
+    :param syslog_pattern: Syslog regular expression for the syslog trigger. Configured via dnac_config.SYSLOG_PATTERN
+    :param cooldown: Seconds after a collection in which no further collection is made, 0 for none.
+                     Configured via dnac_config.COLLECT_COOLDOWN
+    :param new_errors_only: Only collect when the error signature differs from the one last collected.
+                            Configured via dnac_config.COLLECT_NEW_ERRORS_ONLY
+    :param spread: Seconds over which the collections of the fleet are spread, 0 for none. Every run first
+                   waits the per-device delay DELAY_PARAM (see dnac_stagger.py), a deploy time value,
+                   so spread needs parameterized.
+    :param decode_level: Least severe level of the binary trace records the device decodes into the text member
+                         of each collection. Configured via dnac_config.DECODE_LEVEL
     :return: Return EEM Script
     '''
-    script = """event manager applet DNACGetLog
-                event timer watchdog time """ + query_interval + """
+    if trigger not in EEM_TRIGGERS:
+        logger.error("Unknown EEM trigger %s, use one of %s", trigger, ", ".join(EEM_TRIGGERS))
+        sys.exit()
+    if spread and not parameterized:
+        logger.error("A staggered EEM Script takes its delay from a template parameter, it must be parameterized")
+        sys.exit()
+    if parameterized:
+        # ${name} keeps Velocity from reading the "_error_" that follows the process name as part of the variable.
+        # EEM variables such as $_cli_result start with "_" and are not Velocity references.
+        ios_process, ftp_server_ip, ftp_user, ftp_pass, query_interval = \
+            ["${" + name + "}" for name, description in EEM_TEMPLATE_PARAMS]
+
+    # State kept between runs lives in EEM environment variables, set up by the template and updated by the
+    # applet once a collection was copied. See eem_variable for how they are referenced.
+    tar_file = "bootflash:" + ios_process + "_error_$_event_pub_sec.tar"
+    # The binary trace files can only be decoded on the device, the text goes into the tar next to them
+    decoded_file = "bootflash:tracelogs/" + ios_process + "_decoded_$_event_pub_sec.log"
+    environment = []
+    skip = []
+    remember = []
+    if cooldown:
+        environment.append("event manager environment dnac_next_collect 0")
+        skip += ["if $_event_pub_sec lt " + eem_variable("dnac_next_collect"),
+                 " puts \"Collected less than " + str(cooldown) + " seconds ago, skipped\"",
+                 " exit",
+                 "end"]
+        remember += [" add $_event_pub_sec " + str(cooldown),
+                     " cli command \"event manager environment dnac_next_collect $_result\""]
+    if new_errors_only:
+        environment.append("event manager environment dnac_last_signature none")
+        skip += ["if \"" + eem_variable("dnac_signature") + "\" eq \"" + eem_variable("dnac_last_signature") + "\"",
+                 " puts \"Same error as the last collection, skipped\"",
+                 " exit",
+                 "end"]
+        remember += [" cli command \"event manager environment dnac_last_signature " +
+                     eem_variable("dnac_signature") + "\""]
+    if remember:
+        remember = [" cli command \"config terminal\""] + remember + [" cli command \"end\""]
+    # The tar is only deleted, and the state only updated, once the copy succeeded
+    collect = skip + [
+        "cli command \"request platform soft trace rotate all\"",
+        "cli command \"" + DECODE_COMMAND.format(process=ios_process, level=CLI_LEVELS[level_number(decode_level)]) +
+        " | redirect " + decoded_file + "\"",
+        "cli command \"archive tar /create " + tar_file + " bootflash:tracelogs " + ios_process + "*\"",
+        "cli command \"delete /force " + decoded_file + "\"",
+        "cli command \"copy " + tar_file + " ftp://" + ftp_server_ip + "\"",
+        "regexp \"bytes copied\" \"$_cli_result\"",
+        "if $_regexp_result eq \"1\"",
+        " cli command \"delete /force " + tar_file + "\""] + remember + [
+        " puts \"Copied Collected logs to FTP Server\"",
+        "else",
+        " puts \"Copy to FTP Server failed, " + tar_file + " is kept\"",
+        "end"]
+
+    if trigger == "timer":
+        event = "event timer watchdog time " + query_interval
+        # Polls the binary error trace of the process and only collects when it has errors.
+        # The signature is the start of the latest error message, up to its first digit or unusual character.
+        if new_errors_only:
+            collect = ["set dnac_signature \"unknown\"",
+                       "regexp \"^.*\\((EMERG|ALERT|CRIT|ERR)\\): ([A-Za-z _:./-]+)\" \"$_cli_result\" "
+                       "dnac_match dnac_level dnac_signature"] + collect
+        # Nested actions are indented one more space inside the if block
+        actions = ["cli command \"show plat soft trace filter-binary process " + ios_process + " level error\"",
+                   "regexp \"ERR\" \"$_cli_result\" result",
+                   "if $_regexp_result eq \"1\""] + [" " + action for action in collect] + [
+                   "else",
+                   " puts \"No logs to collected\"",
+                   "end"]
+    else:
+        if trigger == "syslog":
+            event = "event syslog pattern \"" + syslog_pattern + "\""
+        else:
+            # Process manager reports e.g. %PMAN-3-PROCHOLDDOWN or %PMAN-0-PROCFAILCRIT naming the process
+            event = "event syslog pattern \"%PMAN-[0-9]-PROC.*" + ios_process + "\""
+        # The event is the fault itself, nothing runs on the device until it happens.
+        # The signature is the facility-severity-mnemonic of the message.
+        actions = collect
+        if new_errors_only:
+            actions = ["set dnac_signature \"unknown\"",
+                       "regexp \"%([A-Z0-9_]+-[0-7]-[A-Z0-9_]+)\" \"$_syslog_msg\" dnac_match dnac_signature"] + actions
+
+    if spread:
+        # EEM timers have no start offset, a run waits its delay instead and may run that much longer
+        event += " maxrun " + str(spread + EEM_MAXRUN)
+        actions = ["wait ${" + DELAY_PARAM + "}"] + actions
+
+    script = "".join(line + """
+                """ for line in environment) + """event manager applet DNACGetLog
+                """ + event + """
                 action 001 cli command \"file prompt quiet\"
                 action 002 cli command \"enable\"
                 action 003 cli command \"config terminal\"
                 action 004 cli command \"ip ftp username """ + ftp_user + """\"
                 action 005 cli command \"ip ftp password """ + ftp_pass + """\"
                 action 006 cli command \"end\"
-                action 100 cli command \"show plat soft trace filter-binary process """ + ios_process + """ level error\"
-                action 110 regexp \"ERR\" \"$_cli_result\" result
-                action 120 if $_regexp_result eq \"1\"
-                action 125  cli command \"request platform soft trace rotate all\"
-                action 130  cli command \"archive tar /create bootflash:""" + ios_process + """_error_$_event_pub_sec.tar bootflash:tracelogs """ + ios_process + """*\"
-                action 140  cli command \"copy bootflash:""" + ios_process + """_error_$_event_pub_sec.tar ftp://""" + ftp_server_ip + """\"
-                action 150  puts \"Copied Collected logs to FTP Server\"
-                action 160 else
-                action 170  puts \"No logs to collected\"
-                action 180 end"""
-    print("----------------- EEM Script that will be Deployed ------------------")
-    print(script)
+                """ + """
+                """.join(label_actions(actions))
+    logger.info("----------------- EEM Script that will be Deployed ------------------")
+    logger.info("%s", script)
     return script
 
 
-def get_templateID(template_name= dnac_config.TEMPLATE_NAME):
-    try:
-        # The request and response of GET template-programmer/template API
-        resp = get(api="template-programmer/template")
-        status = resp.status_code
-        template = resp.text
+def agent_version():
+    '''
+    :return: Short hash of the guest shell agent files, part of the installed file name so a new agent is installed
+    '''
+    digest = hashlib.sha256()
+    for file_name in AGENT_FILES:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), file_name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:8]
 
-    except ValueError:
-        print("Something wrong, cannot get template information")
-        sys.exit()
 
-    if status != 200:
-        print(resp.text)
+def create_agent_script(ios_process=dnac_config.PROCESS_NAME,ftp_server_ip=dnac_config.FTP_SERVER,
+                        ftp_user=dnac_config.FTP_USERNAME, ftp_pass=dnac_config.FTP_PASSWORD,
+                        query_interval=dnac_config.QUERY_INTERVAL, parameterized=False, spread=0,
+                        decode_level=dnac_config.DECODE_LEVEL):
+    '''
+    Method to Create a Event Manager Script that runs the guest shell agent (dnac_guestshell_agent.py) every
+    query_interval seconds. The agent only scans the trace bytes appended since its previous pass and only
+    uploads those new segments. If the agent of this version is not installed yet, guest shell is enabled and
+    the agent files are copied from the AGENT_FTP_DIR directory of the FTP server (see dnac_ingest.py ftp).
+    Arguments as for create_eem_script.
+    :return: Return EEM Script
+    '''
+    if spread and not parameterized:
+        logger.error("A staggered EEM Script takes its delay from a template parameter, it must be parameterized")
         sys.exit()
-    else:
-        template_json = json.loads(template)
-        print(json.dumps(template_json, indent=4, sort_keys=True))
-        template_ID = get_filtered_templateID(template_json)
-        return(template_ID)
+    if parameterized:
+        ios_process, ftp_server_ip, ftp_user, ftp_pass, query_interval = \
+            ["${" + name + "}" for name, description in EEM_TEMPLATE_PARAMS]
+    # AGENT_HOME is bootflash:guest-share/ seen from guest shell
+    share = "bootflash:" + os.path.basename(AGENT_HOME) + "/"
+    agent_file = "dnac_guestshell_agent_" + agent_version() + ".py"
+    installed_names = [agent_file] + list(AGENT_FILES[1:])
+    install = "\n                ".join(
+        "action " + str(40 + 10 * index).zfill(3) + "  cli command \"copy ftp://" + ftp_server_ip + "/" + AGENT_FTP_DIR + "/" +
+        file_name + " " + share + installed_name + "\""
+        for index, (file_name, installed_name) in enumerate(zip(AGENT_FILES, installed_names)))
+    script = """event manager applet DNACAgent
+                event timer watchdog time """ + query_interval + """ maxrun """ + str(spread + EEM_MAXRUN) + """
+                action 001 cli command \"file prompt quiet\"
+                action 002 cli command \"enable\"
+                action 003 cli command \"config terminal\"
+                action 004 cli command \"ip ftp username """ + ftp_user + """\"
+                action 005 cli command \"ip ftp password """ + ftp_pass + """\"
+                action 006 cli command \"end\"
+                """ + ("action 007 wait ${" + DELAY_PARAM + """}
+                """ if spread else "") + """action 010 cli command \"dir """ + share + agent_file + """\"
+                action 020 regexp \"No such file|Error\" \"$_cli_result\" result
+                action 030 if $_regexp_result eq \"1\"
+                action 035  cli command \"guestshell enable\"
+                """ + install + """
+                action 090 end
+                action 100 cli command \"guestshell run python3 """ + AGENT_HOME + "/" + agent_file + """ --process """ + ios_process + """ --ftp-server """ + ftp_server_ip + """ --ftp-username """ + ftp_user + """ --ftp-password """ + ftp_pass + """ --decode-level """ + LEVELS[level_number(decode_level)] + """\"
+                action 110 puts \"$_cli_result\""""
+    logger.info("----------------- EEM Script that will be Deployed ------------------")
+    logger.info("%s", script)
+    return script
 
 
-def get_template_version(template_ID):
-    try:
-        # The request and response of GET template-programmer/template API
-        resp = get(api="template-programmer/template/version/"+template_ID)
-        status = resp.status_code
-        template = resp.text
+def get_templateID(template_name= dnac_config.TEMPLATE_NAME):
+    # Kept for compatibility, the lookup is served by the shared template catalog
+    return get_templateid(template_name)
 
-    except ValueError:
-        print("Something wrong, cannot get latest template version information")
-        sys.exit()
 
-    if status != 200:
-        print(resp.text)
-        sys.exit()
+def report_deployment(deploy_ID, status):
+    '''
+    Log the outcome of a finished deployment.
+    :param deploy_ID: Deployment ID
+    :param status: Last status JSON of the deployment
+    '''
+    if status["status"] == "SUCCESS":
+        logger.info(" --------------- Template deployed Successfully (%s) ------------------- ", deploy_ID)
     else:
-        template_json = json.loads(template)
-        print(json.dumps(template_json, indent=4, sort_keys=True))
-        latest_version = get_filtered_version(template_json)
-        print(latest_version)
-        return(latest_version)
+        logger.error(" --------------- Fail to deploy the template (%s: %s) --------------------", deploy_ID, status["status"])
 
 
-if __name__ == '__main__':
-    # device_uuid = get_network_device_id()
-    # print(device_uuid)
-    print("----------------- Deploying EEM Script to collect tracelogs from devices automatically ---------------- ")
-    print("----------------- Creating a new Template Project ----------------------")
-    project_task_id = create_template_project()
-    get_project_id = get_template_project_id()
-    print("----------------- Creating the EEM Script that need to be deployed ----------------------")
-    eemscript = create_eem_script()
+async def deploy_to_devices(version_id, network_uuids, chunk_size, params=None, device_params=None):
+    '''
+    Deploy a template to many devices with the chunked deploy requests sent concurrently,
+    then track all deployments at once.
+    :return: Returns list of (Device UUIDs, last status JSON), one per deploy request
+    '''
+    chunks = [network_uuids[start:start + chunk_size] for start in range(0, len(network_uuids), chunk_size)]
+    async with AsyncDnacClient() as client:
+        tracker = DeploymentTracker(client)
+        with metrics.step("deploy"):
+            deploy_IDs = await asyncio.gather(*[client.deploy_template(version_id, chunk, params, device_params)
+                                                for chunk in chunks])
+        with metrics.step("track"):
+            statuses = await asyncio.gather(*[tracker.watch(deploy_ID, report_deployment) for deploy_ID in deploy_IDs])
+        return list(zip(chunks, statuses))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Deploy an EEM Script that collects tracelogs to one or many devices")
+    parser.add_argument("--device-file", help="file with device IPs, one per line, to deploy to instead of dnac_config.DEVICE_IP")
+    parser.add_argument("--devices", help="comma separated device IPs to deploy to instead of dnac_config.DEVICE_IP")
+    parser.add_argument("--chunk-size", type=int, default=dnac_config.DEPLOY_CHUNK_SIZE,
+                        help="devices per deploy request in bulk mode (default %(default)s)")
+    parser.add_argument("--inventory", action="store_true",
+                        help="resolve device UUIDs from the local inventory snapshot (dnac_config.INVENTORY_DB)")
+    parser.add_argument("--force", action="store_true",
+                        help="deploy even to devices that already run the committed template content")
+    parser.add_argument("--trigger", choices=EEM_TRIGGERS, default=dnac_config.EEM_TRIGGER,
+                        help="when the EEM collects logs (default %(default)s)")
+    parser.add_argument("--stagger", action="store_true",
+                        help="spread the collections of the devices over dnac_config.COLLECT_SPREAD seconds "
+                             "with a per-device delay, implies --parameterized")
+    parser.add_argument("--agent", action="store_true",
+                        help="deploy the guest shell agent that only scans and uploads new trace segments, "
+                             "runs every QUERY_INTERVAL seconds")
+    parser.add_argument("--parameterized", action="store_true",
+                        help="commit one parameterized template and supply the dnac_config values at deploy time")
+    parser.add_argument("--device-params",
+                        help="JSON file of device IP to template parameter values overriding dnac_config, "
+                             "implies --parameterized")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only log warnings and errors, for batch runs")
+    parser.add_argument("-v", "--verbose", action="store_true", help="also log the full API response payloads")
+    parser.add_argument("--metrics", help="write API call and step metrics to this file at the end of the run, "
+                                          "JSON summary for a .json name, Prometheus text format otherwise")
+    parser.add_argument("--profile", help="write a cProfile capture of the run to this file")
+    parser.add_argument("--reconcile", action="store_true",
+                        help="keep running and deploy to new devices and devices that do not run the committed content, "
+                             "targets are --device-file/--devices or else every device of dnac_config.PRODUCT_FAMILY")
+    parser.add_argument("--interval", type=int, default=dnac_config.RECONCILE_INTERVAL,
+                        help="seconds between two reconciliation cycles (default %(default)s)")
+    parser.add_argument("--clusters", nargs="?", const=dnac_config.DNAC_CLUSTERS_FILE,
+                        help="run on every cluster of this JSON file of cluster profiles at the same time "
+                             "(default file %(const)s), each cluster deploys to the devices it manages")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    setup_logging(args.quiet, args.verbose)
+    profiler = cProfile.Profile() if args.profile else None
+    try:
+        command = reconcile if args.reconcile else run
+        if args.clusters:
+            command = functools.partial(run_clusters, command=command)
+        if profiler is None:
+            command(args)
+        else:
+            profiler.runcall(command, args)
+    finally:
+        # Also written when the run stopped early, that is when the numbers are most interesting
+        if profiler is not None:
+            profiler.dump_stats(args.profile)
+            logger.info("Profile written to %s, view it with: python3 -m pstats %s", args.profile, args.profile)
+        if args.metrics:
+            metrics.write(args.metrics)
+            logger.info("Metrics written to %s", args.metrics)
+
+
+def get_device_ips(args):
+    '''
+    :return: List of the device IPs given with --device-file and --devices, the file is read again on every call
+    '''
+    device_ips = []
+    if args.device_file:
+        device_ips += load_device_list(args.device_file)
+    if args.devices:
+        device_ips += [device_ip.strip() for device_ip in args.devices.split(",") if device_ip.strip()]
+    return device_ips
+
+
+def build_eem_template(args):
+    '''
+    :return: (EEM Script, template parameter definitions, parameter values), the last two are None unless parameterized
+    '''
+    logger.info("----------------- Creating the EEM Script that need to be deployed ----------------------")
+    parameterized = args.parameterized or bool(args.device_params) or args.stagger
+    spread = dnac_config.COLLECT_SPREAD if args.stagger else 0
+    # The agent is started by a timer, its template has the parameters of the timer trigger
+    trigger = "timer" if args.agent else args.trigger
+    if args.agent:
+        eemscript = create_agent_script(parameterized=parameterized, spread=spread)
+    else:
+        eemscript = create_eem_script(parameterized=parameterized, trigger=trigger, spread=spread)
     eemscript = re.sub('\n\s+', '\n', eemscript)
+    template_params = create_eem_template_params(trigger, args.stagger) if parameterized else None
+    params = create_eem_param_values(trigger=trigger) if parameterized else None
+    return eemscript, template_params, params
 
-    print("----------------- Creating a new Template ---------------------")
-    task_id = create_template(get_project_id, eemscript)
 
-    parent_template_id = get_parent_template_id(get_project_id)
+def load_device_params(file_name, device_uuids):
+    '''
+    :param file_name: JSON file of device IP to template parameter values
+    :param device_uuids: dict of device IP to Device UUID
+    :return: dict of Device UUID to template parameter values
+    '''
+    with open(file_name) as f:
+        return dict((device_uuids[device_ip], values) for device_ip, values in json.load(f).items()
+                    if device_ip in device_uuids)
 
-    commit_template(parent_template_id)
 
-    template_id = get_templateid(parent_template_id)
+def get_device_params(args, device_uuids):
+    '''
+    :param device_uuids: dict of device IP to Device UUID
+    :return: dict of Device UUID to the template parameter values of --device-params and --stagger, None without both
+    '''
+    device_params = load_device_params(args.device_params, device_uuids) if args.device_params else None
+    if args.stagger:
+        device_params = stagger_params(device_uuids.values(), dnac_config.COLLECT_SPREAD, device_params)
+    return device_params
+
 
-    print("------------------ Fetching Latest version of a template --------------------")
-    version_id = get_template_version(template_id)
+def deploy_pending(version_id, content_hash, network_uuids, deploy_state, chunk_size, params=None, device_params=None):
+    '''
+    Deploy the template version to devices and record the successful deployments in the deploy state file.
+    :return: Returns number of failed deploy requests
+    '''
+    logger.info(" --------------- Deploying Template to %d devices ------------------- ", len(network_uuids))
+    results = asyncio.run(deploy_to_devices(version_id, network_uuids, chunk_size, params, device_params))
+    for chunk, status in results:
+        if status["status"] == "SUCCESS":
+            record_deployment(deploy_state, chunk, version_id, content_hash, params, device_params)
+    save_deploy_state(deploy_state)
+    failed = [status for chunk, status in results if status["status"] != "SUCCESS"]
+    if failed:
+        logger.error(" --------------- %d of %d deployments failed --------------------", len(failed), len(results))
+    return len(failed)
+
+
+def resolve_device_uuids(args):
+    '''
+    :return: dict of device IP to Device UUID of the devices to deploy to, DEVICE_IP if no devices were given
+    '''
+    device_ips = get_device_ips(args)
+    if args.clusters:
+        return resolve_cluster_device_uuids(args, device_ips or [dnac_config.DEVICE_IP])
+    if not device_ips:
+        logger.info("------------------ Fetching Device UUID --------------------")
+        return {dnac_config.DEVICE_IP: get_network_device_id()}
+    logger.info("------------------ Fetching Device UUIDs for %d devices --------------------", len(device_ips))
+    if args.inventory:
+        inventory = DeviceInventory()
+        device_uuids = inventory.get_uuids_by_ip(device_ips)
+        inventory.close()
+        return device_uuids
+    return get_network_device_ids(device_ips)
+
+
+def resolve_cluster_device_uuids(args, device_ips):
+    '''
+    Resolve the devices managed by the cluster in use, devices of other clusters are left out without a warning.
+    :return: dict of device IP to Device UUID
+    '''
+    candidates = cluster_candidates(current_cluster(), device_ips)
+    if not candidates:
+        device_uuids = {}
+    elif args.inventory:
+        inventory = DeviceInventory()
+        device_uuids = inventory.get_uuids_by_ip(candidates, fetch_missing=False)
+        inventory.close()
+    else:
+        device_uuids = get_network_device_ids(candidates, warn_missing=False)
+    logger.info("------------------ %d of %d devices are managed by this cluster --------------------",
+                len(device_uuids), len(device_ips))
+    return device_uuids
 
-    print("------------------ Fetching Device UUID --------------------")
-    network_uuid = get_network_device_id()
 
-    print(" --------------- Deploying Template ------------------- ")
-    deploy_ID = deploy_template(version_id, network_uuid)
-    status = check_status(deploy_ID)
-    max_tries = 10
-    while max_tries:
-        if status["status"] != "SUCCESS":
-            time.sleep(30)
-            status = check_status(deploy_ID)
-            max_tries -= 1
+def run(args):
+    '''
+    One-shot deployment, run as a dependency graph of steps: the device UUID lookup runs next to the template
+    steps, the template list is fetched next to the project lookup, and every step that follows a DNAC task
+    waits for the task to finish.
+    :return: dict of device IP to Device UUID of the devices deployed to
+    '''
+    logger.info("----------------- Deploying EEM Script to collect tracelogs from devices automatically ---------------- ")
+
+    def template(script, project, catalog_loaded):
+        eemscript, template_params, params = script
+        return ensure_template(project, eemscript, template_params)
+
+    def commit(script, template, version):
+        eemscript, template_params, params = script
+        # Project, template and commit are only touched when the script content changed
+        content_hash = template_hash(eemscript, template_params)
+        return ensure_committed(template, content_hash, version), content_hash
+
+    def rollout(script, commit, devices):
+        eemscript, template_params, params = script
+        version_id, content_hash = commit
+        if not devices:
+            return
+        device_params = get_device_params(args, devices)
+        deploy_state = load_deploy_state()
+        network_uuids = list(devices.values())
+        if not args.force:
+            network_uuids = devices_to_deploy(network_uuids, content_hash, deploy_state, params, device_params)
+        if not network_uuids:
+            logger.info(" --------------- All devices already run the committed template, nothing to deploy ------------------- ")
+            return
+        deploy_pending(version_id, content_hash, network_uuids, deploy_state, args.chunk_size, params, device_params)
+
+    workflow = Workflow()
+    workflow.add("script", lambda: build_eem_template(args))
+    workflow.add("devices", lambda: resolve_device_uuids(args))
+    workflow.add("project", ensure_project)
+    workflow.add("catalog_loaded", lambda: catalog.template_id(dnac_config.TEMPLATE_NAME))
+    workflow.add("template", template, requires=("script", "project", "catalog_loaded"))
+    workflow.add("version", lambda template: get_latest_version_info(template), requires=("template",))
+    workflow.add("commit", commit, requires=("script", "template", "version"))
+    workflow.add("rollout", rollout, requires=("script", "commit", "devices"))
+    return workflow.run()["devices"]
+
+
+def reconcile_once(args, inventory, eemscript, template_params=None, params=None):
+    '''
+    One reconciliation cycle: make sure the template is committed, refresh the inventory snapshot and
+    deploy to the target devices that are new or do not run the committed content and parameter values.
+    Targets are the devices of --device-file and --devices, or else every device of PRODUCT_FAMILY.
+    :return: Returns number of devices deployed to
+    '''
+    # Template changes made on DNAC since the last cycle are picked up
+    catalog.invalidate()
+    version_id, content_hash = ensure_template_version(eemscript, template_params)
+
+    with metrics.step("devices"):
+        inventory.sync()
+        device_ips = get_device_ips(args)
+        if device_ips:
+            device_ips = cluster_candidates(current_cluster(), device_ips)
+            # Devices not in the synced snapshot are not in DNAC yet, they are not looked up one by one every cycle
+            device_uuids = inventory.get_uuids_by_ip(device_ips, sync=False, fetch_missing=False)
         else:
-            print(" --------------- Template deployed Successfully ------------------- ")
-            break
-    if not max_tries:
-        print(" --------------- Fail to deploy the template --------------------")
-
+            device_uuids = inventory.get_uuids_by_family(dnac_config.PRODUCT_FAMILY)
+    device_params = get_device_params(args, device_uuids)
+
+    deploy_state = load_deploy_state()
+    # Devices removed from the inventory are dropped from the record, a device that comes back is deployed again
+    removed = set(deploy_state) - inventory.get_uuids()
+    for uuid in removed:
+        del deploy_state[uuid]
+    pending = devices_to_deploy(list(device_uuids.values()), content_hash, deploy_state, params, device_params)
+    logger.info("Reconciling: %d target devices, %d new or drifted, %d removed from the inventory",
+                len(device_uuids), len(pending), len(removed))
+    if pending:
+        deploy_pending(version_id, content_hash, pending, deploy_state, args.chunk_size, params, device_params)
+    elif removed:
+        save_deploy_state(deploy_state)
+    return len(pending)
+
+
+def reconcile(args, stop=None):
+    '''
+    Long running mode: run a reconciliation cycle every args.interval seconds until interrupted.
+    :param stop: threading.Event that ends the loop after the running cycle, for runs on other threads
+    '''
+    stop = stop or threading.Event()
+    eemscript, template_params, params = build_eem_template(args)
+    # The count check of the snapshot runs every cycle, the device listing is only walked when it changed
+    inventory = DeviceInventory(ttl=min(dnac_config.INVENTORY_TTL, args.interval))
+    try:
+        while not stop.is_set():
+            started = time.monotonic()
+            try:
+                reconcile_once(args, inventory, eemscript, template_params, params)
+            except DnacApiError as e:
+                logger.error("Reconciliation cycle failed: %s", e)
+            stop.wait(max(0, args.interval - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        inventory.close()
+
+
+def run_clusters(args, command):
+    '''
+    Run command(args) on every cluster of args.clusters at the same time, each cluster with its own
+    template catalog, deploy state and inventory snapshot, and report the devices no cluster manages.
+    :param command: run or reconcile
+    '''
+    profiles = load_cluster_profiles(args.clusters)
+    logger.info("----------------- Running on %d clusters: %s ---------------- ", len(profiles),
+                ", ".join(profile.name for profile in profiles))
+    stop = threading.Event()
+    try:
+        outcomes = run_on_clusters(profiles, functools.partial(reconcile, stop=stop) if command is reconcile else command,
+                                   args)
+    except KeyboardInterrupt:
+        logger.info("Stopping the clusters after their running cycle")
+        stop.set()
+        return
+    failed = sorted(name for name, (result, error) in outcomes.items() if error is not None)
+    if failed:
+        logger.error(" --------------- %d of %d clusters failed: %s --------------------", len(failed), len(profiles),
+                     ", ".join(failed))
+    elif command is run:
+        found = set()
+        for result, error in outcomes.values():
+            found.update(result)
+        for device_ip in dict.fromkeys(get_device_ips(args) or [dnac_config.DEVICE_IP]):
+            if device_ip not in found:
+                logger.warning("No network device found with IP %s on any cluster !", device_ip)
 
 
+if __name__ == '__main__':
+    try:
+        main()
+    except DnacApiError as e:
+        logger.error("%s", e)
+        sys.exit()
@@ -20,21 +20,75 @@ or implied.
 """
 This script provides a function to get DNAC authentication token
 and functions to make DNAC REST APIs request
+Requests go through a DnacClient that reuses one connection pool and one cached token per cluster
+Responses are decoded once by parse_response and diagnostics go through the logging module
+Large list endpoints can be streamed item by item and page by page with iter_list and paginate
+Calls are paced per endpoint class by a RequestScheduler that honors HTTP 429 and Retry-After,
+retries idempotent calls and stops calling an unhealthy cluster, failures raise DnacApiError
+Latency, status, bytes and retries of every call are recorded in dnac_metrics.metrics
+Calls go to the cluster in use, dnac_config by default or a ClusterProfile set with use_cluster,
+so one process can drive several clusters at the same time
 All required modules are imported in this script so from other scripts just need to import this script
 """
 import requests   # We use Python external "requests" module to do HTTP query
 import json
+import os
+import re
 import sys
+import time
+import base64
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
 from requests.auth import HTTPBasicAuth
+from requests.adapters import HTTPAdapter
 
 # All DNAC configuration is in dnac_config.py
 import dnac_config  # DNAC IP is assigned in dnac_config.py
+# Every call is recorded in the shared metrics, see dnac_metrics.py
+from dnac_metrics import metrics
 
 # It's used to get rid of certificate warning messages when using Python 3.
 # For more information please refer to: https://urllib3.readthedocs.org/en/latest/security.html
 requests.packages.urllib3.disable_warnings() # Disable warning message
 
-def get_X_auth_token(ip=dnac_config.DNAC_IP, ver=dnac_config.VERSION, uname=dnac_config.USERNAME, pword=dnac_config.PASSWORD):
+logger = logging.getLogger(__name__)
+
+# DNAC tokens are valid for 60 minutes, a cached token is renewed a bit before it expires
+TOKEN_LIFETIME = 3600
+TOKEN_REFRESH_MARGIN = 300
+# Seconds before the first poll of a DNAC task, most tasks finish within a second
+TASK_POLL_INITIAL = 0.25
+
+def api_url(ip, path, port=None, scheme=None):
+    """
+    Build the URL of a DNAC API path.
+    The scheme and port default to dnac_config.DNAC_SCHEME and DNAC_PORT,
+    the port is left out when it is the default one of the scheme.
+
+    Parameters
+    ----------
+    ip (str): dnac routable DNS address or ip
+    path (str): path below /api/, e.g. "v1/network-device"
+    port (int): optional port of the cluster
+    scheme (str): optional "https" or "http"
+
+    Return:
+    -------
+    str: full URL
+    """
+    scheme = scheme or dnac_config.DNAC_SCHEME
+    port = port or dnac_config.DNAC_PORT
+    host = ip
+    if int(port) != {"https": 443, "http": 80}.get(scheme):
+        host += ":" + str(port)
+    return scheme + "://" + host + "/api/" + path
+
+def get_X_auth_token(ip=dnac_config.DNAC_IP, ver=dnac_config.VERSION, uname=dnac_config.USERNAME, pword=dnac_config.PASSWORD, session=None,
+                     port=None, scheme=None):
     """
     This function returns a new JWT token.
     Passing ip, version,username and password when use as standalone function
@@ -46,6 +100,9 @@ def get_X_auth_token(ip=dnac_config.DNAC_IP, ver=dnac_config.VERSION, uname=dnac
     ver (str): dnac version
     uname (str): user name to authenticate with
     pword (str): password to authenticate with
+    session (object): optional requests.Session to send the request on
+    port (int): optional port of the cluster, see api_url
+    scheme (str): optional "https" or "http", see api_url
 
     Return:
     ----------
@@ -53,25 +110,595 @@ def get_X_auth_token(ip=dnac_config.DNAC_IP, ver=dnac_config.VERSION, uname=dnac
     """
 
     # The url for the post ticket API request
-    post_url = "https://"+ip+"/api/system/"+ ver +"/auth/token"
+    post_url = api_url(ip, "system/"+ ver +"/auth/token", port, scheme)
     # All DNAC REST API query and response content type is JSON
     headers = {'content-type': 'application/json'}
     # POST request and response
     try:
-        r = requests.post(post_url, auth=HTTPBasicAuth(username=uname, password=pword), headers=headers,verify=False)
+        r = (session or requests).post(post_url, auth=HTTPBasicAuth(username=uname, password=pword), headers=headers,verify=False)
         # Remove '#' if need to print out response
         #print (r.text)
         r.raise_for_status()
         # return service ticket
         return r.json()["Token"]
-    except requests.exceptions.ConnectionError as e:
+    except requests.exceptions.RequestException as e:
         # Something wrong, cannot get service ticket
-        print ("Error: %s" % e)
-        sys.exit ()
+        raise DnacApiError("Cannot get a token from " + ip + ": " + str(e))
 
-def get(ip=dnac_config.DNAC_IP, ver=dnac_config.VERSION, uname=dnac_config.USERNAME, pword=dnac_config.PASSWORD, api='', params=''):
+class DnacApiError(Exception):
     """
-    To simplify requests.get with default configuration.Return is the same as requests.get
+    A DNAC API call failed for good: the cluster could not be reached,
+    retries were exhausted, the circuit breaker is open or the response
+    did not have the expected status.
+    Scripts log it and exit, libraries can catch it and carry on.
+    """
+
+class CircuitOpenError(DnacApiError):
+    """
+    The call was not sent because the cluster failed too many calls in a row.
+    """
+
+def setup_logging(quiet=False, verbose=False):
+    """
+    Send diagnostics of all helpers to stdout.
+    The default level shows progress, quiet only shows warnings and errors
+    for batch runs, verbose adds the full response payloads.
+
+    Parameters
+    ----------
+    quiet (bool): only log warnings and errors
+    verbose (bool): also log response payloads
+    """
+    level = logging.WARNING if quiet else logging.DEBUG if verbose else logging.INFO
+    logging.basicConfig(format="%(message)s", level=level, stream=sys.stdout)
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(ClusterLogFilter())
+
+class ClusterLogFilter(logging.Filter):
+    """
+    Prefix messages logged while a named cluster profile is in use with the cluster name,
+    so the interleaved output of clusters driven at the same time can be told apart.
+    """
+
+    def filter(self, record):
+        cluster = _current_cluster.get()
+        if cluster is not None and not getattr(record, "cluster", None):
+            record.cluster = cluster.name
+            record.msg = "[" + cluster.name + "] " + str(record.msg)
+        return True
+
+class PrettyJson(object):
+    """
+    Wraps a decoded JSON body so it is only pretty-printed when the log
+    record is actually emitted.
+    """
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        return json.dumps(self.data, indent=4, sort_keys=True)
+
+class ApiResult(object):
+    """
+    A DNAC response with its JSON body decoded exactly once.
+    The body text is only kept when it is not JSON.
+    """
+    __slots__ = ("url", "status_code", "data", "text")
+
+    def __init__(self, resp):
+        self.url = resp.url
+        self.status_code = resp.status_code
+        try:
+            self.data = resp.json()
+            self.text = None
+        except ValueError:
+            self.data = None
+            self.text = resp.text
+
+    @property
+    def response(self):
+        """
+        The "response" member of the usual DNAC envelope.
+        """
+        return self.data.get("response") if isinstance(self.data, dict) else None
+
+    def __str__(self):
+        return self.text if self.data is None else str(PrettyJson(self.data))
+
+def parse_response(resp, expected_status=200, error_message="Something wrong with the API request"):
+    """
+    Decode a response once and check its status code.
+    Raises DnacApiError with error_message and the body if the status is not the expected one.
+
+    Parameters
+    ----------
+    resp (object): an instance of the Response object(of requests module)
+    expected_status (int): status code of a successful response
+    error_message (str): message logged on failure
+
+    Return:
+    -------
+    object: ApiResult
+    """
+    result = ApiResult(resp)
+    if result.status_code != expected_status:
+        raise DnacApiError(error_message + ": " + str(result))
+    logger.debug("%s", result)
+    return result
+
+def get_token_expiry(token):
+    """
+    Read the expiry time out of a DNAC JWT token.
+    Falls back to TOKEN_LIFETIME from now when the token can not be decoded.
+
+    Parameters
+    ----------
+    token (str): DNAC authentication token
+
+    Return:
+    -------
+    float: epoch time at which the token expires
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return time.time() + TOKEN_LIFETIME
+
+# Requests that can be sent again without changing the outcome, retried on transport errors and 5xx
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE")
+# Responses of an overloaded or restarting cluster
+RETRY_STATUSES = (502, 503, 504)
+
+def endpoint_class(method, api):
+    """
+    Classify a call for rate limiting.
+    DNAC throttles writes far harder than reads, and status polling should
+    not eat into the budget of the inventory and template reads.
+
+    Return:
+    -------
+    str: "write", "status" or "read", the keys of dnac_config.API_RATE_LIMITS
+    """
+    if method not in ("GET", "HEAD"):
+        return "write"
+    if api.startswith("task") or api.startswith("template-programmer/template/deploy/status"):
+        return "status"
+    return "read"
+
+def get_retry_after(resp):
+    """
+    Read the Retry-After header, given in seconds or as an HTTP date.
+
+    Return:
+    -------
+    float: seconds to wait, None when the header is missing or invalid
+    """
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+class TokenBucket(object):
+    """
+    Paces the calls of one endpoint class.
+    A 429 halves the rate and remembers 95% of the rate that was too much
+    as the ceiling. Successful calls then bring the rate back close to that
+    ceiling, so the sustained rate settles just under the controller limit
+    instead of repeatedly overshooting it. The ceiling itself slowly grows
+    back to the configured rate in case the limit was only temporary.
+    """
+
+    def __init__(self, rate):
+        """
+        Parameters
+        ----------
+        rate (float): requests per second
+        """
+        self.max_rate = float(rate)
+        self.rate = self.max_rate
+        self.ceiling = self.max_rate
+        self.min_rate = self.max_rate / 100
+        self.tokens = max(1.0, self.rate)
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        # No tokens are earned while the bucket is paused by a Retry-After
+        start = max(self._last, self._paused_until)
+        if now > start:
+            # At most one second worth of calls is sent in a burst
+            self.tokens = min(max(1.0, self.rate), self.tokens + (now - start) * self.rate)
+        self._last = max(self._last, now)
+
+    def acquire(self):
+        """
+        Take one token, sleeping until it is available.
+        Tokens are reserved in arrival order so waiting threads are spread out.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            wait = max(0.0, self._paused_until - now) + max(0.0, -self.tokens) / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+    def throttle(self, pause):
+        """
+        The controller answered 429: slow down and send nothing for pause seconds.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Calls that were already in flight get their 429 during the pause, they slow down only once
+            if now >= self._paused_until:
+                self.ceiling = max(self.min_rate, min(self.ceiling, self.rate * 0.95))
+                self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+            self._paused_until = max(self._paused_until, now + pause)
+
+    def success(self):
+        """
+        A call went through: move the rate a tenth of the way to the ceiling.
+        """
+        with self._lock:
+            self.ceiling = min(self.max_rate, self.ceiling + self.max_rate / 5000)
+            self.rate = min(self.ceiling, self.rate + (self.ceiling - self.rate) / 10)
+
+class CircuitBreaker(object):
+    """
+    Stops sending calls to a cluster that failed failure_threshold calls in a
+    row (transport errors, 5xx and failed token requests). After cooldown
+    seconds a single trial call is let through, its outcome closes the
+    circuit or opens it again.
+    """
+
+    def __init__(self, failure_threshold, cooldown):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Raise CircuitOpenError if no call may be sent now.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if self._trial or time.monotonic() < self._opened_at + self.cooldown:
+                raise CircuitOpenError("DNAC cluster is unhealthy, calls are suspended after {} failures in a row"
+                                       .format(self.failures))
+            self._trial = True
+
+    def success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.warning("DNAC cluster is responding again, resuming calls")
+            self.failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or (self._opened_at is None and self.failures >= self.failure_threshold):
+                logger.error("DNAC cluster failed %d calls in a row, suspending calls for %ss", self.failures, self.cooldown)
+                self._opened_at = time.monotonic()
+            self._trial = False
+
+class RequestScheduler(object):
+    """
+    Sends the calls of one cluster: paced by a TokenBucket per endpoint class,
+    waiting out 429 responses as long as Retry-After asks, retrying idempotent
+    calls on transport errors and 502/503/504 with capped full jitter backoff,
+    and refusing calls while the CircuitBreaker is open.
+    """
+
+    def __init__(self, rate_limits=None, retries=dnac_config.API_RETRIES, backoff_max=dnac_config.API_BACKOFF_MAX,
+                 failure_threshold=dnac_config.CIRCUIT_FAILURES, cooldown=dnac_config.CIRCUIT_COOLDOWN):
+        """
+        Parameters
+        ----------
+        rate_limits (dict): endpoint class to requests per second, default dnac_config.API_RATE_LIMITS
+        retries (int): retries of one call
+        backoff_max (float): maximum seconds between two attempts of a call
+        failure_threshold (int): failed calls in a row that open the circuit
+        cooldown (float): seconds the circuit stays open
+        """
+        self.buckets = dict((name, TokenBucket(rate))
+                            for name, rate in (rate_limits or dnac_config.API_RATE_LIMITS).items())
+        self.retries = retries
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+
+    def backoff(self, attempt):
+        # Full jitter keeps the threads that failed together from retrying together
+        return random.uniform(0, min(self.backoff_max, 2 ** attempt))
+
+    def send(self, method, api, send, outcome=None):
+        """
+        Send a call with pacing, retries and circuit breaking.
+
+        Parameters
+        ----------
+        method (str): HTTP method
+        api (str): dnac api without prefix, used to pick the rate limit
+        send (function): sends the request once and returns the response
+        outcome (dict): optional, "retries" is set to the number of attempts after the first one
+
+        Return:
+        -------
+        object: the last Response, which can still be a 429 or 5xx once retries are exhausted
+        """
+        bucket = self.buckets[endpoint_class(method, api)]
+        idempotent = method in IDEMPOTENT_METHODS
+        outcome = {} if outcome is None else outcome
+        attempt = 0
+        while True:
+            outcome["retries"] = attempt
+            self.breaker.before_call()
+            bucket.acquire()
+            try:
+                resp = send()
+            except requests.exceptions.RequestException as e:
+                self.breaker.failure()
+                if not idempotent or attempt >= self.retries:
+                    raise DnacApiError("{} /{} failed: {}".format(method, api, e))
+                delay = self.backoff(attempt)
+                logger.warning("%s /%s failed (%s), retrying in %.1fs", method, api, e, delay)
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                # E.g. DnacApiError when no token could be had. It counts as a failure of the cluster,
+                # and a failed trial call must not leave the circuit waiting for its outcome for good.
+                self.breaker.failure()
+                raise
+            if resp.status_code == 429:
+                # A throttled call was not processed, so even a POST can be sent again
+                self.breaker.success()
+                pause = get_retry_after(resp)
+                bucket.throttle(self.backoff(attempt) if pause is None else min(pause, self.backoff_max))
+                if attempt >= self.retries:
+                    return resp
+                logger.warning("%s /%s throttled by DNAC, slowing down to %.2f calls/s", method, api, bucket.rate)
+            elif resp.status_code in RETRY_STATUSES:
+                self.breaker.failure()
+                if not idempotent or attempt >= self.retries:
+                    return resp
+                pause = get_retry_after(resp)
+                delay = self.backoff(attempt) if pause is None else min(pause, self.backoff_max)
+                logger.warning("%s /%s Status: %s, retrying in %.1fs", method, api, resp.status_code, delay)
+                # A streamed response holds its connection of the blocking pool until closed
+                resp.close()
+                time.sleep(delay)
+                attempt += 1
+                continue
+            else:
+                self.breaker.success()
+                bucket.success()
+                return resp
+            resp.close()
+            attempt += 1
+
+class ClusterProfile(object):
+    """
+    Connection settings of one DNAC cluster.
+    subnets optionally lists the device networks managed by the cluster, e.g. ["10.1.0.0/16"],
+    devices outside of them are not looked up on this cluster.
+    """
+    __slots__ = ("name", "ip", "version", "username", "password", "port", "scheme", "subnets")
+
+    def __init__(self, name, ip, username, password, version="v1", port=None, scheme=None, subnets=None):
+        self.name = name
+        self.ip = ip
+        self.version = version
+        self.username = username
+        self.password = password
+        self.port = port
+        self.scheme = scheme
+        self.subnets = subnets or []
+
+    def __repr__(self):
+        return "ClusterProfile(" + self.name + ", " + self.ip + ")"
+
+# The cluster profile in use in the current thread or task, None for the dnac_config cluster
+_current_cluster = contextvars.ContextVar("dnac_cluster", default=None)
+
+def default_cluster():
+    """
+    Return the ClusterProfile of the cluster configured in dnac_config.py.
+    """
+    return ClusterProfile("default", dnac_config.DNAC_IP, dnac_config.USERNAME, dnac_config.PASSWORD,
+                          dnac_config.VERSION, dnac_config.DNAC_PORT, dnac_config.DNAC_SCHEME)
+
+def current_cluster():
+    """
+    Return the ClusterProfile in use, see use_cluster, or the dnac_config cluster.
+    """
+    return _current_cluster.get() or default_cluster()
+
+@contextmanager
+def use_cluster(profile):
+    """
+    Send the calls made inside "with use_cluster(profile):" to the cluster of the profile.
+    It holds for the current thread or asyncio task, threads started inside it only
+    inherit the profile when they run in a copy of the context (contextvars.copy_context),
+    as AsyncDnacClient and Workflow do.
+
+    Parameters
+    ----------
+    profile (object): ClusterProfile
+    """
+    token = _current_cluster.set(profile)
+    try:
+        yield profile
+    finally:
+        _current_cluster.reset(token)
+
+def cluster_file(file_name):
+    """
+    Return the file name of a local state file (deploy state, inventory database) for the cluster in use.
+    With a named cluster profile in use the cluster name is added before the extension,
+    e.g. dnac_deploy_state.json becomes dnac_deploy_state.emea.json, so clusters do not share state.
+
+    Parameters
+    ----------
+    file_name (str): file name for the dnac_config cluster
+
+    Return:
+    -------
+    str: file name
+    """
+    cluster = _current_cluster.get()
+    if cluster is None:
+        return file_name
+    root, ext = os.path.splitext(file_name)
+    return root + "." + re.sub(r"[^\w.-]", "_", cluster.name) + ext
+
+class DnacClient(object):
+    """
+    Client for one DNAC cluster.
+    It keeps a keep-alive requests.Session (connection pool) and caches the
+    authentication token until it is about to expire, so API calls do not
+    pay for a new TLS handshake and a token request every time.
+    Calls are sent through the RequestScheduler of the cluster.
+    """
+
+    def __init__(self, ip=dnac_config.DNAC_IP, ver=dnac_config.VERSION, uname=dnac_config.USERNAME,
+                 pword=dnac_config.PASSWORD, pool_size=dnac_config.MAX_CONNECTIONS_PER_HOST, port=None, scheme=None):
+        """
+        Parameters
+        ----------
+        ip (str): dnac routable DNS address or ip
+        ver (str): dnac version
+        uname (str): user name to authenticate with
+        pword (str): password to authenticate with
+        pool_size (int): most connections open to the cluster at once, callers beyond it wait
+                         for a free one, default dnac_config.MAX_CONNECTIONS_PER_HOST
+        port (int): optional port of the cluster, see api_url
+        scheme (str): optional "https" or "http", see api_url
+        """
+        self.ip = ip
+        self.ver = ver
+        self.uname = uname
+        self.pword = pword
+        self.port = port
+        self.scheme = scheme
+        self.session = requests.Session()
+        self.session.verify = False
+        # Sized once, the session is shared by every caller of the cluster, sync and async; a blocking
+        # pool caps the open connections however many worker threads send requests
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._token = None
+        self._token_expiry = 0
+        self._token_lock = threading.Lock()
+        self.scheduler = RequestScheduler()
+
+    def get_token(self, refresh=False):
+        """
+        Return the cached token, requesting a new one if there is none,
+        it is close to expiry or refresh is True.
+        """
+        with self._token_lock:
+            if refresh or self._token is None or time.time() > self._token_expiry - TOKEN_REFRESH_MARGIN:
+                self._token = get_X_auth_token(self.ip, self.ver, self.uname, self.pword, session=self.session,
+                                               port=self.port, scheme=self.scheme)
+                self._token_expiry = get_token_expiry(self._token)
+            return self._token
+
+    def invalidate_token(self, token):
+        """
+        Drop the cached token if it is still the one that was rejected.
+        """
+        with self._token_lock:
+            if self._token == token:
+                self._token = None
+
+    def url(self, api):
+        """
+        Return the URL of a dnac api without prefix on this cluster.
+        """
+        return api_url(self.ip, self.ver+"/"+api, self.port, self.scheme)
+
+    def request(self, method, api, params=None, data=None, stream=False):
+        """
+        Send a request to https://<ip>/api/<ver>/<api>, see api_url.
+        A 401 response means the cached token was revoked or expired early,
+        the token is then renewed and the request sent once more.
+        With stream=True the body is left unread so it can be decoded incrementally.
+        Raises DnacApiError when the call can not be completed.
+
+        Return:
+        -------
+        object: an instance of the Response object(of requests module)
+        """
+        url = self.url(api)
+        headers = {}
+        if data is not None:
+            headers["content-type"] = "application/json"
+            data = json.dumps(data)
+
+        def send():
+            headers["X-Auth-Token"] = self.get_token()
+            resp = self.session.request(method, url, headers=headers, params=params, data=data, stream=stream)
+            if resp.status_code == 401:
+                resp.close()
+                self.invalidate_token(headers["X-Auth-Token"])
+                headers["X-Auth-Token"] = self.get_token()
+                resp = self.session.request(method, url, headers=headers, params=params, data=data, stream=stream)
+            return resp
+
+        start = time.perf_counter()
+        outcome = {}
+        try:
+            resp = self.scheduler.send(method, api, send, outcome)
+        except DnacApiError:
+            metrics.observe_call(method, api, "error", time.perf_counter() - start, len(data or ""), 0,
+                                 outcome.get("retries", 0))
+            raise
+        # The size of a streamed body without Content-Length is added by iter_list once it was read
+        received = resp.headers.get("Content-Length")
+        if received is None and not stream:
+            received = len(resp.content)
+        metrics.observe_call(method, api, resp.status_code, time.perf_counter() - start, len(data or ""),
+                             int(received or 0), outcome.get("retries", 0))
+        return resp
+
+    def get(self, api='', params='', stream=False):
+        return self.request("GET", api, params=params, stream=stream)
+
+    def post(self, api='', data=''):
+        return self.request("POST", api, data=data)
+
+    def put(self, api='', data=''):
+        return self.request("PUT", api, data=data)
+
+# One client per cluster and credentials, shared by get(), post() and put()
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(ip=None, ver=None, uname=None, pword=None):
+    """
+    Return the shared DnacClient for the given cluster, creating it on first use.
+    Arguments left out are taken from the cluster in use, see use_cluster.
 
     Parameters
     ----------
@@ -79,33 +706,81 @@ def get(ip=dnac_config.DNAC_IP, ver=dnac_config.VERSION, uname=dnac_config.USERN
     ver (str): dnac version
     uname (str): user name to authenticate with
     pword (str): password to authenticate with
+
+    Return:
+    -------
+    object: DnacClient
+    """
+    cluster = current_cluster()
+    key = (ip or cluster.ip, ver or cluster.version, uname or cluster.username, pword or cluster.password,
+           cluster.port, cluster.scheme)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = DnacClient(key[0], key[1], key[2], key[3], port=cluster.port, scheme=cluster.scheme)
+        return _clients[key]
+
+def get(ip=None, ver=None, uname=None, pword=None, api='', params='', stream=False):
+    """
+    To simplify requests.get with default configuration.Return is the same as requests.get
+
+    Parameters
+    ----------
+    ip (str): dnac routable DNS address or ip, default the cluster in use (see use_cluster)
+    ver (str): dnac version
+    uname (str): user name to authenticate with
+    pword (str): password to authenticate with
     api (str): dnac api without prefix
     params (str): optional parameter for GET request
+    stream (bool): leave the body unread so it can be decoded incrementally
 
     Return:
     -------
     object: an instance of the Response object(of requests module)
+
+    Raises DnacApiError when the cluster can not be reached or the circuit breaker is open.
     """
-    ticket = get_X_auth_token(ip,ver,uname,pword)
-    headers = {"X-Auth-Token": ticket}
-    url = "https://"+ip+"/api/"+ver+"/"+api
-    print ("\nExecuting GET '%s'\n"%url)
-    try:
-    # The request and response of "GET" request
-        resp= requests.get(url,headers=headers,params=params,verify = False)
-        print ("GET '%s' Status: "%api,resp.status_code,'\n') # This is the http request status
-        return(resp)
-    except:
-       print ("Something wrong with GET /",api)
-       sys.exit()
+    client = get_client(ip,ver,uname,pword)
+    url = client.url(api)
+    logger.info("Executing GET '%s'", url)
+    # The request and response of "GET" request, throttling and retries are handled by the client
+    resp= client.get(api,params=params,stream=stream)
+    logger.info("GET '%s' Status: %s", api, resp.status_code) # This is the http request status
+    return(resp)
 
-def post(ip=dnac_config.DNAC_IP, ver=dnac_config.VERSION, uname=dnac_config.USERNAME, pword=dnac_config.PASSWORD, api='', data=''):
+def post(ip=None, ver=None, uname=None, pword=None, api='', data=''):
     """
     To simplify requests.post with default configuration. Return is the same as requests.post
 
     Parameters
     ----------
-    ip (str): dnac routable DNS address or ip
+    ip (str): dnac routable DNS address or ip, default the cluster in use (see use_cluster)
+    ver (str): dnac version
+    uname (str): user name to authenticate with
+    pword (str): password to authenticate with
+    api (str): dnac api without prefix
+    data (JSON): JSON object
+
+    Return:
+    -------
+    object: an instance of the Response object(of requests module)
+
+    Raises DnacApiError when the cluster can not be reached or the circuit breaker is open.
+    """
+    client = get_client(ip,ver,uname,pword)
+    url = client.url(api)
+    logger.info("Executing POST '%s'", url)
+    # The request and response of "POST" request, throttling and retries are handled by the client
+    resp= client.post(api,data=data)
+    logger.info("POST '%s' Status: %s", api, resp.status_code) # This is the http request status
+    return(resp)
+
+def put(ip=None, ver=None, uname=None, pword=None, api='', data=''):
+    """
+    To simplify requests.put with default configuration. Return is the same as requests.put
+
+    Parameters
+    ----------
+    ip (str): dnac routable DNS address or ip, default the cluster in use (see use_cluster)
     ver (str): dnac version
     uname (str): user name to authenticate with
     pword (str): password to authenticate with
@@ -115,17 +790,185 @@ def post(ip=dnac_config.DNAC_IP, ver=dnac_config.VERSION, uname=dnac_config.USER
     Return:
     -------
     object: an instance of the Response object(of requests module)
+
+    Raises DnacApiError when the cluster can not be reached or the circuit breaker is open.
     """
-    ticket = get_X_auth_token(ip,ver,uname,pword)
-    headers = {"content-type" : "application/json","X-Auth-Token": ticket}
-    url = "https://"+ip+"/api/"+ver+"/"+api
-    print ("\nExecuting POST '%s'\n"%url)
+    client = get_client(ip,ver,uname,pword)
+    url = client.url(api)
+    logger.info("Executing PUT '%s'", url)
+    # The request and response of "PUT" request, throttling and retries are handled by the client
+    resp= client.put(api,data=data)
+    logger.info("PUT '%s' Status: %s", api, resp.status_code) # This is the http request status
+    return(resp)
+
+def wait_for_task(task_id, timeout=dnac_config.TASK_TIMEOUT, max_interval=dnac_config.STATUS_POLL_MAX):
+    """
+    Wait until an asynchronous DNAC task, e.g. creating or committing a template, has finished,
+    so the next step reads its result instead of racing it.
+    Polls GET task/{taskId}, starting after TASK_POLL_INITIAL seconds and doubling the interval.
+
+    Parameters
+    ----------
+    task_id (str): Task ID returned by the call that started the task
+    timeout (float): seconds after which the task is given up
+    max_interval (float): maximum seconds between two polls
+
+    Return:
+    -------
+    dict: the task, raises DnacApiError if it failed or did not finish in time
+    """
+    deadline = time.monotonic() + timeout
+    interval = TASK_POLL_INITIAL
+    while True:
+        time.sleep(min(interval, max(0, deadline - time.monotonic())))
+        task = parse_response(get(api="task/" + task_id), 200, "Something wrong, cannot get task status").response
+        if task.get("isError"):
+            raise DnacApiError("Task " + task_id + " failed: " + str(task.get("failureReason") or task.get("progress")))
+        if task.get("endTime"):
+            return task
+        if time.monotonic() >= deadline:
+            raise DnacApiError("Task " + task_id + " did not finish in " + str(timeout) + "s")
+        interval = min(interval * 2, max_interval)
+
+def iter_json_array(resp, chunk_size=65536):
+    """
+    Decode a JSON list response item by item while it is downloaded.
+    The list may be the whole body or the "response" member of the usual
+    DNAC envelope. Only the item being decoded is held in memory.
+
+    Parameters
+    ----------
+    resp (object): a streamed Response object(of requests module)
+    chunk_size (int): bytes read from the connection at a time
+
+    Return:
+    -------
+    generator: decoded list items
+    """
+    decoder = json.JSONDecoder()
+    if resp.encoding is None:
+        resp.encoding = "utf-8"
+    chunks = resp.iter_content(chunk_size=chunk_size, decode_unicode=True)
+    buf = ""
+    pos = 0
+
+    def more():
+        for chunk in chunks:
+            if chunk:
+                return chunk
+        return None
+
+    # Find the opening bracket of the list
+    while True:
+        start = buf.find("[")
+        if start >= 0 and buf.lstrip()[:1] == "[":
+            pos = start + 1
+            break
+        if buf.lstrip()[:1] == "{":
+            key = buf.find('"response"')
+            if key >= 0:
+                start = buf.find("[", key)
+                if start >= 0:
+                    pos = start + 1
+                    break
+        chunk = more()
+        if chunk is None:
+            return
+        buf += chunk
+
+    while True:
+        # Skip separators between items
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf):
+                break
+            chunk = more()
+            if chunk is None:
+                raise ValueError("Unterminated JSON list in response of " + resp.url)
+            buf, pos = buf[pos:] + chunk, 0
+        if buf[pos] == "]":
+            return
+        # An item is complete once it decodes and is followed by "," or "]",
+        # otherwise it may be cut off at the chunk boundary (e.g. a number)
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+            follow = end
+            while follow < len(buf) and buf[follow] in " \t\r\n":
+                follow += 1
+            complete = follow < len(buf) and buf[follow] in ",]"
+        except ValueError:
+            complete = False
+        if not complete:
+            # The item cannot end before the next "," or "]", so an item spanning many chunks
+            # is only decoded again once one of them arrives
+            buf, pos = buf[pos:], 0
+            while True:
+                chunk = more()
+                if chunk is None:
+                    raise ValueError("Invalid JSON list in response of " + resp.url)
+                buf += chunk
+                if "," in chunk or "]" in chunk:
+                    break
+            continue
+        yield item
+        buf, pos = buf[end:], 0
+
+def iter_list(api, params=None, error_message="Something wrong, cannot get list"):
+    """
+    Stream the items of a list endpoint without holding the whole list.
+    The caller can stop iterating at any time, the connection is then released.
+
+    Parameters
+    ----------
+    api (str): dnac api without prefix
+    params (dict): optional parameter for GET request
+    error_message (str): message logged when the request fails
+
+    Return:
+    -------
+    generator: decoded list items
+    """
+    resp = get(api=api, params=params or '', stream=True)
     try:
-    # The request and response of "POST" request
-        resp= requests.post(url,json.dumps(data),headers=headers,verify = False)
-        print ("POST '%s' Status: "%api,resp.status_code,'\n') # This is the http request status
-        return(resp)
-    except:
-       print ("Something wrong with POST /",api)
-       sys.exit()
+        if resp.status_code != 200:
+            parse_response(resp, 200, error_message)
+        for item in iter_json_array(resp):
+            yield item
+    finally:
+        if "Content-Length" not in resp.headers:
+            metrics.add_bytes_received("GET", api, getattr(resp.raw, "tell", lambda: 0)())
+        resp.close()
 
+def paginate(api, page_size, params=None, offset_param="offset", limit_param="limit", first_offset=1,
+             error_message="Something wrong, cannot get list"):
+    """
+    Stream the items of a list endpoint that supports offset/limit paging,
+    one page request at a time. Iteration stops after the first short page.
+
+    Parameters
+    ----------
+    api (str): dnac api without prefix
+    page_size (int): items requested per page
+    params (dict): optional parameter for GET request
+    offset_param (str): name of the offset query parameter
+    limit_param (str): name of the page size query parameter
+    first_offset (int): offset of the first item, DNAC counts from 1
+    error_message (str): message logged when a request fails
+
+    Return:
+    -------
+    generator: decoded list items
+    """
+    offset = first_offset
+    while True:
+        page_params = dict(params or {})
+        page_params[offset_param] = offset
+        page_params[limit_param] = page_size
+        count = 0
+        for item in iter_list(api, page_params, error_message):
+            count += 1
+            yield item
+        if count < page_size:
+            return
+        offset += page_size
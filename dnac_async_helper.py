@@ -0,0 +1,107 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+"""
+This file contains an asyncio client with the template programmer operations of dnac_template_helper.py
+ -create a template project, create a template, commit, version lookup
+ -deploy the template and check the deployment status
+Operations run on a bounded worker pool over the shared DnacClient connection pool, so many of them
+can be in flight at once while every request still uses the same token cache and session.
+Operations run in a copy of the caller's context, so they go to the cluster in use (see use_cluster).
+"""
+
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from dnac_template_helper import *
+import dnac_config
+
+
+class AsyncDnacClient(object):
+    '''
+    Asyncio client for DNAC template programmer operations.
+    Use it as "async with AsyncDnacClient() as client:" and await its methods,
+    or schedule many of them with asyncio.gather().
+    '''
+
+    def __init__(self, max_concurrency=dnac_config.MAX_CONCURRENCY):
+        '''
+        :param max_concurrency: Number of API operations in flight at once. Configured via dnac_config.MAX_CONCURRENCY.
+        Operations beyond the connections of the shared DnacClient wait for a free one, see dnac_config.MAX_CONNECTIONS_PER_HOST.
+        '''
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    async def run(self, func, *args, **kwargs):
+        '''
+        Run a blocking helper on the worker pool and wait for its result.
+        '''
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, functools.partial(context.run, func, *args, **kwargs))
+
+    async def create_template_project(self, project_name="DNAC-Templates"):
+        return await self.run(create_template_project, project_name)
+
+    async def get_template_project_id(self, project_name="DNAC-Templates"):
+        return await self.run(get_template_project_id, project_name)
+
+    async def create_template(self, project_id, script, template_name=dnac_config.TEMPLATE_NAME,
+                              product_family=dnac_config.PRODUCT_FAMILY):
+        return await self.run(create_template, project_id, script, template_name, product_family)
+
+    async def get_parent_template_id(self, project_id, template_name=dnac_config.TEMPLATE_NAME):
+        return await self.run(get_parent_template_id, project_id, template_name)
+
+    async def commit_template(self, template_id):
+        return await self.run(commit_template, template_id)
+
+    async def get_templateid(self, template_name=dnac_config.TEMPLATE_NAME):
+        return await self.run(get_templateid, template_name)
+
+    async def get_template_version(self, template_ID):
+        return await self.run(get_template_version, template_ID)
+
+    async def deploy_template(self, version_id, network_uuid, params=None, device_params=None):
+        return await self.run(deploy_template, version_id, network_uuid, params, device_params)
+
+    async def check_status(self, deploy_ID):
+        return await self.run(check_status, deploy_ID)
+
+    async def deploy_template_bulk(self, version_id, network_uuids, chunk_size=dnac_config.DEPLOY_CHUNK_SIZE,
+                                   params=None, device_params=None):
+        '''
+        Deploy a template to many devices with all chunked deploy requests in flight at once.
+        :param version_id: Version ID of the Template.
+        :param network_uuids: List of Device Network UUIDs.
+        :param chunk_size: Number of devices per deploy request. Configured via dnac_config.DEPLOY_CHUNK_SIZE.
+        :param params: Template parameter values used for every device.
+        :param device_params: Dict of Device Network UUID to parameter values overriding params for that device.
+        :return: Returns list of Deployment IDs, one per request.
+        '''
+        chunks = [network_uuids[start:start + chunk_size] for start in range(0, len(network_uuids), chunk_size)]
+        return list(await asyncio.gather(*[self.deploy_template(version_id, chunk, params, device_params)
+                                           for chunk in chunks]))
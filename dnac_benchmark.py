@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+"""
+This script benchmarks the deviceLogCollector.py workflow against the local mock DNAC server.
+For every device count it starts a fresh MockDnac, runs the full workflow (template pipeline,
+UUID lookup, chunked deployment and status tracking) in a fresh Python process pointed at the mock,
+and reports the wall time of the workflow, the API calls per deployed device and the peak memory
+of the workflow process. The devices of a run are spread over the whole mock inventory.
+API_RATE_LIMITS is lifted unless --throttled is given, so the numbers measure this code and not the pacing.
+
+Usage:
+  python3 dnac_benchmark.py                       1, 100 and 10000 devices
+  python3 dnac_benchmark.py --sizes 500 --latency 0.02 --failure-rate 0.01 --json results.json
+"""
+
+from dnac_api_helper import setup_logging
+from dnac_mock_server import MockDnac, device_ip, start_mock_server
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# Runs deviceLogCollector.py in the child process with dnac_config overridden and writes the wall time and
+# peak memory as JSON, with the error and a non-zero exit status when the workflow failed. The helpers are only imported after the overrides, they bind dnac_config values as
+# argument defaults, which is why this does not import anything from the benchmark module.
+# argv: overrides JSON, result file, deviceLogCollector.py arguments
+WORKFLOW_RUNNER = """
+import json, resource, sys, time
+import dnac_config
+for name, value in json.loads(sys.argv[1]).items():
+    setattr(dnac_config, name, value)
+import deviceLogCollector
+from dnac_api_helper import DnacApiError
+result_file = sys.argv[2]
+sys.argv = ["deviceLogCollector.py"] + sys.argv[3:]
+start = time.perf_counter()
+error = None
+try:
+    deviceLogCollector.main()
+except DnacApiError as e:
+    error = str(e)
+except SystemExit:
+    # The helpers call sys.exit() where they give up, the reason is in the log
+    error = "deviceLogCollector.py gave up"
+wall_time = time.perf_counter() - start
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+result = {"wall_time": wall_time, "peak_memory": peak if sys.platform == "darwin" else peak * 1024}
+if error is not None:
+    result["error"] = error
+with open(result_file, "w") as f:
+    json.dump(result, f)
+sys.exit(1 if error is not None else 0)
+"""
+
+
+def benchmark(size, inventory_size, mock_options, throttled=False, collector_args=()):
+    '''
+    Benchmark one workflow run against a fresh mock DNAC.
+    :param size: Number of devices to deploy to
+    :param inventory_size: Number of devices in the mock inventory, at least size
+    :param mock_options: dict of MockDnac keyword arguments
+    :param throttled: Keep the configured API_RATE_LIMITS
+    :param collector_args: Extra command line arguments of deviceLogCollector.py
+    :return: dict of results. When the workflow failed it has the "error" and no wall time or peak memory,
+             the numbers of a run that stopped early are not comparable.
+    '''
+    mock = MockDnac(devices=max(size, inventory_size), **mock_options)
+    server = start_mock_server(mock)
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            step = max(1, len(mock.devices) // size)
+            device_file = os.path.join(work_dir, "devices.txt")
+            with open(device_file, "w") as f:
+                for index in range(0, step * size, step):
+                    f.write(device_ip(index) + "\n")
+            overrides = {"DNAC_SCHEME": "http", "DNAC_IP": server.server_address[0], "DNAC_PORT": server.server_address[1],
+                         "DEPLOY_STATE_FILE": os.path.join(work_dir, "deploy_state.json"),
+                         "INVENTORY_DB": os.path.join(work_dir, "inventory.db")}
+            if not throttled:
+                overrides["API_RATE_LIMITS"] = {"read": 1e6, "write": 1e6, "status": 1e6}
+            result_file = os.path.join(work_dir, "result.json")
+            command = [sys.executable, "-c", WORKFLOW_RUNNER, json.dumps(overrides), result_file,
+                       "--device-file", device_file, "-q"] + list(collector_args)
+            python_path = [REPO_DIR] + ([os.environ["PYTHONPATH"]] if os.environ.get("PYTHONPATH") else [])
+            env = dict(os.environ, PYTHONPATH=os.pathsep.join(python_path))
+            process = subprocess.run(command, cwd=work_dir, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                     universal_newlines=True)
+            result = {}
+            if os.path.exists(result_file):
+                with open(result_file) as f:
+                    result = json.load(f)
+            if process.returncode != 0:
+                logger.error("Workflow with %d devices failed:\n%s", size, process.stdout)
+                result = {"error": result.get("error", "workflow exit status {}".format(process.returncode))}
+    finally:
+        server.shutdown()
+        server.server_close()
+    api_calls = sum(mock.calls.values())
+    result.update({"devices": size, "deployed_devices": mock.deployed_devices, "api_calls": api_calls,
+                   "calls_per_device": float(api_calls) / size, "calls": dict(mock.calls)})
+    return result
+
+
+def print_report(results):
+    # deployed counts the devices of accepted deploy requests, less than devices when the workflow gave up
+    print("{:>8} {:>9} {:>10} {:>10} {:>12} {:>10}".format("devices", "deployed", "wall s", "API calls", "calls/device",
+                                                            "peak MB"))
+    for result in results:
+        if "error" in result:
+            print("{:>8} {:>9}  failed: {}".format(result["devices"], result["deployed_devices"], result["error"]))
+            continue
+        print("{:>8} {:>9} {:>10.2f} {:>10} {:>12.2f} {:>10.1f}".format(
+            result["devices"], result["deployed_devices"], result["wall_time"], result["api_calls"],
+            result["calls_per_device"], result["peak_memory"] / 1048576.0))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the deviceLogCollector.py workflow against a mock DNAC")
+    parser.add_argument("--sizes", default="1,100,10000", help="comma separated device counts (default %(default)s)")
+    parser.add_argument("--inventory-size", type=int, default=0,
+                        help="devices in the mock inventory, default the device count of the run")
+    parser.add_argument("--catalog-size", type=int, default=100,
+                        help="unrelated templates in the mock catalog (default %(default)s)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds every mock call takes")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of calls answered with HTTP 503")
+    parser.add_argument("--rate-limit", type=int, help="calls per second the mock accepts before HTTP 429")
+    parser.add_argument("--deploy-time", type=float, default=0.0, help="seconds a mock deployment takes")
+    parser.add_argument("--throttled", action="store_true", help="keep the configured API_RATE_LIMITS")
+    parser.add_argument("--inventory", action="store_true", help="run the workflow with --inventory")
+    parser.add_argument("--json", help="also write the results with the calls per endpoint to this file")
+    args = parser.parse_args()
+
+    setup_logging()
+    mock_options = {"catalog_size": args.catalog_size, "latency": args.latency, "failure_rate": args.failure_rate,
+                    "rate_limit": args.rate_limit, "deploy_time": args.deploy_time, "seed": 1}
+    results = []
+    for size in [int(size) for size in args.sizes.split(",")]:
+        logger.info("Benchmarking %d devices", size)
+        result = benchmark(size, args.inventory_size, mock_options, args.throttled,
+                           ["--inventory"] if args.inventory else [])
+        results.append(result)
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if any("error" in result for result in results):
+        sys.exit(1)
@@ -0,0 +1,155 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+"""
+This file contains an in-process cache of the Template Programmer catalog.
+The project list, the template list and the version list of each template are downloaded once
+and indexed by name and ID, so repeated lookups do not download and scan the lists again.
+The project and template lists are streamed, only the names and IDs are kept.
+Entries are invalidated when this tool creates, updates or commits something.
+Every cluster has its own catalog, catalog is the one of the cluster in use (see use_cluster).
+"""
+
+from dnac_api_helper import *
+import threading
+
+CATALOG_ERROR = "Something wrong, cannot get template catalog"
+
+
+class TemplateCatalog(object):
+    '''
+    Cached, indexed view of template projects, templates and template versions.
+    '''
+
+    def __init__(self):
+        # One lock per index so e.g. the project and template lists can be fetched at the same time
+        self._projects_lock = threading.Lock()
+        self._templates_lock = threading.Lock()
+        self._versions_lock = threading.Lock()
+        self._projects = None    # project name -> project ID
+        self._templates = None   # template name -> template ID, first template with that name
+        self._project_templates = None   # (project ID, template name) -> template ID
+        self._versions = {}      # template ID -> versionsInfo entries sorted by version number
+
+    def _get_list(self, api):
+        resp = get(api=api)
+        return parse_response(resp, 200, CATALOG_ERROR).data
+
+    def _load_projects(self):
+        with self._projects_lock:
+            if self._projects is None:
+                self._projects = {}
+                for project in iter_list("template-programmer/project", error_message=CATALOG_ERROR):
+                    self._projects.setdefault(project["name"], project["id"])
+            return self._projects
+
+    def _load_templates_locked(self):
+        # Caller holds _templates_lock
+        if self._templates is None:
+            templates = {}
+            project_templates = {}
+            for template in iter_list("template-programmer/template", error_message=CATALOG_ERROR):
+                templates.setdefault(template["name"], template["templateId"])
+                project_templates[(template.get("projectId"), template["name"])] = template["templateId"]
+            self._templates = templates
+            self._project_templates = project_templates
+        return self._templates
+
+    def project_id(self, project_name):
+        '''
+        :param project_name: Template Programmer Project Name
+        :return: Project ID, or None if there is no such project
+        '''
+        return self._load_projects().get(project_name)
+
+    def template_id(self, template_name, project_id=None):
+        '''
+        :param template_name: Template Name
+        :param project_id: Optional Project ID the template must belong to
+        :return: Template ID, or None if there is no such template
+        '''
+        with self._templates_lock:
+            templates = self._load_templates_locked()
+            if project_id is None:
+                return templates.get(template_name)
+            return self._project_templates.get((project_id, template_name))
+
+    def versions(self, template_id):
+        '''
+        :param template_id: Template ID
+        :return: List of committed versions (versionsInfo entries), oldest first
+        '''
+        with self._versions_lock:
+            if template_id not in self._versions:
+                versions = [version for template in self._get_list("template-programmer/template/version/" + template_id)
+                            for version in template.get("versionsInfo") or []]
+                self._versions[template_id] = sorted(versions, key=lambda version: int(version["version"]))
+            return self._versions[template_id]
+
+    def latest_version(self, template_id):
+        '''
+        :param template_id: Template ID
+        :return: versionsInfo entry of the latest committed version, or None if never committed
+        '''
+        versions = self.versions(template_id)
+        return versions[-1] if versions else None
+
+    def invalidate_projects(self):
+        with self._projects_lock:
+            self._projects = None
+
+    def invalidate_templates(self):
+        with self._templates_lock:
+            self._templates = None
+            self._project_templates = None
+
+    def invalidate_versions(self, template_id):
+        with self._versions_lock:
+            self._versions.pop(template_id, None)
+
+    def invalidate(self):
+        self.invalidate_projects()
+        self.invalidate_templates()
+        with self._versions_lock:
+            self._versions = {}
+
+
+class ClusterCatalog(object):
+    '''
+    Forwards to the TemplateCatalog of the cluster in use, created on first use.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._catalogs = {}   # (ip, port, version) -> TemplateCatalog
+
+    def get(self):
+        '''
+        :return: TemplateCatalog of the cluster in use
+        '''
+        cluster = current_cluster()
+        key = (cluster.ip, cluster.port, cluster.version)
+        with self._lock:
+            if key not in self._catalogs:
+                self._catalogs[key] = TemplateCatalog()
+            return self._catalogs[key]
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+# Catalog shared by all template helpers of this process
+catalog = ClusterCatalog()
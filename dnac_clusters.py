@@ -0,0 +1,120 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+"""
+This file contains the registry of DNAC cluster profiles used to drive several clusters from one run.
+The profiles are read from a JSON file (dnac_config.DNAC_CLUSTERS_FILE), a list of objects like
+  {"name": "emea", "ip": "10.0.0.1", "username": "admin", "password": "secret",
+   "version": "v1", "port": 443, "subnets": ["10.1.0.0/16"]}
+where version, port, scheme and subnets are optional.
+A device is owned by the cluster whose inventory has it. With subnets a cluster only looks up the
+devices in those networks, without them it looks up every device of the run.
+run_on_clusters runs a function once per cluster, all clusters at the same time, each with its profile
+in use (see use_cluster), so the helpers, the template catalog and the local state files of a thread
+belong to its cluster.
+"""
+
+from dnac_api_helper import *
+import dnac_config
+import contextvars
+import ipaddress
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def load_cluster_profiles(file_name=dnac_config.DNAC_CLUSTERS_FILE):
+    '''
+    Read the cluster profiles.
+    :param file_name: Path of the JSON file. Configured via dnac_config.DNAC_CLUSTERS_FILE.
+    :return: List of ClusterProfile, in the order of the file
+    '''
+    try:
+        with open(file_name) as f:
+            entries = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error("Cannot read the cluster profiles from %s: %s", file_name, e)
+        sys.exit()
+    profiles = []
+    for entry in entries:
+        missing = [key for key in ("name", "ip", "username", "password") if not entry.get(key)]
+        if missing:
+            logger.error("Cluster profile %s in %s has no %s", entry.get("name", len(profiles) + 1), file_name,
+                         ", ".join(missing))
+            sys.exit()
+        profiles.append(ClusterProfile(entry["name"], entry["ip"], entry["username"], entry["password"],
+                                       entry.get("version", dnac_config.VERSION), entry.get("port"),
+                                       entry.get("scheme"), entry.get("subnets")))
+    names = [profile.name for profile in profiles]
+    if not profiles or len(set(names)) != len(names):
+        logger.error("%s must list at least one cluster profile and the names must be unique", file_name)
+        sys.exit()
+    return profiles
+
+
+def cluster_candidates(profile, device_ips):
+    '''
+    :param profile: ClusterProfile
+    :param device_ips: List of device IP addresses of the run
+    :return: The device IPs that can be managed by the cluster: those in its subnets, or all without subnets
+    '''
+    if not profile.subnets:
+        return list(device_ips)
+    networks = [ipaddress.ip_network(subnet, strict=False) for subnet in profile.subnets]
+    candidates = []
+    for device_ip in device_ips:
+        try:
+            address = ipaddress.ip_address(device_ip)
+        except ValueError:
+            # A host name, only the cluster inventory can tell
+            candidates.append(device_ip)
+            continue
+        if any(address in network for network in networks):
+            candidates.append(device_ip)
+    return candidates
+
+
+def _run_on_cluster(profile, func, args, kwargs):
+    with use_cluster(profile):
+        return func(*args, **kwargs)
+
+
+def run_on_clusters(profiles, func, *args, **kwargs):
+    '''
+    Run func(*args, **kwargs) once per cluster, all clusters at the same time, each with its profile in use.
+    A cluster that fails, e.g. because it can not be reached, does not stop the other clusters.
+    :param profiles: List of ClusterProfile
+    :param func: Function to run
+    :return: dict of cluster name to (result, None), or (None, exception) if func failed on that cluster
+    '''
+    outcomes = {}
+    executor = ThreadPoolExecutor(max_workers=len(profiles))
+    try:
+        futures = dict((executor.submit(contextvars.copy_context().run, _run_on_cluster, profile, func, args, kwargs),
+                        profile) for profile in profiles)
+        for future, profile in futures.items():
+            try:
+                outcomes[profile.name] = (future.result(), None)
+            except (Exception, SystemExit) as e:
+                # The helpers call sys.exit() on some errors, that only ends this cluster's run
+                logger.error("[%s] Run failed: %s", profile.name, e if str(e) else type(e).__name__)
+                outcomes[profile.name] = (None, e)
+    finally:
+        # On KeyboardInterrupt the caller is not held up here, it has to tell the runs to stop
+        executor.shutdown(wait=False)
+    return outcomes
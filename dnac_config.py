@@ -21,6 +21,7 @@ or implied.
 Sample Configuration
 DNAC_IP = "1.1.1.1"
 DNAC_PORT = 443
+DNAC_SCHEME = "https"
 USERNAME = "username"
 PASSWORD = "password"
 VERSION = "v1"
@@ -32,9 +33,41 @@ FTP_SERVER = "3.3.3.3"
 FTP_USERNAME = "ftp-username"
 FTP_PASSWORD = "ftp-password"
 QUERY_INTERVAL = "1800"
+DEVICE_PAGE_SIZE = 500
+DEPLOY_CHUNK_SIZE = 100
+MAX_CONCURRENCY = 100
+MAX_CONNECTIONS_PER_HOST = 20
+STATUS_POLL_INITIAL = 1
+STATUS_POLL_MAX = 30
+DEPLOY_TIMEOUT = 300
+DEPLOY_STATE_FILE = "dnac_deploy_state.json"
+INVENTORY_DB = "dnac_inventory.db"
+INVENTORY_TTL = 3600
+INVENTORY_MAX_AGE = 36000
+EEM_TRIGGER = "timer"
+SYSLOG_PATTERN = "%[A-Z0-9_]+-[0-3]-"
+INGEST_DIR = "incoming"
+ARCHIVE_STORE = "archive"
+INGEST_WORKERS = 4
+INGEST_MAX_ATTEMPTS = 3
+INGEST_FTP_PORT = 21
+API_RATE_LIMITS = {"read": 10, "write": 2, "status": 5}
+API_RETRIES = 5
+API_BACKOFF_MAX = 60
+CIRCUIT_FAILURES = 5
+CIRCUIT_COOLDOWN = 30
+RECONCILE_INTERVAL = 900
+TASK_TIMEOUT = 120
+DNAC_CLUSTERS_FILE = "dnac_clusters.json"
+COLLECT_COOLDOWN = 3600
+COLLECT_NEW_ERRORS_ONLY = True
+COLLECT_SPREAD = 1800
+LOG_INDEX_DB = "dnac_log_index.db"
+DECODE_LEVEL = "INFO"
 """
 DNAC_IP = "Your DNA Center Cluster IP Address"
 DNAC_PORT = 443
+DNAC_SCHEME = "https"  # "http" is only meant for the local mock DNAC server (dnac_mock_server.py)
 USERNAME = "Your DNA Center Username"
 PASSWORD = "Your DNA Center Password"
 VERSION = "v1"
@@ -46,3 +79,34 @@ FTP_SERVER = "Your FTP Server IP Address"
 FTP_USERNAME = "Your FTP Server Username"
 FTP_PASSWORD = "Your FTP Server Password"
 QUERY_INTERVAL = "Time Interval in seconds for EEM run; min 300  to max 604800"
+DEVICE_PAGE_SIZE = 500  # Devices fetched per network-device listing call in bulk mode
+DEPLOY_CHUNK_SIZE = 100  # Devices targeted by one template deploy request in bulk mode
+MAX_CONCURRENCY = 100  # API operations in flight at once in the asyncio client
+MAX_CONNECTIONS_PER_HOST = 20  # Most connections open to one DNAC cluster at once, shared by all API calls
+STATUS_POLL_INITIAL = 1  # Seconds before the first deployment status poll, doubled on every further poll
+STATUS_POLL_MAX = 30  # Maximum seconds between two deployment status polls
+DEPLOY_TIMEOUT = 300  # Seconds after which a deployment that is not finished is reported as failed
+DEPLOY_STATE_FILE = "dnac_deploy_state.json"  # Local record of the template content last deployed to each device
+INVENTORY_DB = "dnac_inventory.db"  # Local SQLite snapshot of the device inventory
+INVENTORY_TTL = 3600  # Seconds before the local inventory snapshot is synced with DNAC again
+INVENTORY_MAX_AGE = 10 * INVENTORY_TTL  # Seconds before the device listing is walked even if the device count did not change, so a device replaced without changing the count can resolve to its old UUID this long
+EEM_TRIGGER = "timer"  # When the EEM runs - timer: every QUERY_INTERVAL, syslog: on a SYSLOG_PATTERN message, crash: when PROCESS_NAME fails
+SYSLOG_PATTERN = "%[A-Z0-9_]+-[0-3]-"  # Syslog messages that start a collection with EEM_TRIGGER "syslog", default severity 0 to 3
+INGEST_DIR = "incoming"  # Directory where device tarballs are uploaded to the ingest service
+ARCHIVE_STORE = "archive"  # Directory of the compressed store of collected logs
+INGEST_WORKERS = 4  # Tarballs processed in parallel by the ingest service
+INGEST_MAX_ATTEMPTS = 3  # Failed ingest attempts before a tarball is moved to the rejected sub directory of INGEST_DIR
+INGEST_FTP_PORT = 21  # Port of the FTP server of the ingest service
+API_RATE_LIMITS = {"read": 10, "write": 2, "status": 5}  # Calls per second sent to DNAC per endpoint class, lowered automatically on HTTP 429
+API_RETRIES = 5  # Retries of a throttled call, or of an idempotent call that failed
+API_BACKOFF_MAX = 60  # Maximum seconds waited between two attempts of an API call
+CIRCUIT_FAILURES = 5  # Failed API calls in a row after which calls to the cluster are suspended
+CIRCUIT_COOLDOWN = 30  # Seconds calls stay suspended before a trial call is sent
+RECONCILE_INTERVAL = 900  # Seconds between two reconciliation cycles of deviceLogCollector.py --reconcile
+TASK_TIMEOUT = 120  # Seconds to wait for a DNAC task, e.g. a template commit, before giving up
+DNAC_CLUSTERS_FILE = "dnac_clusters.json"  # JSON list of cluster profiles driven at once by deviceLogCollector.py --clusters
+COLLECT_COOLDOWN = 3600  # Seconds after a collection in which the EEM does not collect again, 0 to collect on every hit
+COLLECT_NEW_ERRORS_ONLY = True  # The EEM only collects when the error differs from the one it last collected
+COLLECT_SPREAD = 1800  # Seconds over which deviceLogCollector.py --stagger spreads the collections of the fleet, at most QUERY_INTERVAL
+LOG_INDEX_DB = "dnac_log_index.db"  # SQLite full-text index of the collected logs written by dnac_log_index.py
+DECODE_LEVEL = "INFO"  # Least severe level of the binary trace records the device decodes into the text member of each collection
@@ -0,0 +1,132 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+"""
+This file contains a tracker that watches many template deployments at once.
+Each deployment is polled first after a short interval, then with exponential backoff and jitter,
+and is dropped as soon as it reaches a terminal state, so a run finishes when DNAC does.
+"""
+
+import asyncio
+import functools
+import logging
+import random
+import time
+
+from dnac_api_helper import DnacApiError
+from dnac_async_helper import AsyncDnacClient
+import dnac_config
+
+logger = logging.getLogger(__name__)
+
+# Deployment states after which the status does not change any more
+TERMINAL_STATES = ("SUCCESS", "FAILURE", "FAILED", "ERROR")
+
+
+class DeploymentTracker(object):
+    '''
+    Watch deployments and resolve one future per Deployment ID with its last status JSON.
+    A deployment that does not reach a terminal state before the timeout resolves with status TIMEOUT.
+    '''
+
+    def __init__(self, client, initial_interval=dnac_config.STATUS_POLL_INITIAL,
+                 max_interval=dnac_config.STATUS_POLL_MAX, timeout=dnac_config.DEPLOY_TIMEOUT):
+        '''
+        :param client: AsyncDnacClient used for the status calls.
+        :param initial_interval: Seconds before the first poll. Configured via dnac_config.STATUS_POLL_INITIAL.
+        :param max_interval: Upper bound of the backoff in seconds. Configured via dnac_config.STATUS_POLL_MAX.
+        :param timeout: Seconds after which a deployment is given up. Configured via dnac_config.DEPLOY_TIMEOUT.
+        '''
+        self.client = client
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self._watched = {}
+
+    def watch(self, deploy_ID, callback=None):
+        '''
+        Start tracking a deployment. Must be called from a running event loop.
+        :param deploy_ID: Deployment ID
+        :param callback: Optional function called with (deploy_ID, status JSON) when the deployment finishes.
+        :return: asyncio.Future resolving to the last status JSON.
+        '''
+        if deploy_ID not in self._watched:
+            self._watched[deploy_ID] = asyncio.ensure_future(self._poll(deploy_ID))
+        future = self._watched[deploy_ID]
+        if callback is not None:
+            future.add_done_callback(functools.partial(self._finished, deploy_ID, callback))
+        return future
+
+    def _finished(self, deploy_ID, callback, done):
+        # Runs in the event loop, an exception raised here would only be logged by asyncio without the Deployment ID
+        if done.cancelled():
+            logger.warning("Tracking of deployment %s was cancelled", deploy_ID)
+            return
+        if done.exception() is not None:
+            logger.error("Cannot track deployment %s: %s", deploy_ID, done.exception())
+            return
+        callback(deploy_ID, done.result())
+
+    async def wait_all(self):
+        '''
+        Wait for every watched deployment.
+        :return: dict of Deployment ID to last status JSON.
+        '''
+        deploy_IDs = list(self._watched)
+        results = await asyncio.gather(*[self._watched[deploy_ID] for deploy_ID in deploy_IDs])
+        return dict(zip(deploy_IDs, results))
+
+    async def _poll(self, deploy_ID):
+        deadline = time.monotonic() + self.timeout
+        interval = self.initial_interval
+        while True:
+            # Full jitter keeps deployments started together from polling in lockstep
+            delay = min(random.uniform(0, interval), max(0, deadline - time.monotonic()))
+            await asyncio.sleep(delay)
+            try:
+                status = await self.client.check_status(deploy_ID)
+            except DnacApiError as e:
+                # The deployment keeps running on DNAC, a failed poll is retried until the deadline
+                logger.warning("Cannot poll deployment %s: %s", deploy_ID, e)
+                status = {"deploymentId": deploy_ID, "status": "UNKNOWN"}
+            if status.get("status") in TERMINAL_STATES:
+                return status
+            if time.monotonic() >= deadline:
+                status = dict(status, status="TIMEOUT")
+                return status
+            interval = min(interval * 2, self.max_interval)
+
+
+async def track_deployments(deploy_IDs, callback=None, timeout=dnac_config.DEPLOY_TIMEOUT):
+    '''
+    Track many deployments concurrently until each one finishes or times out.
+    :param deploy_IDs: List of Deployment IDs
+    :param callback: Optional function called with (deploy_ID, status JSON) as each deployment finishes.
+    :param timeout: Seconds after which a deployment is given up. Configured via dnac_config.DEPLOY_TIMEOUT.
+    :return: dict of Deployment ID to last status JSON.
+    '''
+    async with AsyncDnacClient() as client:
+        tracker = DeploymentTracker(client, timeout=timeout)
+        for deploy_ID in deploy_IDs:
+            tracker.watch(deploy_ID, callback)
+        return await tracker.wait_all()
+
+
+def wait_for_deployments(deploy_IDs, callback=None, timeout=dnac_config.DEPLOY_TIMEOUT):
+    '''
+    Blocking version of track_deployments for scripts.
+    '''
+    return asyncio.run(track_deployments(deploy_IDs, callback, timeout))
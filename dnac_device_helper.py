@@ -0,0 +1,119 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+"""
+This file contains helper methods to work with many devices at once
+ -read a device list from a file
+ -stream the device inventory page by page
+ -resolve the Device UUIDs of many device IPs with paged network-device calls
+ -count the devices of the inventory and look up a single device without failing when it is missing
+"""
+
+from dnac_api_helper import *
+import dnac_config
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def load_device_list(file_name):
+    '''
+    Method to read device IPs from a file.
+    One IP per line or comma separated, blank lines and lines starting with # are ignored.
+    :param file_name: Path of the device list file.
+    :return: Returns list of device IPs, without duplicates, in file order.
+    '''
+    device_ips = []
+    seen = set()
+    try:
+        with open(file_name) as device_file:
+            for line in device_file:
+                line = line.split("#", 1)[0]
+                for device_ip in line.split(","):
+                    device_ip = device_ip.strip()
+                    if device_ip and device_ip not in seen:
+                        seen.add(device_ip)
+                        device_ips.append(device_ip)
+    except IOError as e:
+        logger.error("Something wrong, cannot read device list: %s", e)
+        sys.exit()
+    return device_ips
+
+
+def iter_network_devices(page_size=dnac_config.DEVICE_PAGE_SIZE):
+    '''
+    Generator over all device records of the inventory.
+    GET to network-device?offset=..&limit=.., each page decoded while it is downloaded.
+    Stop iterating at any time to skip the remaining pages.
+    :param page_size: Devices per listing call. Configured via dnac_config.DEVICE_PAGE_SIZE.
+    :return: Yields device records.
+    '''
+    return paginate("network-device", page_size, error_message="Something wrong, cannot get network device information")
+
+
+def get_network_device_count():
+    '''
+    Method to get the number of devices in the inventory.
+    GET to network-device/count
+    :return: Returns device count.
+    '''
+    resp = get(api="network-device/count")
+    return int(parse_response(resp, 200, "Something wrong, cannot get network device count").response)
+
+
+def find_network_device(device_ip):
+    '''
+    Method to look up one device by IP address.
+    GET to network-device/ip-address/{device_ip}
+    :param device_ip: Device IP address
+    :return: Returns device record, or None if no device has this IP.
+    '''
+    resp = get(api="network-device/ip-address/" + device_ip)
+    if resp.status_code != 200:
+        return None
+    return ApiResult(resp).response or None
+
+
+def get_network_device_ids(device_ips, page_size=dnac_config.DEVICE_PAGE_SIZE, warn_missing=True):
+    '''
+    Method to get the Device UUIDs for many IP addresses.
+    The inventory is walked page by page and the walk stops as soon as every IP is found,
+    so the number of API calls is about (inventory size / page size) and not one per device.
+    :param device_ips: List of device IP addresses which have been added to the inventory.
+    :param page_size: Devices per listing call. Configured via dnac_config.DEVICE_PAGE_SIZE.
+    :param warn_missing: Log a warning per IP not found, e.g. off when the device may be managed by another cluster.
+    :return: Returns dict of device IP to device UUID. IPs not found in the inventory are left out.
+    '''
+    # Duplicates are looked up, and warned about, once, in the order given
+    device_ips = list(dict.fromkeys(device_ips))
+    wanted = set(device_ips)
+    device_uuids = {}
+    if not wanted:
+        return device_uuids
+    for device in iter_network_devices(page_size):
+        device_ip = device.get("managementIpAddress")
+        if device_ip in wanted:
+            device_uuids[device_ip] = device.get("instanceUuid") or device["id"]
+            wanted.discard(device_ip)
+            if not wanted:
+                # No further record, nor the next page, is fetched
+                break
+
+    for device_ip in device_ips:
+        if device_ip in wanted and warn_missing:
+            logger.warning("No network device found with IP %s !", device_ip)
+    logger.info("Resolved %d of %d devices", len(device_uuids), len(device_ips))
+    return device_uuids
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+"""
+This script is the collector agent that runs on the device in guest shell, started by the EEM applet
+of deviceLogCollector.py --agent every QUERY_INTERVAL seconds.
+It remembers how far it has read every text trace file of the process (STATE_FILE) and on each pass only
+reads the bytes appended since the previous pass, up to the last full line. Binary trace files can only be
+decoded by the device: when one of them changed, the agent runs DECODE_COMMAND through the IOS CLI and
+keeps the decoded records later than the last one it handled.
+When the new lines have errors, only those new segments are uploaded, as one
+<process>_error_<epoch seconds>.tar.gz with a member per segment, to the FTP server.
+Offsets are only moved on once the upload succeeded, so a failed upload is retried on the next pass.
+A trace file rotated into name.gz is read on from the offset of name, and a new file that replaced name,
+told apart by its inode, its first bytes or by being shorter than the offset, is read from its start.
+Only the Python standard library is used, and the cli module of guest shell (or dohost) for the IOS CLI.
+
+Usage (in guest shell):
+  python3 dnac_guestshell_agent.py --process dbm --ftp-server 3.3.3.3 --ftp-username user --ftp-password pass
+"""
+
+import argparse
+import ftplib
+import gzip
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import tarfile
+import time
+
+# Directory of the agent on the device, bootflash:guest-share/ seen from guest shell
+AGENT_HOME = "/bootflash/guest-share"
+# Directory of the FTP server the device downloads the agent files from, and the files it downloads
+AGENT_FTP_DIR = "agent"
+AGENT_FILES = ("dnac_guestshell_agent.py",)
+
+TRACE_DIR = "/bootflash/tracelogs"
+STATE_FILE = AGENT_HOME + "/dnac_agent_state.json"
+# Bytes read per trace file and pass, the rest of a burst is read on the next pass
+MAX_SEGMENT = 16 * 1024 * 1024
+# First bytes of a text trace file, kept to tell a new file from the one the offset belongs to
+HEAD_SIZE = 64
+
+# Trace levels, lower is more severe
+LEVELS = ["EMERG", "ALERT", "CRIT", "ERR", "WARN", "NOTICE", "INFO", "DEBUG", "VERBOSE", "NOISE"]
+# Level keywords of the trace commands of the device, by level
+CLI_LEVELS = ["emergency", "alert", "critical", "error", "warning", "notice", "info", "debug", "verbose", "noise"]
+# Decodes the binary trace files of a process on the device, into the text lines the collection tools read
+DECODE_COMMAND = "show platform software trace filter-binary process {process} level {level}"
+# Time at the start of a decoded record, e.g. 2018/05/04 11:12:13.123
+RECORD_TIME = re.compile(r"^\d{4}/\d\d/\d\d \d\d:\d\d:\d\d(\.\d+)?")
+
+
+def level_number(level):
+    '''
+    :param level: Level name (e.g. "ERR") or number
+    :return: Level number
+    '''
+    if isinstance(level, int):
+        return level
+    return LEVELS.index(level.upper())
+
+
+def load_state(state_file):
+    '''
+    :return: {"offsets": dict of trace file name to the number of uncompressed bytes already scanned,
+              "inodes": dict of plain trace file name to the inode the offset belongs to,
+              "heads": dict of plain trace file name to the hex of its first HEAD_SIZE bytes,
+              "done": list of rotated .gz file names that were read to the end and are not opened again,
+              "binary": dict of binary trace file name to its size when the records were last decoded,
+              "decoded": [time of the last decoded record handled, number of records handled with that time]}
+    '''
+    try:
+        with open(state_file) as f:
+            state = json.load(f)
+    except (IOError, OSError, ValueError):
+        state = {}
+    # State written before inodes were recorded, its offsets are checked against the file size only
+    state.setdefault("offsets", {})
+    state.setdefault("inodes", {})
+    state.setdefault("heads", {})
+    state.setdefault("done", [])
+    state.setdefault("binary", {})
+    state.setdefault("decoded", ["", 0])
+    return state
+
+
+def save_state(state, state_file):
+    tmp_file = state_file + ".tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(state, f)
+    os.rename(tmp_file, state_file)
+
+
+def trace_files(trace_dir, process):
+    '''
+    :return: dict of trace file name to path for the trace files of the process
+    '''
+    return dict((file_name, os.path.join(trace_dir, file_name)) for file_name in sorted(os.listdir(trace_dir))
+                if file_name.startswith(process + "_"))
+
+
+def read_head(path, size=HEAD_SIZE):
+    '''
+    :return: The first size bytes of the file, uncompressed for a .gz file
+    '''
+    with (gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")) as f:
+        return f.read(size)
+
+
+def file_offsets(files, state):
+    '''
+    Work out where to read each text trace file from.
+    A plain file whose inode or first bytes changed, or that is shorter than its offset, is a new file under
+    the old name and is read from its start; the first bytes also tell a recycled inode. A rotated name.gz
+    takes over the offset of name once name is gone or replaced; while name is still the same file (being
+    compressed) the .gz is not read.
+    :return: (dict of file name to offset for the files to read, dict of plain file name to inode,
+              dict of plain file name to the hex of its first bytes)
+    '''
+    offsets = {}
+    inodes = {}
+    heads = {}
+    replaced = set()
+    for file_name, path in files.items():
+        if file_name.endswith(".gz"):
+            continue
+        stat = os.stat(path)
+        head = read_head(path).hex()
+        offset = state["offsets"].get(file_name, 0)
+        # A head saved while the file was shorter than HEAD_SIZE is compared with as many bytes
+        old_head = state["heads"].get(file_name, head)
+        if state["inodes"].get(file_name, stat.st_ino) != stat.st_ino or stat.st_size < offset or \
+                head[:len(old_head)] != old_head:
+            replaced.add(file_name)
+            offset = 0
+        offsets[file_name] = offset
+        inodes[file_name] = stat.st_ino
+        heads[file_name] = head
+    for file_name in files:
+        if not file_name.endswith(".gz"):
+            continue
+        plain = file_name[:-3]
+        if file_name in state["offsets"]:
+            offsets[file_name] = state["offsets"][file_name]
+        elif plain not in files or plain in replaced:
+            offsets[file_name] = state["offsets"].get(plain, 0)
+    return offsets, inodes, heads
+
+
+def read_segment(path, offset, max_bytes=MAX_SEGMENT):
+    '''
+    :return: The bytes of the file after offset, at most max_bytes, empty if there are none
+    '''
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            # gzip streams can only be skipped by decompressing
+            f.seek(offset)
+            return f.read(max_bytes)
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size <= offset:
+            return b""
+        f.seek(offset)
+        return f.read(max_bytes)
+
+
+def is_binary(path):
+    '''
+    :return: True if the trace file holds binary records rather than text lines
+    '''
+    return b"\0" in read_head(path, 4096)
+
+
+def run_cli(command):
+    '''
+    Run an IOS exec command from guest shell.
+    :return: Output of the command
+    '''
+    try:
+        from cli import cli
+    except ImportError:
+        # Guest shell without the cli Python module
+        return subprocess.check_output(["dohost", command]).decode("utf-8", "replace")
+    return cli(command)
+
+
+def new_records(output, last_time, seen):
+    '''
+    Pick the decoded records that were not handled yet. The device lists the records in time order, so a
+    record is new when it is later than the last one handled, or as late and past the seen records of that time.
+    Lines without a time belong to the record above them.
+    :param output: Decoded text of the binary trace files
+    :param last_time: Time of the last record handled
+    :param seen: Number of records handled with that time
+    :return: (text of the new records, time of the last record, number of records with that time)
+    '''
+    lines = []
+    keep = False
+    current, count = last_time, seen
+    for line in output.splitlines(True):
+        match = RECORD_TIME.match(line)
+        if match is not None:
+            when = match.group(0)
+            count = count + 1 if when == current else 1
+            current = when
+            keep = when > last_time or (when == last_time and count > seen)
+        if keep:
+            lines.append(line)
+    if current == last_time:
+        count = max(count, seen)
+    return "".join(lines), current, count
+
+
+def scan_segment(data, text_errors):
+    '''
+    Cut a text segment at its last full line and check it for errors.
+    :return: (length of the usable part, True if it has a line at the level or more severe)
+    '''
+    length = data.rfind(b"\n") + 1
+    return length, bool(text_errors.search(data[:length]))
+
+
+def make_archive(segments):
+    '''
+    :param segments: List of (member name, bytes)
+    :return: bytes of a tar.gz with one member per segment
+    '''
+    out = io.BytesIO()
+    with tarfile.open(fileobj=out, mode="w:gz") as tar:
+        for name, data in segments:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            tar.addfile(info, io.BytesIO(data))
+    return out.getvalue()
+
+
+def upload(archive, file_name, server, username, password):
+    ftp = ftplib.FTP(server, timeout=60)
+    try:
+        ftp.login(username, password)
+        ftp.storbinary("STOR " + file_name, io.BytesIO(archive))
+    finally:
+        try:
+            ftp.quit()
+        except ftplib.all_errors:
+            ftp.close()
+
+
+def run_pass(args):
+    '''
+    One pass: read the new bytes of every text trace file and the new decoded records of the binary trace
+    files of the process, upload them if they have errors.
+    :return: Number of bytes uploaded
+    '''
+    state = load_state(args.state)
+    files = trace_files(args.trace_dir, args.process)
+    max_level = level_number(args.level)
+    text_errors = re.compile(("\\b(" + "|".join(LEVELS[:max_level + 1]) + ")\\b").encode("ascii"))
+    # Files that were deleted are forgotten
+    try:
+        binary = dict((file_name, os.path.getsize(path)) for file_name, path in files.items() if is_binary(path))
+        offsets, inodes, heads = file_offsets(
+            dict((file_name, path) for file_name, path in files.items() if file_name not in binary), state)
+    except (IOError, OSError, EOFError) as e:
+        # A file was rotated away while listing, the next pass sees the directory settled
+        sys.stderr.write("Cannot read {}: {}\n".format(args.trace_dir, e))
+        return 0
+    done = set(file_name for file_name in state["done"] if file_name in files and file_name.endswith(".gz"))
+    segments = []
+    errors = False
+    for file_name, offset in sorted(offsets.items()):
+        if file_name in done:
+            continue
+        path = files[file_name]
+        try:
+            data = read_segment(path, offset)
+        except (IOError, OSError, EOFError) as e:
+            sys.stderr.write("Cannot read {}: {}\n".format(path, e))
+            continue
+        if file_name.endswith(".gz") and len(data) < MAX_SEGMENT:
+            done.add(file_name)
+        length, has_errors = scan_segment(data, text_errors)
+        if not length:
+            continue
+        # Segments of a rotated file are named after the uncompressed file they were read from
+        member = file_name[:-3] if file_name.endswith(".gz") else file_name
+        segments.append(("tracelogs/{}.{}".format(member, offset), data[:length]))
+        offsets[file_name] = offset + length
+        errors = errors or has_errors
+
+    decoded = state["decoded"]
+    if binary and binary != state["binary"]:
+        command = DECODE_COMMAND.format(process=args.process, level=CLI_LEVELS[level_number(args.decode_level)])
+        try:
+            output = run_cli(command)
+        except Exception as e:
+            # The binary files are decoded again on the next pass
+            sys.stderr.write("Cannot run {}: {}\n".format(command, e))
+            binary = state["binary"]
+        else:
+            text, last_time, seen = new_records(output, decoded[0], decoded[1])
+            decoded = [last_time, seen]
+            if text:
+                data = text.encode("utf-8")
+                segments.append(("tracelogs/{}_decoded_{}.log".format(args.process, int(time.time())), data))
+                errors = errors or bool(text_errors.search(data))
+
+    uploaded = 0
+    if errors:
+        archive = make_archive(segments)
+        file_name = "{}_error_{}.tar.gz".format(args.process, int(time.time()))
+        try:
+            upload(archive, file_name, args.ftp_server, args.ftp_username, args.ftp_password)
+        except (ftplib.all_errors + (IOError, OSError)) as e:
+            # Offsets stay where they were, the same segments are tried again on the next pass
+            print("Cannot upload {} to {}: {}".format(file_name, args.ftp_server, e))
+            return 0
+        uploaded = len(archive)
+        print("Copied {} new trace segments ({} bytes) to FTP Server".format(len(segments), uploaded))
+    else:
+        print("No logs to collect")
+    save_state({"offsets": offsets, "inodes": inodes, "heads": heads, "done": sorted(done),
+                "binary": binary, "decoded": decoded}, args.state)
+    return uploaded
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Upload the new error trace segments of a process")
+    parser.add_argument("--process", required=True, help="IOS process name, e.g. dbm")
+    parser.add_argument("--ftp-server", required=True, help="FTP server the segments are uploaded to")
+    parser.add_argument("--ftp-username", default="anonymous")
+    parser.add_argument("--ftp-password", default="")
+    parser.add_argument("--level", default="ERR", help="least severe level that triggers an upload (default %(default)s)")
+    parser.add_argument("--decode-level", default="INFO",
+                        help="least severe level of the binary trace records decoded (default %(default)s)")
+    parser.add_argument("--trace-dir", default=TRACE_DIR, help="trace directory (default %(default)s)")
+    parser.add_argument("--state", default=STATE_FILE, help="offset state file (default %(default)s)")
+    run_pass(parser.parse_args())
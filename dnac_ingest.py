@@ -0,0 +1,467 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+"""
+This script receives the tarballs uploaded by the EEM Script and files them into a deduplicating store.
+Each <process>_error_<timestamp>.tar (.tar.gz from the guest shell agent) is read member by member as a stream,
+without extracting it to disk.
+Members are split into chunks that are stored once, gzip compressed, by content hash under
+    <ARCHIVE_STORE>/blobs/
+and each collection gets a manifest in
+    <ARCHIVE_STORE>/<device>/<process>/<uploaded file name>/manifest.json
+from which the original tarball can be rebuilt. The device is the address the tarball was uploaded
+from (ftp mode) or the sub directory of INGEST_DIR it was dropped in (watch mode).
+Tarballs are processed by a bounded pool of INGEST_WORKERS workers so a burst of uploads queues up
+instead of exhausting the host. A tarball that cannot be ingested INGEST_MAX_ATTEMPTS times is moved
+to the REJECTED_DIR sub directory of INGEST_DIR.
+The ftp mode also serves the guest shell agent files read-only from INGEST_DIR/agent/ for the devices
+to download (deviceLogCollector.py --agent).
+
+Usage:
+  python3 dnac_ingest.py ftp                      run an FTP server as the FTP_SERVER target (needs pyftpdlib)
+  python3 dnac_ingest.py watch                    ingest tarballs dropped into INGEST_DIR by another FTP server
+  python3 dnac_ingest.py ingest <device> <tar>... ingest tarballs by hand
+  python3 dnac_ingest.py restore <collection dir> <tar>  rebuild the tarball of a collection
+"""
+
+import dnac_config
+from dnac_api_helper import setup_logging
+from dnac_guestshell_agent import AGENT_FILES, AGENT_FTP_DIR
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import tarfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Name of the tarballs written by create_eem_script: <process>_error_<epoch seconds>.tar,
+# and by the guest shell agent: <process>_error_<epoch seconds>.tar.gz
+ARCHIVE_NAME = re.compile(r"^(?P<process>.+)_error_(?P<timestamp>\d+)\.tar(\.gz)?$")
+UNKNOWN_DEVICE = "unknown"
+# Rotated trace files and logs in a tarball are gzip compressed
+GZIP_MAGIC = b"\x1f\x8b"
+# Sub directory of INGEST_DIR where tarballs that cannot be ingested are moved
+REJECTED_DIR = "rejected"
+# Errors of a corrupt or truncated tarball
+INGEST_ERRORS = (IOError, OSError, EOFError, ValueError, zlib.error, tarfile.TarError)
+
+
+def parse_archive_name(file_name):
+    '''
+    Get the process and collection time out of a tarball name.
+    :param file_name: Tarball file name, with or without directory
+    :return: (process, timestamp) or None if the name does not follow the EEM Script pattern
+    '''
+    match = ARCHIVE_NAME.match(os.path.basename(file_name))
+    if match is None:
+        return None
+    return match.group("process"), int(match.group("timestamp"))
+
+
+def safe_name(name):
+    '''
+    Turn a device name or tar member name into a relative path that stays inside the store.
+    '''
+    parts = [part for part in re.split(r"[\\/]+", name) if part not in ("", ".", "..")]
+    return os.path.join(*parts) if parts else "_"
+
+
+def decompressed(fileobj):
+    '''
+    :param fileobj: Buffered binary file object, e.g. a member of a collection
+    :return: fileobj, or a GzipFile reading it when its content is gzip compressed
+    '''
+    if fileobj.peek(len(GZIP_MAGIC))[:len(GZIP_MAGIC)] == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+    return fileobj
+
+
+class MemberReader(io.RawIOBase):
+    '''
+    Read-only stream over the decompressed chunks of one stored member.
+    '''
+
+    def __init__(self, chunk_paths):
+        self._paths = iter(chunk_paths)
+        self._current = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while True:
+            if self._current is None:
+                path = next(self._paths, None)
+                if path is None:
+                    return 0
+                self._current = gzip.open(path, "rb")
+            count = self._current.readinto(b)
+            if count:
+                return count
+            self._current.close()
+            self._current = None
+
+    def close(self):
+        if self._current is not None:
+            self._current.close()
+            self._current = None
+        super(MemberReader, self).close()
+
+
+class ArchiveStore(object):
+    '''
+    Content-addressed store of collected tarballs.
+    Members are split into CHUNK_SIZE chunks stored once, gzip compressed, under
+    blobs/<sha256[:2]>/<sha256>.gz. Each collection is a manifest.json listing its members and
+    their chunks. A chunk that is already stored is neither compressed nor written again, so trace
+    files that did not change, or only grew, since the last collection cost almost no space or I/O.
+    '''
+
+    CHUNK_SIZE = 1024 * 1024
+    BLOB_DIR = "blobs"
+
+    def __init__(self, root=dnac_config.ARCHIVE_STORE):
+        '''
+        :param root: Store directory. Configured via dnac_config.ARCHIVE_STORE.
+        '''
+        self.root = root
+
+    @classmethod
+    def store_for(cls, collection):
+        '''
+        :param collection: Collection directory
+        :return: ArchiveStore holding the collection, rooted at the closest parent directory with a blobs directory
+        '''
+        root = os.path.dirname(os.path.abspath(collection))
+        while not os.path.isdir(os.path.join(root, cls.BLOB_DIR)):
+            parent = os.path.dirname(root)
+            if parent == root:
+                raise ValueError("{} is not a collection of an ArchiveStore".format(collection))
+            root = parent
+        return cls(root)
+
+    def collection_dir(self, device, process, source):
+        # Keyed on the whole uploaded file name, a .tar and a .tar.gz of the same time are two collections
+        return os.path.join(self.root, safe_name(device), safe_name(process), safe_name(os.path.basename(source)))
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, self.BLOB_DIR, digest[:2], digest + ".gz")
+
+    def _put_chunk(self, data):
+        '''
+        Store one chunk unless it is already stored.
+        :return: (sha256 hex digest, True if the chunk was new)
+        '''
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest)
+        if os.path.exists(path):
+            return digest, False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+        try:
+            with gzip.open(temp, "wb") as out:
+                out.write(data)
+            # Linking fails if the chunk exists, so of concurrent writers of the same chunk only one counts it as new
+            os.link(temp, path)
+        except FileExistsError:
+            return digest, False
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+        return digest, True
+
+    def add_archive(self, fileobj, device, process, timestamp, source):
+        '''
+        Stream a tarball into the store member by member, chunk by chunk.
+        :param fileobj: Readable file object of the tarball, read sequentially once
+        :param device: Device the tarball came from
+        :param process: Process the logs belong to
+        :param timestamp: Collection time, epoch seconds
+        :param source: Name of the uploaded file, recorded in the manifest
+        :return: Manifest dict of the collection
+        '''
+        members = []
+        new_bytes = 0
+        # "r|*" reads the tar as a stream, members are never extracted to disk uncompressed
+        with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                member_file = tar.extractfile(member)
+                member_hash = hashlib.sha256()
+                chunks = []
+                while True:
+                    data = member_file.read(self.CHUNK_SIZE)
+                    if not data:
+                        break
+                    member_hash.update(data)
+                    digest, new = self._put_chunk(data)
+                    chunks.append(digest)
+                    new_bytes += len(data) if new else 0
+                members.append({"name": member.name, "size": member.size, "mtime": member.mtime,
+                                "mode": member.mode, "sha256": member_hash.hexdigest(), "chunks": chunks})
+        manifest = {"device": device, "process": process, "timestamp": timestamp,
+                    "source": source, "new_bytes": new_bytes, "members": members}
+        target = self.collection_dir(device, process, source)
+        os.makedirs(target, exist_ok=True)
+        temp = os.path.join(target, "manifest.json.tmp")
+        with open(temp, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(temp, os.path.join(target, "manifest.json"))
+        return manifest
+
+    def load_manifest(self, collection):
+        '''
+        :param collection: Collection directory
+        :return: Manifest dict of the collection
+        '''
+        with open(os.path.join(collection, "manifest.json")) as f:
+            return json.load(f)
+
+    def open_member(self, member):
+        '''
+        :param member: Member entry of a manifest
+        :return: Buffered binary stream of the member content
+        '''
+        return io.BufferedReader(MemberReader([self.blob_path(digest) for digest in member["chunks"]]),
+                                 self.CHUNK_SIZE)
+
+    def restore_archive(self, collection, out_file):
+        '''
+        Rebuild the tarball of a collection.
+        :param collection: Collection directory
+        :param out_file: Path of the tarball to write
+        '''
+        manifest = self.load_manifest(collection)
+        with tarfile.open(out_file, "w") as tar:
+            for member in manifest["members"]:
+                info = tarfile.TarInfo(member["name"])
+                info.size = member["size"]
+                info.mtime = member["mtime"]
+                info.mode = member.get("mode", 0o644)
+                with self.open_member(member) as content:
+                    tar.addfile(info, content)
+
+    def collections(self):
+        '''
+        :return: Sorted list of all collection directories
+        '''
+        collections = []
+        for dir_path, dir_names, file_names in os.walk(self.root):
+            if dir_path == self.root and self.BLOB_DIR in dir_names:
+                dir_names.remove(self.BLOB_DIR)
+            if "manifest.json" in file_names:
+                collections.append(dir_path)
+                dir_names[:] = []
+        return sorted(collections)
+
+
+class Ingester(object):
+    '''
+    Bounded worker pool that moves uploaded tarballs into the ArchiveStore.
+    '''
+
+    def __init__(self, store, workers=dnac_config.INGEST_WORKERS, keep=False, incoming=None,
+                 max_attempts=dnac_config.INGEST_MAX_ATTEMPTS):
+        '''
+        :param store: ArchiveStore to write to
+        :param workers: Tarballs processed in parallel. Configured via dnac_config.INGEST_WORKERS.
+        :param keep: Keep the uploaded tarball after it was ingested
+        :param incoming: Upload directory, tarballs that keep failing are moved to its REJECTED_DIR.
+               None leaves them in place.
+        :param max_attempts: Failed attempts before a tarball is rejected. Configured via dnac_config.INGEST_MAX_ATTEMPTS.
+        '''
+        self.store = store
+        self.keep = keep
+        self.incoming = incoming
+        self.max_attempts = max_attempts
+        self._failures = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        # At most two tarballs per worker wait in the queue, submit() blocks beyond that
+        self._slots = threading.BoundedSemaphore(workers * 2)
+        self._pending = set()
+        self._ignored = set()
+        self._pending_lock = threading.Lock()
+
+    def submit(self, file_path, device=UNKNOWN_DEVICE):
+        '''
+        Queue an uploaded tarball. Blocks while the pool is saturated.
+        :return: Future of the manifest, or None if the file is already queued or not an EEM tarball
+        '''
+        if parse_archive_name(file_path) is None:
+            if file_path not in self._ignored:
+                logger.warning("Ignoring %s, not a <process>_error_<timestamp>.tar(.gz) file", file_path)
+                self._ignored.add(file_path)
+            return None
+        with self._pending_lock:
+            if file_path in self._pending:
+                return None
+            self._pending.add(file_path)
+        self._slots.acquire()
+        return self._executor.submit(self._ingest, file_path, device)
+
+    def _ingest(self, file_path, device):
+        try:
+            process, timestamp = parse_archive_name(file_path)
+            with open(file_path, "rb") as f:
+                manifest = self.store.add_archive(f, device, process, timestamp, os.path.basename(file_path))
+            logger.info("Ingested %s from %s: %d files, %d new bytes", os.path.basename(file_path), device,
+                        len(manifest["members"]), manifest["new_bytes"])
+            if not self.keep:
+                os.remove(file_path)
+            with self._pending_lock:
+                self._failures.pop(file_path, None)
+            return manifest
+        except INGEST_ERRORS as e:
+            logger.error("Something wrong, cannot ingest %s: %s", file_path, e)
+            self._failed(file_path)
+        except Exception:
+            logger.exception("Something wrong, cannot ingest %s", file_path)
+            self._failed(file_path)
+        finally:
+            with self._pending_lock:
+                self._pending.discard(file_path)
+            self._slots.release()
+
+    def _failed(self, file_path):
+        '''
+        Count a failed attempt and move the tarball out of the upload directory after max_attempts,
+        so the watch mode does not retry it forever.
+        '''
+        with self._pending_lock:
+            failures = self._failures.get(file_path, 0) + 1
+            self._failures[file_path] = failures
+        if self.incoming is None or failures < self.max_attempts:
+            return
+        target = os.path.join(self.incoming, REJECTED_DIR, safe_name(os.path.relpath(file_path, self.incoming)))
+        try:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(file_path, target)
+            logger.error("Rejected %s after %d attempts, moved to %s", file_path, failures, target)
+        except OSError as e:
+            logger.error("Something wrong, cannot move %s to %s: %s", file_path, target, e)
+        with self._pending_lock:
+            self._failures.pop(file_path, None)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+def watch_directory(ingester, incoming=dnac_config.INGEST_DIR, interval=5):
+    '''
+    Ingest tarballs another FTP server writes into incoming.
+    Tarballs in a sub directory are attributed to a device of that name (e.g. one FTP account per device).
+    A file is picked up once it was not modified for interval seconds, so uploads in progress are skipped.
+    '''
+    logger.info("Watching %s for uploaded tarballs", incoming)
+    while True:
+        now = time.time()
+        for dir_path, dir_names, file_names in os.walk(incoming):
+            if dir_path == incoming:
+                dir_names[:] = [name for name in dir_names if name not in (AGENT_FTP_DIR, REJECTED_DIR)]
+            relative = os.path.relpath(dir_path, incoming)
+            device = UNKNOWN_DEVICE if relative == "." else relative
+            for file_name in file_names:
+                file_path = os.path.join(dir_path, file_name)
+                try:
+                    if now - os.path.getmtime(file_path) >= interval:
+                        ingester.submit(file_path, device)
+                except OSError:
+                    continue
+        time.sleep(interval)
+
+
+def serve_ftp(ingester, incoming=dnac_config.INGEST_DIR, port=dnac_config.INGEST_FTP_PORT):
+    '''
+    Run an FTP server that accepts the uploads of the EEM Script with FTP_USERNAME/FTP_PASSWORD.
+    Each received tarball is attributed to the address it was uploaded from.
+    The guest shell agent files are published read-only in the AGENT_FTP_DIR sub directory.
+    '''
+    try:
+        from pyftpdlib.authorizers import DummyAuthorizer
+        from pyftpdlib.handlers import FTPHandler
+        from pyftpdlib.servers import ThreadedFTPServer
+    except ImportError:
+        logger.error("The ftp mode needs the pyftpdlib package (pip install pyftpdlib), "
+                     "or run another FTP server into %s and use the watch mode", incoming)
+        sys.exit()
+
+    agent_dir = os.path.join(incoming, AGENT_FTP_DIR)
+    os.makedirs(agent_dir, exist_ok=True)
+    for file_name in AGENT_FILES:
+        shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), file_name), agent_dir)
+    authorizer = DummyAuthorizer()
+    authorizer.add_user(dnac_config.FTP_USERNAME, dnac_config.FTP_PASSWORD, incoming, perm="elw")
+    authorizer.override_perm(dnac_config.FTP_USERNAME, agent_dir, perm="elr", recursive=True)
+
+    class IngestHandler(FTPHandler):
+        def on_file_received(self, file_path):
+            ingester.submit(file_path, self.remote_ip)
+
+    IngestHandler.authorizer = authorizer
+    server = ThreadedFTPServer(("0.0.0.0", port), IngestHandler)
+    logger.info("FTP ingest server listening on port %d", port)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Receive the tarballs uploaded by the EEM Script into a compressed store")
+    parser.add_argument("mode", choices=("ftp", "watch", "ingest", "restore"))
+    parser.add_argument("args", nargs="*", help="ingest mode: device name followed by tarball paths, "
+                                                "restore mode: collection directory and tarball path")
+    parser.add_argument("--store", default=dnac_config.ARCHIVE_STORE, help="store directory (default %(default)s)")
+    parser.add_argument("--incoming", default=dnac_config.INGEST_DIR, help="upload directory (default %(default)s)")
+    parser.add_argument("--workers", type=int, default=dnac_config.INGEST_WORKERS,
+                        help="tarballs processed in parallel (default %(default)s)")
+    parser.add_argument("--port", type=int, default=dnac_config.INGEST_FTP_PORT, help="FTP port (default %(default)s)")
+    parser.add_argument("--keep", action="store_true", help="keep uploaded tarballs after ingesting them")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only log warnings and errors")
+    args = parser.parse_args()
+
+    setup_logging(args.quiet)
+    if args.mode == "restore":
+        if len(args.args) != 2:
+            parser.error("restore needs a collection directory and a tarball path")
+        ArchiveStore(args.store).restore_archive(args.args[0], args.args[1])
+        sys.exit()
+    ingester = Ingester(ArchiveStore(args.store), args.workers, keep=args.keep or args.mode == "ingest",
+                        incoming=None if args.mode == "ingest" else args.incoming)
+    try:
+        if args.mode == "ftp":
+            serve_ftp(ingester, args.incoming, args.port)
+        elif args.mode == "watch":
+            watch_directory(ingester, args.incoming)
+        else:
+            if len(args.args) < 2:
+                parser.error("ingest needs a device name and at least one tarball")
+            for file_path in args.args[1:]:
+                ingester.submit(file_path, args.args[0])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ingester.close()
@@ -0,0 +1,233 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+"""
+This file contains a local SQLite snapshot of the DNAC device inventory.
+Devices are indexed by management IP, hostname and serial number so IP to UUID lookups are
+answered locally. The snapshot is filled from paged network-device listings and refreshed
+only when it is older than the TTL and the device count changed, or older than the max age;
+devices missing from the snapshot are looked up one by one and added, and mark the snapshot stale.
+
+Usage: python3 dnac_inventory.py [--sync] [--force] [ip ...]
+"""
+
+from dnac_device_helper import *
+import dnac_config
+import argparse
+import logging
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS device (
+    uuid TEXT PRIMARY KEY,
+    management_ip TEXT,
+    hostname TEXT,
+    serial TEXT,
+    family TEXT,
+    last_update_time INTEGER,
+    synced_at REAL
+);
+CREATE INDEX IF NOT EXISTS device_ip ON device (management_ip);
+CREATE INDEX IF NOT EXISTS device_hostname ON device (hostname);
+CREATE INDEX IF NOT EXISTS device_serial ON device (serial);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# SQLite limits the number of host parameters of one statement
+LOOKUP_BATCH = 500
+
+
+class DeviceInventory(object):
+    '''
+    Local inventory snapshot.
+    '''
+
+    def __init__(self, db_file=None, ttl=dnac_config.INVENTORY_TTL, max_age=dnac_config.INVENTORY_MAX_AGE):
+        '''
+        :param db_file: Path of the SQLite file. Default dnac_config.INVENTORY_DB, one per cluster (see cluster_file).
+        :param ttl: Seconds before the snapshot is synced again. Configured via dnac_config.INVENTORY_TTL.
+        :param max_age: Seconds before the full listing is walked even if the device count is unchanged.
+               Configured via dnac_config.INVENTORY_MAX_AGE.
+        '''
+        self.ttl = ttl
+        self.max_age = max_age
+        self.db = sqlite3.connect(db_file or cluster_file(dnac_config.INVENTORY_DB))
+        self.db.executescript(SCHEMA)
+        if "family" not in [column[1] for column in self.db.execute("PRAGMA table_info(device)")]:
+            # Snapshot written before the family column existed, every row is rewritten by the next sync
+            self.db.execute("ALTER TABLE device ADD COLUMN family TEXT")
+            self.db.execute("UPDATE device SET last_update_time = 0")
+            self.db.execute("DELETE FROM meta WHERE key IN ('last_sync', 'last_full_sync')")
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def _get_meta(self, key, default=None):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _upsert(self, device, synced_at):
+        '''
+        Insert or refresh a device record, skipping the write when DNAC reports no change.
+        :return: True if the row was written
+        '''
+        uuid = device.get("instanceUuid") or device["id"]
+        last_update_time = int(device.get("lastUpdateTime") or 0)
+        row = self.db.execute("SELECT last_update_time FROM device WHERE uuid = ?", (uuid,)).fetchone()
+        if row is not None and row[0] == last_update_time and last_update_time:
+            self.db.execute("UPDATE device SET synced_at = ? WHERE uuid = ?", (synced_at, uuid))
+            return False
+        self.db.execute("INSERT OR REPLACE INTO device (uuid, management_ip, hostname, serial, family, last_update_time, "
+                        "synced_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (uuid, device.get("managementIpAddress"), device.get("hostname"),
+                         device.get("serialNumber"), device.get("family"), last_update_time, synced_at))
+        return True
+
+    def is_fresh(self):
+        return time.time() - float(self._get_meta("last_sync", 0)) < self.ttl
+
+    def sync(self, force=False, page_size=dnac_config.DEVICE_PAGE_SIZE):
+        '''
+        Bring the snapshot up to date with DNAC.
+        Nothing is fetched while the snapshot is younger than the TTL. After the TTL only the device
+        count is checked and the listing is walked only if the count differs from the snapshot, the
+        snapshot is older than the max age or it was marked stale by get_uuids_by_ip, to pick up
+        devices that changed without changing the count.
+        Rows are only rewritten for devices whose lastUpdateTime changed; devices gone from DNAC are removed.
+        :param force: Walk the full listing regardless of TTL and count.
+        :param page_size: Devices per listing call. Configured via dnac_config.DEVICE_PAGE_SIZE.
+        :return: Number of device rows written
+        '''
+        now = time.time()
+        if not force:
+            if self.is_fresh():
+                return 0
+            known = self.db.execute("SELECT COUNT(*) FROM device").fetchone()[0]
+            last_full_sync = float(self._get_meta("last_full_sync", 0))
+            if get_network_device_count() == known and now - last_full_sync < self.max_age:
+                self._set_meta("last_sync", now)
+                self.db.commit()
+                return 0
+
+        written = 0
+        for device in iter_network_devices(page_size):
+            written += self._upsert(device, now)
+        self.db.execute("DELETE FROM device WHERE synced_at < ?", (now,))
+        self._set_meta("last_sync", now)
+        self._set_meta("last_full_sync", now)
+        self.db.commit()
+        logger.info("Inventory synced, %d device records updated", written)
+        return written
+
+    def _lookup(self, column, values):
+        found = {}
+        values = list(values)
+        for start in range(0, len(values), LOOKUP_BATCH):
+            batch = values[start:start + LOOKUP_BATCH]
+            query = "SELECT {0}, uuid FROM device WHERE {0} IN ({1})".format(column, ",".join("?" * len(batch)))
+            found.update(self.db.execute(query, batch).fetchall())
+        return found
+
+    def get_uuids_by_ip(self, device_ips, sync=True, fetch_missing=True):
+        '''
+        Resolve device IPs to UUIDs from the snapshot.
+        IPs missing from the snapshot are looked up on DNAC one by one and added to it. An IP DNAC knows
+        but the snapshot does not means devices were added or re-addressed since the last full sync,
+        so the snapshot is marked stale and the next sync walks the full listing.
+        :param device_ips: List of device IP addresses
+        :param sync: Sync the snapshot first if it is older than the TTL
+        :param fetch_missing: Look up IPs missing from the snapshot on DNAC
+        :return: dict of device IP to device UUID. IPs not found in the inventory are left out.
+        '''
+        if sync:
+            self.sync()
+        device_uuids = self._lookup("management_ip", set(device_ips))
+        if not fetch_missing:
+            return device_uuids
+        # A duplicated IP is looked up, and warned about, once
+        missing = [device_ip for device_ip in dict.fromkeys(device_ips) if device_ip not in device_uuids]
+        stale = False
+        for device_ip in missing:
+            device = find_network_device(device_ip)
+            if device is None:
+                logger.warning("No network device found with IP %s !", device_ip)
+                continue
+            self._upsert(device, time.time())
+            device_uuids[device_ip] = device.get("instanceUuid") or device["id"]
+            stale = True
+        if stale:
+            self.db.execute("DELETE FROM meta WHERE key IN ('last_sync', 'last_full_sync')")
+        if missing:
+            self.db.commit()
+        return device_uuids
+
+    def get_uuids_by_hostname(self, hostnames):
+        '''
+        :param hostnames: List of device hostnames
+        :return: dict of hostname to device UUID, from the snapshot only
+        '''
+        return self._lookup("hostname", set(hostnames))
+
+    def get_uuids_by_family(self, family):
+        '''
+        :param family: Product family, e.g. Routers or Switches, matched against the start of the DNAC
+               device family so "Switches" selects "Switches and Hubs"
+        :return: dict of device IP to device UUID of the devices of that family, from the snapshot only
+        '''
+        return dict(self.db.execute("SELECT management_ip, uuid FROM device WHERE family LIKE ? || '%'", (family,)).fetchall())
+
+    def get_uuids(self):
+        '''
+        :return: set of the UUIDs of all devices in the snapshot
+        '''
+        return set(row[0] for row in self.db.execute("SELECT uuid FROM device"))
+
+    def get_uuids_by_serial(self, serials):
+        '''
+        :param serials: List of device serial numbers
+        :return: dict of serial number to device UUID, from the snapshot only
+        '''
+        return self._lookup("serial", set(serials))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sync and query the local DNAC inventory snapshot")
+    parser.add_argument("--sync", action="store_true", help="sync the snapshot if it is older than INVENTORY_TTL")
+    parser.add_argument("--force", action="store_true", help="walk the full device listing now")
+    parser.add_argument("ips", nargs="*", help="device IPs to resolve")
+    args = parser.parse_args()
+
+    setup_logging()
+    inventory = DeviceInventory()
+    try:
+        if args.sync or args.force:
+            inventory.sync(force=args.force)
+        for device_ip, uuid in sorted(inventory.get_uuids_by_ip(args.ips, sync=False).items()):
+            print(device_ip, uuid)
+    except DnacApiError as e:
+        logger.error("%s", e)
+    finally:
+        inventory.close()
@@ -0,0 +1,527 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+"""
+This script keeps a full-text index of the collected logs, so finding every device that logged a term
+from a process in a time window does not mean reading every collection again.
+The text lines of each collection of ARCHIVE_STORE, with the trace records the device decoded, are split
+into terms and kept in a local
+SQLite inverted index (LOG_INDEX_DB). The postings of a term are kept in time order and carry the
+device and process of the line; every line records where it is in its collection (member and byte
+offset). A query is answered from the index alone; only the matching lines are then read back from
+the store, from the one chunk that holds each of them.
+Updates only index the collections that are new since the last update. A line that is in several
+collections of a device, because the same trace file was collected again, is indexed once.
+
+Usage:
+  python3 dnac_log_index.py update [--watch 60]
+  python3 dnac_log_index.py query "failed to allocate" --process dbm --since "2018-05-04 11:00" --until "2018-05-04 12:00"
+  python3 dnac_log_index.py query 10.1.1.1 --device 10.0.0.5 --level ERR --limit 20
+A term ending in * matches every term that starts with it, e.g. alloc*.
+"""
+
+import dnac_config
+from dnac_api_helper import setup_logging
+from dnac_ingest import ArchiveStore, decompressed
+import argparse
+import calendar
+import collections
+import gzip
+import hashlib
+import itertools
+import logging
+import os
+import re
+import sqlite3
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS collection (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE,
+    device TEXT,
+    process TEXT,
+    timestamp INTEGER,
+    indexed_at REAL
+);
+CREATE TABLE IF NOT EXISTS member (
+    id INTEGER PRIMARY KEY,
+    collection_id INTEGER,
+    position INTEGER,
+    name TEXT,
+    compressed INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS source (
+    id INTEGER PRIMARY KEY,
+    device TEXT,
+    process TEXT,
+    UNIQUE (device, process)
+);
+CREATE TABLE IF NOT EXISTS line (
+    id INTEGER PRIMARY KEY,
+    source_id INTEGER,
+    time REAL,
+    level INTEGER,
+    member_id INTEGER,
+    offset INTEGER,
+    length INTEGER,
+    digest INTEGER,
+    UNIQUE (source_id, time, digest)
+);
+CREATE INDEX IF NOT EXISTS line_time ON line (time);
+CREATE TABLE IF NOT EXISTS term (
+    id INTEGER PRIMARY KEY,
+    term TEXT UNIQUE,
+    postings INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS posting (
+    term_id INTEGER,
+    time REAL,
+    line_id INTEGER,
+    source_id INTEGER,
+    PRIMARY KEY (term_id, time, line_id)
+) WITHOUT ROWID;
+"""
+
+# Terms are runs of letters, digits and "_", joined by . : / @ - (IP and MAC addresses, interface names,
+# paths). Each part of a joined term is a term of its own as well, except parts that are only digits.
+TERM = re.compile(r"[0-9a-z_]+(?:[.:/@-][0-9a-z_]+)*")
+TERM_PART = re.compile(r"[0-9a-z]+")
+MAX_TERM_LENGTH = 64
+
+# Trace levels, lower is more severe
+LEVELS = ["EMERG", "ALERT", "CRIT", "ERR", "WARN", "NOTICE", "INFO", "DEBUG", "VERBOSE", "NOISE"]
+
+# Decoded IOS-XE trace line, see dnac_trace_analyzer.TRACE_LINE, at any level
+TRACE_LINE = re.compile(rb"\{(?P<process>[^}]*)\}\{\d+\}: \[(?P<module>[^\]]*)\] .*?\((?P<level>[A-Z]+)\): (?P<message>.*)")
+LINE_TIME = re.compile(rb"^(\d{4})[/-](\d\d)[/-](\d\d)[ T](\d\d):(\d\d):(\d\d)(\.\d+)?\s*")
+
+# Lines written to the index per batch
+BATCH_SIZE = 10000
+# Decompressed store chunks kept while reading the lines of a query back
+CHUNK_CACHE = 8
+
+
+def line_terms(text):
+    '''
+    :param text: Text of a line
+    :return: Set of the terms of the line, lower case
+    '''
+    terms = set()
+    for term in TERM.findall(text.lower()):
+        if len(term) > MAX_TERM_LENGTH:
+            continue
+        terms.add(term)
+        if term != "_" and not term.isalnum():
+            terms.update(part for part in TERM_PART.findall(term) if not part.isdigit())
+    return terms
+
+
+def query_terms(words):
+    '''
+    :param words: Query words, a word ending in * is a prefix
+    :return: List of (term, is prefix)
+    '''
+    terms = []
+    for word in words:
+        prefix = word.endswith("*")
+        found = TERM.findall(word.rstrip("*").lower())
+        for index, term in enumerate(found):
+            terms.append((term, prefix and index == len(found) - 1))
+    return terms
+
+
+def level_number(level):
+    '''
+    :param level: Level name, e.g. "ERR"
+    :return: Level number
+    '''
+    try:
+        return LEVELS.index(level.upper())
+    except ValueError:
+        raise argparse.ArgumentTypeError("{} is not one of {}".format(level, ", ".join(LEVELS)))
+
+
+def parse_time(value):
+    '''
+    :param value: Epoch seconds, or a UTC date "YYYY-MM-DD" with an optional " HH:MM" or " HH:MM:SS"
+    :return: Epoch seconds
+    '''
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for date_format in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return float(calendar.timegm(time.strptime(value, date_format)))
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError("{} is neither epoch seconds nor YYYY-MM-DD [HH:MM[:SS]]".format(value))
+
+
+def text_line_fields(line, default_process):
+    '''
+    :param line: Text line without line end
+    :return: (time or None, process, level number or None, text to take the terms from)
+    '''
+    text = line
+    when = None
+    match = LINE_TIME.match(line)
+    if match is not None:
+        when = calendar.timegm(tuple(int(group) for group in match.groups()[:6])) + float(match.group(7) or 0)
+        text = line[match.end():]
+    match = TRACE_LINE.search(text)
+    if match is None:
+        return when, default_process, None, text.decode("utf-8", "replace")
+    process = match.group("process").decode("utf-8", "replace").split("_R")[0] or default_process
+    level_name = match.group("level").decode("ascii").replace("ERROR", "ERR")
+    level = LEVELS.index(level_name) if level_name in LEVELS else None
+    # The UUID, ra and TID fields of the line are left out, every line has them
+    text = b" ".join((match.group("module"), match.group("level"), match.group("message")))
+    return when, process, level, text.decode("utf-8", "replace")
+
+
+class LogIndex(object):
+    '''
+    Inverted index of the lines of the collections of an ArchiveStore.
+    '''
+
+    def __init__(self, db_file=dnac_config.LOG_INDEX_DB, store=dnac_config.ARCHIVE_STORE):
+        '''
+        :param db_file: Path of the SQLite file. Configured via dnac_config.LOG_INDEX_DB.
+        :param store: Store directory the collections are read from. Configured via dnac_config.ARCHIVE_STORE.
+        '''
+        self.store = ArchiveStore(store)
+        self.db = sqlite3.connect(db_file)
+        self.db.executescript(SCHEMA)
+        if "compressed" not in [column[1] for column in self.db.execute("PRAGMA table_info(member)")]:
+            # Index written before gzip compressed members were indexed, their offsets are all uncompressed
+            self.db.execute("ALTER TABLE member ADD COLUMN compressed INTEGER DEFAULT 0")
+            self.db.commit()
+        self._terms = {}
+        self._sources = {}
+        self._manifests = {}
+        self._chunks = collections.OrderedDict()
+
+    def close(self):
+        self.db.close()
+
+    def _term_id(self, term):
+        term_id = self._terms.get(term)
+        if term_id is None:
+            self.db.execute("INSERT OR IGNORE INTO term (term) VALUES (?)", (term,))
+            term_id = self._terms[term] = self.db.execute("SELECT id FROM term WHERE term = ?", (term,)).fetchone()[0]
+        return term_id
+
+    def _source_id(self, device, process):
+        source_id = self._sources.get((device, process))
+        if source_id is None:
+            self.db.execute("INSERT OR IGNORE INTO source (device, process) VALUES (?, ?)", (device, process))
+            source_id = self._sources[(device, process)] = self.db.execute(
+                "SELECT id FROM source WHERE device = ? AND process = ?", (device, process)).fetchone()[0]
+        return source_id
+
+    def _member_lines(self, fileobj, default_process):
+        '''
+        Yield (time, process, level, offset, length, text to take the terms from, bytes of the line) for the
+        lines of a text member; the time is None for lines without a time of their own. Binary members,
+        e.g. trace files the device did not decode, have no lines.
+        :param fileobj: Uncompressed content of the member
+        '''
+        sample = fileobj.read(4096)
+        if b"\0" in sample:
+            return
+        offset = 0
+        # The sample is completed to a whole line, the rest of the member is read line by line
+        for line in itertools.chain((sample + fileobj.readline()).splitlines(True), fileobj):
+            content = line.rstrip(b"\r\n")
+            if content.strip():
+                when, process, level, text = text_line_fields(content, default_process)
+                yield when, process, level, offset, len(content), text, content
+            offset += len(line)
+
+    def _index_collection(self, collection):
+        '''
+        Index the lines of one collection in one transaction.
+        :return: Number of lines added to the index
+        '''
+        manifest = self.store.load_manifest(collection)
+        device = manifest["device"]
+        cursor = self.db.execute("INSERT INTO collection (path, device, process, timestamp, indexed_at) "
+                                 "VALUES (?, ?, ?, ?, ?)", (os.path.relpath(collection, self.store.root), device,
+                                                            manifest["process"], manifest["timestamp"], time.time()))
+        collection_id = cursor.lastrowid
+        added = 0
+        postings = []
+        term_counts = collections.Counter()
+        for position, member in enumerate(manifest["members"]):
+            member_id = None
+            with self.store.open_member(member) as member_file:
+                # Rotated trace files and logs (*.gz) are indexed by their uncompressed content
+                fileobj = decompressed(member_file)
+                for when, process, level, offset, length, text, content in self._member_lines(
+                        fileobj, manifest["process"]):
+                    if member_id is None:
+                        member_id = self.db.execute(
+                            "INSERT INTO member (collection_id, position, name, compressed) VALUES (?, ?, ?, ?)",
+                            (collection_id, position, member["name"], int(fileobj is not member_file))).lastrowid
+                    source_id = self._source_id(device, process)
+                    if when is None:
+                        # Lines without a time of their own take the time of the collection and are told
+                        # apart by where they are, so repeated ones are all indexed
+                        when = manifest["timestamp"]
+                        content = "{}@{}:".format(member["name"], offset).encode("utf-8") + content
+                    digest = int.from_bytes(hashlib.sha1(content).digest()[:8], "big", signed=True)
+                    cursor = self.db.execute("INSERT OR IGNORE INTO line (source_id, time, level, member_id, offset, "
+                                             "length, digest) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                             (source_id, when, level, member_id, offset, length, digest))
+                    if not cursor.rowcount:
+                        continue  # Indexed from an earlier collection of the device
+                    line_id = cursor.lastrowid
+                    term_ids = [self._term_id(term) for term in line_terms(text)]
+                    term_counts.update(term_ids)
+                    postings.extend((term_id, when, line_id, source_id) for term_id in term_ids)
+                    added += 1
+                    if len(postings) >= BATCH_SIZE:
+                        self.db.executemany("INSERT OR IGNORE INTO posting (term_id, time, line_id, source_id) "
+                                            "VALUES (?, ?, ?, ?)", postings)
+                        postings = []
+        self.db.executemany("INSERT OR IGNORE INTO posting (term_id, time, line_id, source_id) VALUES (?, ?, ?, ?)",
+                            postings)
+        # Posting counts tell the query which term is the rarest
+        self.db.executemany("UPDATE term SET postings = postings + ? WHERE id = ?",
+                            [(count, term_id) for term_id, count in term_counts.items()])
+        self.db.commit()
+        return added
+
+    def update(self):
+        '''
+        Index the collections of the store that are not indexed yet.
+        :return: (collections indexed, lines added)
+        '''
+        indexed = set(row[0] for row in self.db.execute("SELECT path FROM collection"))
+        collections_indexed = lines = 0
+        for collection in self.store.collections():
+            if os.path.relpath(collection, self.store.root) in indexed:
+                continue
+            try:
+                added = self._index_collection(collection)
+            except (IOError, OSError, EOFError, ValueError, KeyError, zlib.error) as e:
+                self.db.rollback()
+                # Terms and sources first seen in this collection were rolled back with it
+                self._terms.clear()
+                self._sources.clear()
+                logger.error("Something wrong, cannot index %s: %s", collection, e)
+                continue
+            logger.info("Indexed %s: %d new lines", collection, added)
+            collections_indexed += 1
+            lines += added
+        return collections_indexed, lines
+
+    def search(self, words=(), devices=None, processes=None, since=None, until=None, max_level=None, limit=100):
+        '''
+        Find the lines that have all query terms, from the index alone.
+        :param words: Query words, see query_terms. Without words every line of the other filters matches.
+        :param devices: List of devices, default all
+        :param processes: List of processes, default all
+        :param since: Epoch seconds of the earliest line
+        :param until: Epoch seconds of the latest line
+        :param max_level: Least severe level, lines without a level are left out when given
+        :param limit: Most lines returned, the earliest ones
+        :return: (number of matching lines, list of dicts with time, level, device, process, collection,
+                  position, compressed, offset and length of the first limit lines in time order)
+        '''
+        filters = []
+        params = []
+        if since is not None:
+            filters.append("time >= ?")
+            params.append(since)
+        if until is not None:
+            filters.append("time <= ?")
+            params.append(until)
+        if devices or processes:
+            sources = []
+            if devices:
+                sources.append("device IN (" + ", ".join("?" * len(devices)) + ")")
+                params.extend(devices)
+            if processes:
+                sources.append("process IN (" + ", ".join("?" * len(processes)) + ")")
+                params.extend(processes)
+            filters.append("source_id IN (SELECT id FROM source WHERE " + " AND ".join(sources) + ")")
+
+        conditions = []
+        where_params = []
+        terms = []
+        for term, prefix in query_terms(words):
+            if prefix:
+                selection, term_params = "term >= ? AND term < ?", [term, term + "\uffff"]
+            else:
+                selection, term_params = "term = ?", [term]
+            count = self.db.execute("SELECT SUM(postings) FROM term WHERE " + selection, term_params).fetchone()[0]
+            if not count:
+                return 0, []
+            terms.append((count, "term_id IN (SELECT id FROM term WHERE " + selection + ")", term_params))
+        if terms:
+            # The lines of the rarest term are checked for the other terms one by one, on the posting key
+            terms.sort(key=lambda term: term[0])
+            count, condition, term_params = terms[0]
+            # The time and source filters are applied to the postings of the rarest term
+            conditions.append("line.id IN (SELECT line_id FROM posting WHERE " + condition +
+                              "".join(" AND " + posting_filter for posting_filter in filters) + ")")
+            where_params.extend(term_params + params)
+            for count, condition, term_params in terms[1:]:
+                conditions.append("EXISTS (SELECT 1 FROM posting WHERE " + condition +
+                                  " AND time = line.time AND line_id = line.id)")
+                where_params.extend(term_params)
+        else:
+            conditions.extend("line." + condition for condition in filters)
+            where_params.extend(params)
+        if max_level is not None:
+            conditions.append("line.level <= ?")
+            where_params.append(max_level)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+
+        total = self.db.execute("SELECT COUNT(*) FROM line" + where, where_params).fetchone()[0]
+        rows = self.db.execute("SELECT line.time, line.level, source.device, source.process, collection.path, "
+                               "member.position, member.compressed, line.offset, line.length FROM line "
+                               "JOIN source ON source.id = line.source_id "
+                               "JOIN member ON member.id = line.member_id "
+                               "JOIN collection ON collection.id = member.collection_id" + where +
+                               " ORDER BY line.time, line.id LIMIT ?", where_params + [limit]).fetchall()
+        keys = ("time", "level", "device", "process", "collection", "position", "compressed", "offset", "length")
+        return total, [dict(zip(keys, row)) for row in rows]
+
+    def _chunk(self, digest):
+        data = self._chunks.pop(digest, None)
+        if data is None:
+            with gzip.open(self.store.blob_path(digest), "rb") as f:
+                data = f.read()
+            if len(self._chunks) >= CHUNK_CACHE:
+                self._chunks.popitem(last=False)
+        self._chunks[digest] = data
+        return data
+
+    def _read_compressed(self, member, spans):
+        '''
+        :param member: gzip compressed member, the offsets are ones of its uncompressed content
+        :param spans: List of (offset, size)
+        :return: List of the bytes of the spans, the member is decompressed once for all of them
+        '''
+        data = {}
+        # A gzip stream can only be skipped by decompressing it, so the spans are read in one pass from the start
+        with self.store.open_member(member) as member_file, gzip.GzipFile(fileobj=member_file, mode="rb") as fileobj:
+            for offset, size in sorted(set(spans)):
+                fileobj.seek(offset)
+                data[(offset, size)] = fileobj.read(size)
+        return [data[span] for span in spans]
+
+    def _read(self, member, offset, size):
+        '''
+        :return: size bytes of the member from offset, only the chunks holding them are read
+        '''
+        # Every chunk but the last one of a member is CHUNK_SIZE bytes
+        index, skip = divmod(offset, ArchiveStore.CHUNK_SIZE)
+        data = b""
+        while len(data) < skip + size and index < len(member["chunks"]):
+            data += self._chunk(member["chunks"][index])
+            index += 1
+        return data[skip:skip + size]
+
+    def fetch_all(self, hits):
+        '''
+        Read lines found by search back from the store, each member once.
+        :param hits: List of dicts returned by search
+        :return: List of the texts of the lines, in the order of hits
+        '''
+        by_member = collections.defaultdict(list)
+        for number, hit in enumerate(hits):
+            by_member[(hit["collection"], hit["position"], hit["compressed"])].append(number)
+        texts = [None] * len(hits)
+        for (path, position, compressed), numbers in by_member.items():
+            collection = os.path.join(self.store.root, path)
+            if collection not in self._manifests:
+                self._manifests[collection] = self.store.load_manifest(collection)
+            member = self._manifests[collection]["members"][position]
+            spans = [(hits[number]["offset"], hits[number]["length"]) for number in numbers]
+            if compressed:
+                lines = self._read_compressed(member, spans)
+            else:
+                lines = [self._read(member, offset, size) for offset, size in spans]
+            for number, line in zip(numbers, lines):
+                texts[number] = line.decode("utf-8", "replace")
+        return texts
+
+    def fetch(self, hit):
+        '''
+        Read a line found by search back from the store.
+        :param hit: dict returned by search
+        :return: Text of the line
+        '''
+        return self.fetch_all([hit])[0]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Index the collected logs and query the index")
+    parser.add_argument("mode", choices=("update", "query"))
+    parser.add_argument("words", nargs="*", help="query mode: terms every line must have")
+    parser.add_argument("--db", default=dnac_config.LOG_INDEX_DB, help="index file (default %(default)s)")
+    parser.add_argument("--store", default=dnac_config.ARCHIVE_STORE, help="store directory (default %(default)s)")
+    parser.add_argument("--watch", type=int, metavar="SECONDS",
+                        help="update mode: keep running and index new collections every SECONDS")
+    parser.add_argument("--device", action="append", help="query mode: only lines of this device, repeatable")
+    parser.add_argument("--process", action="append", help="query mode: only lines of this process, repeatable")
+    parser.add_argument("--since", type=parse_time, help="query mode: earliest time, epoch or UTC YYYY-MM-DD [HH:MM[:SS]]")
+    parser.add_argument("--until", type=parse_time, help="query mode: latest time, epoch or UTC YYYY-MM-DD [HH:MM[:SS]]")
+    parser.add_argument("--level", type=level_number, help="query mode: least severe level, e.g. ERR")
+    parser.add_argument("--limit", type=int, default=100, help="query mode: lines printed (default %(default)s)")
+    parser.add_argument("--no-fetch", action="store_true",
+                        help="query mode: print where the lines are instead of reading them from the store")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only log warnings and errors")
+    # Query words may come before and after the options
+    args = parser.parse_intermixed_args()
+
+    setup_logging(args.quiet)
+    index = LogIndex(args.db, args.store)
+    try:
+        if args.mode == "update":
+            while True:
+                collections_indexed, lines = index.update()
+                logger.info("%d collections indexed, %d new lines", collections_indexed, lines)
+                if not args.watch:
+                    break
+                time.sleep(args.watch)
+        else:
+            started = time.time()
+            total, hits = index.search(args.words, args.device, args.process, args.since, args.until,
+                                       args.level, args.limit)
+            searched = time.time()
+            if args.no_fetch:
+                for hit in hits:
+                    print("{} {} {} {}#{}@{}".format(hit["time"], hit["device"], hit["process"], hit["collection"],
+                                                     hit["position"], hit["offset"]))
+            else:
+                for hit, text in zip(hits, index.fetch_all(hits)):
+                    print("{} {}: {}".format(hit["device"], hit["process"], text))
+            logger.info("%d matching lines, %d shown, search %.1f ms, fetch %.1f ms", total, len(hits),
+                        (searched - started) * 1000, (time.time() - searched) * 1000)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        index.close()
@@ -0,0 +1,210 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+"""
+This script records where a run spends its time.
+Every DNAC API call is recorded by DnacClient per method and path template (IDs and addresses in the
+path replaced by {id}): a latency histogram, the status codes, bytes sent and received and retries.
+Named steps of the workflow are timed with "with metrics.step(name):".
+At the end of a run the metrics are written as a Prometheus text file or as a JSON summary.
+"""
+
+import bisect
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Path segments that identify one object: UUIDs, numbers, IP addresses
+ID_SEGMENT = re.compile(r"^(?=.*\d)[0-9a-fA-F.:-]+$")
+
+
+def path_template(api):
+    '''
+    :param api: dnac api without prefix, e.g. network-device/ip-address/10.1.1.1
+    :return: The api with object IDs replaced by {id}, e.g. network-device/ip-address/{id}
+    '''
+    return "/".join("{id}" if ID_SEGMENT.match(segment) else segment for segment in api.split("?", 1)[0].split("/"))
+
+
+class CallStats(object):
+    '''
+    Aggregated calls of one method and path template.
+    '''
+    __slots__ = ("buckets", "count", "seconds", "max_seconds", "statuses", "retries", "bytes_sent", "bytes_received")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.statuses = {}
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def percentile(self, fraction):
+        '''
+        :return: Upper bound of the bucket holding the given fraction of the calls, max_seconds for the last bucket
+        '''
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else self.max_seconds
+        return 0.0
+
+
+class Metrics(object):
+    '''
+    Thread safe recorder of API calls and step timings.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = {}   # (method, path template) -> CallStats
+            self.steps = {}   # step name -> [count, seconds]
+
+    def _stats(self, method, api):
+        key = (method, path_template(api))
+        stats = self.calls.get(key)
+        if stats is None:
+            stats = self.calls[key] = CallStats()
+        return stats
+
+    def observe_call(self, method, api, status, seconds, bytes_sent=0, bytes_received=0, retries=0):
+        '''
+        Record one API call.
+        :param method: HTTP method
+        :param api: dnac api without prefix
+        :param status: Final status code, or "error" when no response was received
+        :param seconds: Duration including pacing and retries
+        :param bytes_sent: Size of the request body
+        :param bytes_received: Size of the response body
+        :param retries: Attempts after the first one
+        '''
+        with self._lock:
+            stats = self._stats(method, api)
+            stats.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            stats.count += 1
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.statuses[str(status)] = stats.statuses.get(str(status), 0) + 1
+            stats.retries += retries
+            stats.bytes_sent += bytes_sent
+            stats.bytes_received += bytes_received
+
+    def add_bytes_received(self, method, api, bytes_received):
+        '''
+        Add body bytes of a streamed response, which are only known once it was read.
+        '''
+        with self._lock:
+            self._stats(method, api).bytes_received += bytes_received
+
+    @contextmanager
+    def step(self, name):
+        '''
+        Time a step of the workflow: "with metrics.step("commit"):". Steps run more than once add up.
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                step = self.steps.setdefault(name, [0, 0.0])
+                step[0] += 1
+                step[1] += seconds
+
+    def summary(self):
+        '''
+        :return: JSON serializable dict with the calls per endpoint and the step timings
+        '''
+        with self._lock:
+            api = []
+            for (method, path), stats in sorted(self.calls.items(), key=lambda item: item[0][1]):
+                api.append({"method": method, "path": path, "calls": stats.count, "statuses": dict(stats.statuses),
+                            "retries": stats.retries, "bytes_sent": stats.bytes_sent,
+                            "bytes_received": stats.bytes_received,
+                            "latency": {"total": stats.seconds, "mean": stats.seconds / stats.count if stats.count else 0,
+                                        "p50": stats.percentile(0.5), "p95": stats.percentile(0.95),
+                                        "p99": stats.percentile(0.99), "max": stats.max_seconds}})
+            steps = dict((name, {"count": count, "seconds": seconds}) for name, (count, seconds) in self.steps.items())
+            return {"api": api, "steps": steps}
+
+    def to_prometheus(self):
+        '''
+        :return: The metrics in the Prometheus text exposition format
+        '''
+        lines = []
+
+        def family(name, kind, text):
+            lines.append("# HELP " + name + " " + text)
+            lines.append("# TYPE " + name + " " + kind)
+
+        def labels(**values):
+            return "{" + ",".join('{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                                  for key, value in sorted(values.items())) + "}"
+
+        with self._lock:
+            calls = sorted(self.calls.items(), key=lambda item: (item[0][1], item[0][0]))
+            family("dnac_api_request_duration_seconds", "histogram", "Duration of DNAC API calls including pacing and retries")
+            for (method, path), stats in calls:
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), stats.buckets):
+                    cumulative += count
+                    lines.append("dnac_api_request_duration_seconds_bucket" + labels(method=method, path=path, le=bound)
+                                 + " " + str(cumulative))
+                lines.append("dnac_api_request_duration_seconds_sum" + labels(method=method, path=path) + " " + repr(stats.seconds))
+                lines.append("dnac_api_request_duration_seconds_count" + labels(method=method, path=path) + " " + str(stats.count))
+            family("dnac_api_requests_total", "counter", "DNAC API calls by final status code")
+            for (method, path), stats in calls:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append("dnac_api_requests_total" + labels(method=method, path=path, status=status) + " " + str(count))
+            for name, attribute, text in (("dnac_api_retries_total", "retries", "Retried attempts of DNAC API calls"),
+                                          ("dnac_api_request_bytes_total", "bytes_sent", "Request body bytes sent to DNAC"),
+                                          ("dnac_api_response_bytes_total", "bytes_received", "Response body bytes received from DNAC")):
+                family(name, "counter", text)
+                for (method, path), stats in calls:
+                    lines.append(name + labels(method=method, path=path) + " " + str(getattr(stats, attribute)))
+            family("dnac_step_duration_seconds", "summary", "Duration of the workflow steps")
+            for name, (count, seconds) in sorted(self.steps.items()):
+                lines.append("dnac_step_duration_seconds_sum" + labels(step=name) + " " + repr(seconds))
+                lines.append("dnac_step_duration_seconds_count" + labels(step=name) + " " + str(count))
+        return "\n".join(lines) + "\n"
+
+    def write(self, file_name):
+        '''
+        Write the metrics, as a JSON summary if file_name ends with .json and in the Prometheus text format otherwise.
+        '''
+        with open(file_name, "w") as f:
+            if file_name.endswith(".json"):
+                json.dump(self.summary(), f, indent=2, sort_keys=True)
+            else:
+                f.write(self.to_prometheus())
+
+
+# Metrics shared by all helpers of this process
+metrics = Metrics()
@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+"""
+This script is a local stand-in for a DNAC cluster, to measure and test the scripts without touching production.
+It implements the API calls this project makes: auth/token, the device inventory, template projects,
+templates, template versions, template deployment and deployment status, and task status.
+State is kept in memory. Latency, inventory and catalog size, HTTP 503 failures, HTTP 429 rate limiting
+and the duration and outcome of deployments are configurable.
+It speaks plain HTTP, point the scripts at it with DNAC_SCHEME = "http", DNAC_IP and DNAC_PORT.
+
+Usage:
+  python3 dnac_mock_server.py --port 8080 --devices 10000 --latency 0.02
+"""
+
+from dnac_api_helper import setup_logging
+import argparse
+import base64
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Routes as (method, regex on the path below /api/, route name used for the call counters)
+ROUTES = [
+    ("POST", r"system/v1/auth/token", "auth/token"),
+    ("GET", r"v1/network-device/count", "network-device/count"),
+    ("GET", r"v1/network-device/ip-address/(?P<ip>[^/]+)", "network-device/ip-address/{ip}"),
+    ("GET", r"v1/network-device/(?P<start>\d+)/(?P<count>\d+)", "network-device/{start}/{count}"),
+    ("GET", r"v1/network-device", "network-device"),
+    ("GET", r"v1/template-programmer/project", "template-programmer/project"),
+    ("POST", r"v1/template-programmer/project", "template-programmer/project"),
+    ("POST", r"v1/template-programmer/project/(?P<project_id>[^/]+)/template", "template-programmer/project/{id}/template"),
+    ("GET", r"v1/template-programmer/template", "template-programmer/template"),
+    ("PUT", r"v1/template-programmer/template", "template-programmer/template"),
+    ("POST", r"v1/template-programmer/template/version", "template-programmer/template/version"),
+    ("GET", r"v1/template-programmer/template/version/(?P<template_id>[^/]+)", "template-programmer/template/version/{id}"),
+    ("POST", r"v1/template-programmer/template/deploy", "template-programmer/template/deploy"),
+    ("GET", r"v1/template-programmer/template/deploy/status/(?P<deployment_id>[^/]+)",
+     "template-programmer/template/deploy/status/{id}"),
+    ("GET", r"v1/template-programmer/template/(?P<template_id>[^/]+)", "template-programmer/template/{id}"),
+    ("GET", r"v1/task/(?P<task_id>[^/]+)", "task/{id}"),
+]
+ROUTES = [(method, re.compile(pattern + "$"), name) for method, pattern, name in ROUTES]
+
+
+def device_ip(index):
+    '''
+    :return: Management IP of the mock device with the given index, 10.0.0.1 onwards
+    '''
+    index += 1
+    return "10.{}.{}.{}".format((index >> 16) & 255, (index >> 8) & 255, index & 255)
+
+
+def make_token(lifetime=3600):
+    '''
+    :return: Unsigned JWT with the "exp" claim DnacClient reads
+    '''
+    def encode(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode("utf-8")).decode("ascii").rstrip("=")
+    return encode({"alg": "none"}) + "." + encode({"exp": int(time.time() + lifetime)}) + ".mock"
+
+
+class MockDnac(object):
+    '''
+    In-memory state and behaviour of the mock cluster, independent of HTTP.
+    '''
+
+    def __init__(self, devices=100, catalog_size=0, latency=0.0, failure_rate=0.0, rate_limit=None,
+                 deploy_time=0.0, deploy_failure_rate=0.0, seed=None):
+        '''
+        :param devices: Number of devices in the inventory
+        :param catalog_size: Number of unrelated template projects, each with one template, already present
+        :param latency: Seconds every call takes
+        :param failure_rate: Fraction of calls answered with HTTP 503
+        :param rate_limit: Calls per second accepted, calls beyond it are answered with HTTP 429 and Retry-After
+        :param deploy_time: Seconds a deployment stays IN_PROGRESS
+        :param deploy_failure_rate: Fraction of deployments that end with status FAILURE
+        :param seed: Seed of the random failures, for repeatable runs
+        '''
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rate_limit = rate_limit
+        self.deploy_time = deploy_time
+        self.deploy_failure_rate = deploy_failure_rate
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.deployed_devices = 0
+        self._lock = threading.Lock()
+        self._window = []
+        self.devices = []
+        self.devices_by_ip = {}
+        self.add_devices(devices)
+        self.projects = {}
+        self.templates = {}
+        self.versions = {}   # version ID -> template ID
+        self.deployments = {}
+        for index in range(catalog_size):
+            project_id = self._new_project("Project-{}".format(index))
+            self._new_template(project_id, {"name": "Template-{}".format(index), "templateContent": ""})
+
+    def add_devices(self, count):
+        '''
+        Add devices to the inventory, e.g. to test the reconciliation of new devices.
+        '''
+        now_ms = int(time.time() * 1000)
+        with self._lock:
+            for index in range(len(self.devices), len(self.devices) + count):
+                device = {"id": str(uuid.UUID(int=index + 1)), "instanceUuid": str(uuid.UUID(int=index + 1)),
+                          "managementIpAddress": device_ip(index), "hostname": "switch-{:05d}".format(index + 1),
+                          "serialNumber": "FOC{:08d}".format(index + 1), "family": "Switches and Hubs",
+                          "platformId": "C9300-48P", "lastUpdateTime": now_ms}
+                self.devices.append(device)
+                self.devices_by_ip[device["managementIpAddress"]] = device
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls.clear()
+            self.deployed_devices = 0
+
+    def _new_project(self, name):
+        project_id = str(uuid.uuid4())
+        self.projects[project_id] = {"id": project_id, "name": name, "templates": []}
+        return project_id
+
+    def _new_template(self, project_id, body):
+        template_id = str(uuid.uuid4())
+        template = dict(body, id=template_id, projectId=project_id,
+                        projectName=self.projects[project_id]["name"], versionsInfo=[])
+        self.templates[template_id] = template
+        self.projects[project_id]["templates"].append({"id": template_id, "name": template["name"]})
+        return template_id
+
+    def _task(self):
+        return {"response": {"taskId": str(uuid.uuid4()), "url": "/api/v1/task/"}, "version": "1.0"}
+
+    def _throttled(self):
+        '''
+        Sliding one second window of accepted calls.
+        '''
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        while self._window and self._window[0] <= now - 1:
+            self._window.pop(0)
+        if len(self._window) >= self.rate_limit:
+            return True
+        self._window.append(now)
+        return False
+
+    def handle(self, method, path, query, body, token):
+        '''
+        Answer one API call.
+        :param method: HTTP method
+        :param path: URL path below /api/
+        :param query: dict of query parameter to value
+        :param body: Decoded JSON body or None
+        :param token: X-Auth-Token header or None
+        :return: (status code, JSON body, dict of extra headers)
+        '''
+        for route_method, pattern, name in ROUTES:
+            match = pattern.match(path)
+            if match and route_method == method:
+                break
+        else:
+            return 404, {"response": {"errorCode": "NOT_FOUND", "message": method + " /api/" + path}}, {}
+
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls[method + " " + name] += 1
+            if self._throttled():
+                return 429, {"response": {"errorCode": "TOO_MANY_REQUESTS"}}, {"Retry-After": "1"}
+            if self.failure_rate and self.random.random() < self.failure_rate:
+                return 503, {"response": {"errorCode": "SERVICE_UNAVAILABLE"}}, {}
+            if name == "auth/token":
+                return 200, {"Token": make_token()}, {}
+            if token is None:
+                return 401, {"response": {"errorCode": "UNAUTHORIZED"}}, {}
+            handler = getattr(self, "_" + re.sub(r"\W+", "_", method + " " + name.replace("{", "").replace("}", "")))
+            status, data = handler(body=body, query=query, **match.groupdict())
+            return status, data, {}
+
+    # Inventory
+
+    def _GET_network_device_count(self, **kwargs):
+        return 200, {"response": len(self.devices), "version": "1.0"}
+
+    def _GET_network_device_ip_address_ip(self, ip, **kwargs):
+        if ip not in self.devices_by_ip:
+            return 404, {"response": {"errorCode": "Not found", "message": "No device with ip " + ip}}
+        return 200, {"response": self.devices_by_ip[ip], "version": "1.0"}
+
+    def _GET_network_device_start_count(self, start, count, **kwargs):
+        start = int(start) - 1
+        return 200, {"response": self.devices[start:start + int(count)], "version": "1.0"}
+
+    def _GET_network_device(self, query, **kwargs):
+        start = int(query.get("offset", 1)) - 1
+        limit = int(query.get("limit", 500))
+        return 200, {"response": self.devices[start:start + limit], "version": "1.0"}
+
+    # Template programmer
+
+    def _GET_template_programmer_project(self, query, **kwargs):
+        projects = list(self.projects.values())
+        if "name" in query:
+            projects = [project for project in projects if project["name"] == query["name"]]
+        return 200, projects
+
+    def _POST_template_programmer_project(self, body, **kwargs):
+        self._new_project(body["name"])
+        return 202, self._task()
+
+    def _POST_template_programmer_project_id_template(self, project_id, body, **kwargs):
+        if project_id not in self.projects:
+            return 404, {"response": {"errorCode": "NOT_FOUND", "message": "No project " + project_id}}
+        self._new_template(project_id, body)
+        return 202, self._task()
+
+    def _GET_template_programmer_template(self, **kwargs):
+        return 200, [{"name": template["name"], "templateId": template_id, "projectId": template["projectId"],
+                      "projectName": template["projectName"], "versionsInfo": template["versionsInfo"]}
+                     for template_id, template in self.templates.items()]
+
+    def _GET_template_programmer_template_id(self, template_id, **kwargs):
+        if template_id not in self.templates:
+            return 404, {"response": {"errorCode": "NOT_FOUND", "message": "No template " + template_id}}
+        return 200, self.templates[template_id]
+
+    def _PUT_template_programmer_template(self, body, **kwargs):
+        if body.get("id") not in self.templates:
+            return 404, {"response": {"errorCode": "NOT_FOUND", "message": "No template " + str(body.get("id"))}}
+        template = self.templates[body["id"]]
+        template["templateContent"] = body.get("templateContent", "")
+        template["templateParams"] = body.get("templateParams", [])
+        return 202, self._task()
+
+    def _POST_template_programmer_template_version(self, body, **kwargs):
+        template = self.templates.get(body.get("templateId"))
+        if template is None:
+            return 404, {"response": {"errorCode": "NOT_FOUND", "message": "No template " + str(body.get("templateId"))}}
+        version = len(template["versionsInfo"]) + 1
+        version_id = str(uuid.uuid4())
+        template["versionsInfo"].append({"id": version_id, "version": str(version),
+                                         "description": body.get("comments", ""), "versionTime": int(time.time() * 1000)})
+        self.versions[version_id] = template["id"]
+        return 202, self._task()
+
+    def _GET_template_programmer_template_version_id(self, template_id, **kwargs):
+        template = self.templates.get(template_id)
+        if template is None:
+            return 200, []
+        return 200, [{"name": template["name"], "projectName": template["projectName"],
+                      "versionsInfo": template["versionsInfo"]}]
+
+    def _POST_template_programmer_template_deploy(self, body, **kwargs):
+        if body.get("templateId") not in self.versions:
+            return 404, {"response": {"errorCode": "NOT_FOUND", "message": "No template version " + str(body.get("templateId"))}}
+        targets = body.get("targetInfo") or []
+        deployment_id = str(uuid.uuid4())
+        failed = self.deploy_failure_rate and self.random.random() < self.deploy_failure_rate
+        self.deployments[deployment_id] = {"devices": [target["id"] for target in targets],
+                                           "started": time.time(), "outcome": "FAILURE" if failed else "SUCCESS"}
+        self.deployed_devices += len(targets)
+        return 202, {"deploymentId": deployment_id, "startTime": "", "status": "INIT"}
+
+    def _GET_template_programmer_template_deploy_status_id(self, deployment_id, **kwargs):
+        deployment = self.deployments.get(deployment_id)
+        if deployment is None:
+            return 404, {"response": {"errorCode": "NOT_FOUND", "message": "No deployment " + deployment_id}}
+        status = deployment["outcome"] if time.time() >= deployment["started"] + self.deploy_time else "IN_PROGRESS"
+        # Status 202 as expected by check_status
+        return 202, {"deploymentId": deployment_id, "status": status,
+                     "devices": [{"deviceId": device, "status": status} for device in deployment["devices"]]}
+
+    def _GET_task_id(self, task_id, **kwargs):
+        return 200, {"response": {"id": task_id, "isError": False, "progress": "Done",
+                                  "endTime": int(time.time() * 1000)}, "version": "1.0"}
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    '''
+    HTTP front end of the MockDnac of the server.
+    '''
+    protocol_version = "HTTP/1.1"
+
+    def _handle(self):
+        url = urlsplit(self.path)
+        if not url.path.startswith("/api/"):
+            self._send(404, {"response": {"errorCode": "NOT_FOUND"}}, {})
+            return
+        query = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+        length = int(self.headers.get("Content-Length") or 0)
+        body = None
+        if length:
+            try:
+                body = json.loads(self.rfile.read(length).decode("utf-8"))
+            except ValueError:
+                self._send(400, {"response": {"errorCode": "BAD_REQUEST", "message": "Invalid JSON"}}, {})
+                return
+        status, data, headers = self.server.mock.handle(self.command, url.path[len("/api/"):], query, body,
+                                                        self.headers.get("X-Auth-Token"))
+        self._send(status, data, headers)
+
+    def _send(self, status, data, headers):
+        payload = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = _handle
+
+    def log_message(self, format, *args):
+        logger.debug("%s " + format, self.address_string(), *args)
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that go away mid-request are normal when a benchmark run ends
+        logger.debug("Connection from %s failed", client_address, exc_info=True)
+
+
+def start_mock_server(mock, host="127.0.0.1", port=0):
+    '''
+    Serve a MockDnac in a background thread.
+    :param mock: MockDnac to serve
+    :param host: Address to listen on
+    :param port: Port to listen on, 0 picks a free one
+    :return: The server, server.server_address holds the address it listens on. Stop it with server.shutdown().
+    '''
+    server = MockServer((host, port), MockRequestHandler)
+    server.mock = mock
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local mock DNAC cluster")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default %(default)s)")
+    parser.add_argument("--port", type=int, default=8080, help="port to listen on (default %(default)s)")
+    parser.add_argument("--devices", type=int, default=100, help="devices in the inventory (default %(default)s)")
+    parser.add_argument("--catalog-size", type=int, default=0, help="unrelated template projects already present")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds every call takes")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of calls answered with HTTP 503")
+    parser.add_argument("--rate-limit", type=int, help="calls per second accepted before answering HTTP 429")
+    parser.add_argument("--deploy-time", type=float, default=0.0, help="seconds a deployment stays IN_PROGRESS")
+    parser.add_argument("--deploy-failure-rate", type=float, default=0.0, help="fraction of deployments that fail")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every call")
+    args = parser.parse_args()
+
+    setup_logging(verbose=args.verbose)
+    mock = MockDnac(args.devices, args.catalog_size, args.latency, args.failure_rate, args.rate_limit,
+                    args.deploy_time, args.deploy_failure_rate)
+    server = start_mock_server(mock, args.host, args.port)
+    logger.info("Mock DNAC listening on http://%s:%d with %d devices, first device %s",
+                args.host, server.server_address[1], args.devices, device_ip(0))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        for call, count in sorted(mock.calls.items()):
+            logger.info("%6d %s", count, call)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+"""
+This script spreads the collections of a fleet over time, so devices that were deployed together, or that
+see the same fault at the same time, do not all upload to FTP_SERVER at once.
+Every device waits collect_delay seconds before it collects, a value between 1 and COLLECT_SPREAD derived
+from a hash of its UUID. The delay of a device does not depend on the rest of the fleet, so adding devices
+does not change, and redeploy, the delays of the others.
+Run as a script it reports the peak number of concurrent uploads to expect for a fleet, with and without
+the delays.
+
+Usage:
+  python3 dnac_stagger.py --devices 10000 --upload-time 60
+  python3 dnac_stagger.py --inventory --spread 900       the devices of the local inventory snapshot
+"""
+
+import dnac_config
+import argparse
+import hashlib
+import random
+import uuid
+
+# Template parameter of the per-device delay
+DELAY_PARAM = "collect_delay"
+
+
+def collect_delay(device_uuid, spread=dnac_config.COLLECT_SPREAD):
+    '''
+    :param device_uuid: Device Network UUID
+    :param spread: Seconds over which the fleet is spread. Configured via dnac_config.COLLECT_SPREAD.
+    :return: Seconds, 1 to spread, the device waits before it collects
+    '''
+    digest = hashlib.sha256(device_uuid.encode("utf-8")).digest()
+    return 1 + int.from_bytes(digest[:8], "big") % spread
+
+
+def stagger_params(network_uuids, spread=dnac_config.COLLECT_SPREAD, device_params=None):
+    '''
+    Add the delay of every device to its template parameter values.
+    :param network_uuids: List of Device Network UUIDs
+    :param spread: Seconds over which the fleet is spread
+    :param device_params: Dict of Device Network UUID to parameter values, kept as they are otherwise
+    :return: Dict of Device Network UUID to parameter values including DELAY_PARAM
+    '''
+    device_params = dict(device_params or {})
+    for network_uuid in network_uuids:
+        device_params[network_uuid] = dict(device_params.get(network_uuid, {}),
+                                           **{DELAY_PARAM: str(collect_delay(network_uuid, spread))})
+    return device_params
+
+
+def peak_concurrency(start_times, duration):
+    '''
+    :param start_times: Seconds at which the uploads start
+    :param duration: Seconds every upload takes
+    :return: Largest number of uploads running at the same time
+    '''
+    # An upload that ends when another one starts does not overlap it, ends sort before starts
+    events = sorted([(start, 1) for start in start_times] + [(start + duration, -1) for start in start_times],
+                    key=lambda event: (event[0], event[1]))
+    running = peak = 0
+    for when, change in events:
+        running += change
+        peak = max(peak, running)
+    return peak
+
+
+def fleet_report(network_uuids, spread, upload_time):
+    '''
+    :return: dict with the devices, the peak concurrent uploads with and without the delays and the average
+             number of uploads running during the spread
+    '''
+    delays = [collect_delay(network_uuid, spread) for network_uuid in network_uuids]
+    return {"devices": len(delays),
+            "peak_unstaggered": peak_concurrency([0] * len(delays), upload_time),
+            "peak_staggered": peak_concurrency(delays, upload_time),
+            "mean_staggered": len(delays) * float(upload_time) / (spread + upload_time)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Report the peak concurrent uploads of a fleet with staggered collections")
+    parser.add_argument("--devices", type=int, help="fleet size, random device UUIDs are used")
+    parser.add_argument("--inventory", action="store_true",
+                        help="use the device UUIDs of the local inventory snapshot (dnac_config.INVENTORY_DB)")
+    parser.add_argument("--spread", type=int, default=dnac_config.COLLECT_SPREAD,
+                        help="seconds over which collections are spread (default %(default)s)")
+    parser.add_argument("--upload-time", type=float, default=60,
+                        help="seconds a device takes to collect and upload (default %(default)s)")
+    parser.add_argument("--trials", type=int, default=20,
+                        help="random fleets tried with --devices, the worst peak is reported (default %(default)s)")
+    args = parser.parse_args()
+
+    if args.inventory:
+        from dnac_inventory import DeviceInventory
+        inventory = DeviceInventory()
+        fleets = [sorted(inventory.get_uuids())]
+        inventory.close()
+    elif args.devices:
+        generator = random.Random(1)
+        fleets = [[str(uuid.UUID(int=generator.getrandbits(128))) for index in range(args.devices)]
+                  for trial in range(args.trials)]
+    else:
+        parser.error("give --devices or --inventory")
+
+    reports = [fleet_report(fleet, args.spread, args.upload_time) for fleet in fleets]
+    report = reports[0]
+    print("devices:                       {}".format(report["devices"]))
+    print("spread:                        {} s, {:.0f} s per upload".format(args.spread, args.upload_time))
+    print("peak uploads without stagger:  {}".format(report["peak_unstaggered"]))
+    print("peak uploads with stagger:     {}{}".format(max(r["peak_staggered"] for r in reports),
+                                                       " (worst of {} fleets)".format(len(reports)) if len(reports) > 1 else ""))
+    print("mean uploads with stagger:     {:.1f}".format(report["mean_staggered"]))
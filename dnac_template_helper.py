@@ -22,12 +22,16 @@ This file contains helper methods to
  -create a template project
  -create a template
  -commit the template
- -deploy the template
+ -deploy the template to one or many devices
+Project, template and version lookups are answered from the shared catalog in dnac_catalog.py
 """
 
 from dnac_api_helper import *
+from dnac_catalog import catalog
 import dnac_config
-import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 def create_template_project(project_name="DNAC-Templates"):
@@ -36,64 +40,47 @@ def create_template_project(project_name="DNAC-Templates"):
     :param project_name: Template Programmer Project Name. Default value is DNAC-Templates
     :return: Returns Task ID
     '''
-    try:
-        json_data = {
-                  "name": project_name,
-                  "description": "Collection of EEM Templates",
-                  "tags": [
-                    ""
-                  ]
-                }
-        # The request and response of POST  template-programmer/project API
-        resp = post(api="template-programmer/project", data=json_data)
-        status = resp.status_code
-        template = resp.text
-
-    except ValueError:
-        print("Something wrong, can't create template project")
-        sys.exit()
-
-    if status != 202:
-        print(resp.text)
-        sys.exit()
-    else:
-        template_json = json.loads(template)
-        print(json.dumps(template_json, indent=4, sort_keys=True))
-        print(resp.json()["response"]["taskId"])
-        return resp.json()["response"]["taskId"]
+    json_data = {
+              "name": project_name,
+              "description": "Collection of EEM Templates",
+              "tags": [
+                ""
+              ]
+            }
+    # The request and response of POST  template-programmer/project API
+    resp = post(api="template-programmer/project", data=json_data)
+    result = parse_response(resp, 202, "Something wrong, can't create template project")
+    catalog.invalidate_projects()
+    logger.info("Task ID: %s", result.response["taskId"])
+    return result.response["taskId"]
+
+
+def find_template_project_id(project_name="DNAC-Templates"):
+    '''
+    Method to look up the project id for a given Template project without failing when it does not exist.
+    :param project_name: Project Name , default DNAC-Templates
+    :return: Returns Project ID, or None if there is no such project
+    '''
+    return catalog.project_id(project_name)
 
 
 def get_template_project_id(project_name="DNAC-Templates"):
 
     '''
     Method to get the project id for a given Template project
-    Send a GET request to template-programmer/project/ API.
     :param project_name: Project Name , default DNAC-Templates
     :return: Returns Project ID
     '''
-
-    try:
-        # The request and response of GET  API template-programmer/ API
-        resp = get(api="template-programmer/project?name=" + project_name)
-        status = resp.status_code
-        project = resp.text
-
-    except ValueError:
-        print("Something wrong, cannot get project ID")
+    project_id = catalog.project_id(project_name)
+    if project_id is None:
+        logger.error("Something wrong, cannot get project ID")
         sys.exit()
-
-    if status != 200:
-        print(resp.text)
-        sys.exit()
-    else:
-        project_json = json.loads(project)
-        print(json.dumps(project_json, indent=4, sort_keys=True))
-        print(resp.json()[0]["id"])
-        return resp.json()[0]["id"]
+    logger.info("Project ID: %s", project_id)
+    return project_id
 
 
 def create_template(project_id, script , template_name=dnac_config.TEMPLATE_NAME,
-                    product_family=dnac_config.PRODUCT_FAMILY):
+                    product_family=dnac_config.PRODUCT_FAMILY, template_params=None):
     '''
     Method to create a template on DNAC.
     POST to template-programmer/project/{projectID}/template
@@ -101,101 +88,86 @@ def create_template(project_id, script , template_name=dnac_config.TEMPLATE_NAME
     :param script: EEM Script that need to be deployed.
     :param template_name: Template Name. Configured via dnac_config.TEMPLATE_NAME.
     :param product_family: Product Family of the device. Configured via dnac_config.PRODUCT_FAMILY.
+    :param template_params: List of template parameter definitions. Default is no parameters.
     :return: Task ID
     '''
-    try:
-        json_data ={"name": template_name,
-                    "description": "",
-                    "tags": [],
-                    "deviceTypes": [{
-                        "productFamily": product_family,
-                        "productSeries": "",
-                        "productSeries": "",
-                        "productType": "",
-                    }],
-                    "softwareType": "IOS-XE",
-                    "containingTemplates": [],
-                    "templateContent": script,
-                    "templateParams": []
-                    }
-        # The request and response of POST template-programmer/project/{projectID}/template API
-        resp = post(api="template-programmer/project/" + project_id + "/template", data=json_data)
-        status = resp.status_code
-        template = resp.text
-
-    except ValueError:
-        print("Something wrong, can't create template")
-        sys.exit()
-
-    if status != 202:
-        print(resp.text)
-        sys.exit()
-    else:
-        template_json = json.loads(template)
-        print(json.dumps(template_json, indent=4, sort_keys=True))
-        print(resp.json()["response"]["taskId"])
-        return resp.json()["response"]["taskId"]
+    json_data ={"name": template_name,
+                "description": "",
+                "tags": [],
+                "deviceTypes": [{
+                    "productFamily": product_family,
+                    "productSeries": "",
+                    "productType": "",
+                }],
+                "softwareType": "IOS-XE",
+                "containingTemplates": [],
+                "templateContent": script,
+                "templateParams": template_params or []
+                }
+    # The request and response of POST template-programmer/project/{projectID}/template API
+    resp = post(api="template-programmer/project/" + project_id + "/template", data=json_data)
+    result = parse_response(resp, 202, "Something wrong, can't create template")
+    catalog.invalidate_templates()
+    logger.info("Task ID: %s", result.response["taskId"])
+    return result.response["taskId"]
 
 
 def get_parent_template_id(project_id, template_name=dnac_config.TEMPLATE_NAME):
     '''
     Method to get the Parent Template ID for a given Template.
-    GET Method to template-programmer/project/{projectID}/template
     :param project_id: Project ID of the Template Programmer Project
     :param template_name: Template Name. Configured via dnac_config.TEMPLATE_NAME.
-    :return: Returns Parent Template ID
+    :return: Returns Parent Template ID, or None if the project has no such template
     '''
-    try:
-        # The request and response of GET template-programmer/template API
-        resp = get(api="template-programmer/project/" + project_id + "/template")
-        status = resp.status_code
-        template = resp.text
-
-    except ValueError:
-        print("Something wrong, cannot get template information")
-        sys.exit()
+    template_id = catalog.template_id(template_name, project_id)
+    logger.info("Parent Template ID: %s", template_id)
+    return template_id
 
-    if status != 200:
-        print(resp.text)
-        sys.exit()
-    else:
-        template_json = json.loads(template)
-        print(json.dumps(template_json, indent=4, sort_keys=True))
-        for index in template_json:
-            for key in index:
-                if index[key] == template_name:
-                    template_id = index["id"]
-                    print(template_id)
-                    return template_id
-
-
-def commit_template(template_id):
+
+def get_template(template_id):
+    '''
+    Method to get the current (uncommitted) content of a template.
+    GET to template-programmer/template/{templateId}
+    :param template_id: Template ID of the Template.
+    :return: Returns template JSON
+    '''
+    resp = get(api="template-programmer/template/" + template_id)
+    return parse_response(resp, 200, "Something wrong, cannot get template information").data
+
+
+def update_template(template_json):
+    '''
+    Method to update the content of an existing template.
+    PUT to template-programmer/template
+    :param template_json: Full template JSON, as returned by get_template, with the fields to change updated.
+    :return: Returns Task ID
+    '''
+    resp = put(api="template-programmer/template", data=template_json)
+    result = parse_response(resp, 202, "Something wrong, can't update template")
+    # The update may rename the template or move it to another project
+    catalog.invalidate_templates()
+    logger.info("Task ID: %s", result.response["taskId"])
+    return result.response["taskId"]
+
+
+def commit_template(template_id, comments="Committing template"):
     '''
     Method to commit a template in DNAC.
     Post to template-programmer/template/version
     :param template_id:  Template ID of the Template.
-    :return: Returns None
+    :param comments: Commit comments, stored as the description of the new version.
+    :return: Returns Task ID
     '''
-    try:
-        json_data = {
-            "templateId": template_id,
-            "comments": "Committing template"
-        }
-        # The request and response of Post template-programmer/template/version API
-        resp = post(api="template-programmer/template/version", data=json_data)
-        status = resp.status_code
-        template = resp.text
-
-    except ValueError:
-        print("Something wrong, cannot commit template")
-        sys.exit()
-
-    if status != 202:
-        print(resp.text)
-        sys.exit()
-    else:
-        template_json = json.loads(template)
-        print(json.dumps(template_json, indent=4, sort_keys=True))
+    json_data = {
+        "templateId": template_id,
+        "comments": comments
+    }
+    # The request and response of Post template-programmer/template/version API
+    resp = post(api="template-programmer/template/version", data=json_data)
+    result = parse_response(resp, 202, "Something wrong, cannot commit template")
+    catalog.invalidate_versions(template_id)
+    logger.info("Task ID: %s", result.response["taskId"])
+    return result.response["taskId"]
 
 
 def get_templateid(template_name= dnac_config.TEMPLATE_NAME):
@@ -204,86 +176,63 @@ def get_templateid(template_name= dnac_config.TEMPLATE_NAME):
     :param template_name: Template Name. Configured via dnac_config.TEMPLATE_NAME.
     :return: Template ID
     '''
-    try:
-        # The request and response of GET template-programmer/template API
-        resp = get(api="template-programmer/template")
-        status = resp.status_code
-        template = resp.text
-
-    except ValueError:
-        print("Something wrong, cannot get template information")
-        sys.exit()
-
-    if status != 200:
-        print(resp.text)
+    template_id = catalog.template_id(template_name)
+    if template_id is None:
+        logger.error("Something wrong, cannot get template information")
         sys.exit()
-    else:
-        template_json = json.loads(template)
-        print(json.dumps(template_json, indent=4, sort_keys=True))
-        template_id = get_filtered_templateID(template_json)
-        return template_id
+    logger.info("Template ID: %s", template_id)
+    return template_id
 
 
 def get_template_version(template_ID):
     '''
     Method to get a particular Version ID for a template
-    GET to template-programmer/template/version/{template_ID}
     :param template_ID: Template ID of the Template
-    :return: Version ID.
+    :return: Version ID of the latest committed version.
     '''
-    try:
-        # The request and response of GET template-programmer/template API
-        resp = get(api="template-programmer/template/version/"+template_ID)
-        status = resp.status_code
-        template = resp.text
-
-    except ValueError:
-        print("Something wrong, cannot get latest template version information")
+    latest_version = get_latest_version_info(template_ID)
+    if latest_version is None:
+        logger.error("Something wrong, cannot get latest template version information")
         sys.exit()
+    logger.info("Version ID: %s", latest_version["id"])
+    return latest_version["id"]
 
-    if status != 200:
-        print(resp.text)
-        sys.exit()
-    else:
-        template_json = json.loads(template)
-        print(json.dumps(template_json, indent=4, sort_keys=True))
-        latest_version = get_filtered_version(template_json)
-        print(latest_version)
-        return(latest_version)
+
+def get_latest_version_info(template_ID):
+    '''
+    Method to get the latest committed version of a template.
+    :param template_ID: Template ID of the Template
+    :return: versionsInfo entry (id, version, description, ...) of the latest version, or None if never committed.
+    '''
+    return catalog.latest_version(template_ID)
 
 
-def deploy_template(version_id, network_uuid):
+def deploy_template(version_id, network_uuid, params=None, device_params=None):
     '''
     Method to deploy a Template to a device.
     :param version_id: Version ID of the Template.
-    :param network_uuid: Device Network UUID.
+    :param network_uuid: Device Network UUID, or a list of UUIDs to deploy to several devices in one request.
+    :param params: Template parameter values used for every device.
+    :param device_params: Dict of Device Network UUID to parameter values overriding params for that device.
     :return: Returns Task ID.
     '''
+    if not isinstance(network_uuid, list):
+        network_uuid = [network_uuid]
     jsondata = {"templateId": version_id,
                 "targetInfo": [
                     {
                         "type":"MANAGED_DEVICE_UUID",
-                        "id": network_uuid
-                    }
+                        "id": uuid
+                    } for uuid in network_uuid
                  ]}
-    try:
-        # The request and response of POST template-programmer/template/deploy API
-        resp = post(api="template-programmer/template/deploy", data=jsondata)
-        status = resp.status_code
-        template = resp.text
-
-    except ValueError:
-        print("Something wrong, deployment failed")
-        sys.exit()
-
-    if status != 202:
-        print(resp.text)
-        sys.exit()
-    else:
-        template_json = json.loads(template)
-        print(json.dumps(template_json, indent=4, sort_keys=True))
-        print("deployment ID : {}".format(template_json["deploymentId"]))
-        return template_json["deploymentId"]
+    if params or device_params:
+        for target in jsondata["targetInfo"]:
+            target["params"] = dict(params or {}, **(device_params or {}).get(target["id"], {}))
+    # The request and response of POST template-programmer/template/deploy API
+    resp = post(api="template-programmer/template/deploy", data=jsondata)
+    result = parse_response(resp, 202, "Something wrong, deployment failed")
+    logger.info("deployment ID : %s", result.data["deploymentId"])
+    return result.data["deploymentId"]
 
 
 def check_status(deploy_ID):
@@ -293,45 +242,20 @@ def check_status(deploy_ID):
     :param deploy_ID: Deployment ID
     :return: JSON containing the status of the deployment.
     '''
-    try:
-        # The request and response of GET template-programmer/template/deploy/status/ API
-        resp = get(api="template-programmer/template/deploy/status/"+deploy_ID)
-        status = resp.status_code
-        template = resp.text
-
-    except ValueError:
-        print("Something wrong, cannot get deployment status")
-        sys.exit()
-
-    if status != 202:
-        print(resp.text)
-        sys.exit()
-    else:
-        template_json = json.loads(template)
-        print(json.dumps(template_json, indent=4, sort_keys=True))
-        return(template_json)
+    # The request and response of GET template-programmer/template/deploy/status/ API
+    resp = get(api="template-programmer/template/deploy/status/"+deploy_ID)
+    return parse_response(resp, 202, "Something wrong, cannot get deployment status").data
 
 
 def get_filtered_templateID(template_json, filter=dnac_config.TEMPLATE_NAME):
     for index in template_json:
-        for key in index:
-            if index[key] == filter:
-                template_ID = index["templateId"]
-                print(template_ID)
-                return(template_ID)
+        if index.get("name") == filter:
+            template_ID = index["templateId"]
+            logger.info("Template ID: %s", template_ID)
+            return(template_ID)
 
 
 def get_filtered_version(template_json):
-    version = 0
-    for index in template_json[0]["versionsInfo"]:
-        for key in index:
-            if key == "version" and int(index[key]) > version:
-                version = int(index[key])
-                # print(version)
-
-    for index in template_json[0]["versionsInfo"]:
-        for key in index:
-            if index[key] == str(version):
-                version_ID = index["id"]
-                # print(version_ID)
-                return(version_ID)
+    versions = template_json[0]["versionsInfo"]
+    if versions:
+        return max(versions, key=lambda index: int(index["version"]))["id"]
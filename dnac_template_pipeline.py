@@ -0,0 +1,220 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+"""
+This file contains an idempotent version of the template workflow.
+The normalized template content and parameters are hashed, the hash is stored in the commit
+comments of the template version and, per device, in a local deploy state file.
+Steps whose result already matches the hash are skipped:
+ -the project and the template are only created when they do not exist
+ -the template is only updated and committed when its content changed
+ -the template is only deployed to devices that do not run the committed content yet
+"""
+
+from dnac_template_helper import *
+import dnac_config
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+HASH_PREFIX = "sha256:"
+# Fields of a template parameter definition that are hashed. DNAC adds fields of its own (id, selection, ...)
+# to the definitions it returns and may fill in displayName and order, those are left out.
+PARAM_FIELDS = ("parameterName", "dataType", "description", "required")
+
+
+def normalize_template(script):
+    '''
+    Normalize template content so whitespace-only differences hash the same.
+    :param script: Template content
+    :return: Content with each line stripped and blank lines removed
+    '''
+    return "\n".join(line.strip() for line in script.splitlines() if line.strip())
+
+
+def normalize_params(template_params):
+    '''
+    Normalize template parameter definitions so the ones sent and the ones DNAC returns hash the same.
+    :param template_params: List of template parameter definitions
+    :return: The definitions reduced to PARAM_FIELDS, sorted by parameter name
+    '''
+    return sorted((dict((field, param.get(field)) for field in PARAM_FIELDS) for param in template_params or []),
+                  key=lambda param: str(param["parameterName"]))
+
+
+def template_hash(script, template_params=None):
+    '''
+    Hash of the normalized template content and its parameter definitions.
+    :param script: Template content
+    :param template_params: List of template parameter definitions
+    :return: Hash string, HASH_PREFIX followed by the hex digest
+    '''
+    digest = hashlib.sha256(normalize_template(script).encode("utf-8"))
+    digest.update(json.dumps(normalize_params(template_params), sort_keys=True).encode("utf-8"))
+    return HASH_PREFIX + digest.hexdigest()
+
+
+def load_deploy_state(state_file=None):
+    '''
+    Read the record of what was last deployed to each device.
+    :param state_file: Path of the state file. Default dnac_config.DEPLOY_STATE_FILE, one per cluster (see cluster_file).
+    :return: dict of device UUID to {"hash": ..., "versionId": ...}
+    '''
+    state_file = state_file or cluster_file(dnac_config.DEPLOY_STATE_FILE)
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file) as f:
+        return json.load(f)
+
+
+def save_deploy_state(state, state_file=None):
+    '''
+    Write the deploy state file, replacing it atomically.
+    '''
+    state_file = state_file or cluster_file(dnac_config.DEPLOY_STATE_FILE)
+    tmp_file = state_file + ".tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, state_file)
+
+
+def ensure_project(project_name="DNAC-Templates"):
+    '''
+    Look up the template project, creating it and waiting for the creation task if it does not exist.
+    :param project_name: Template Programmer Project Name
+    :return: Returns Project ID
+    '''
+    project_id = find_template_project_id(project_name)
+    if project_id is None:
+        logger.info("----------------- Creating a new Template Project ----------------------")
+        wait_for_task(create_template_project(project_name))
+        catalog.invalidate_projects()
+        project_id = get_template_project_id(project_name)
+    return project_id
+
+
+def ensure_template(project_id, script, template_params=None, template_name=dnac_config.TEMPLATE_NAME,
+                    product_family=dnac_config.PRODUCT_FAMILY):
+    '''
+    Make sure the template exists in the project with the given content, waiting for the create or update task.
+    :return: Returns Template ID
+    '''
+    template_id = get_parent_template_id(project_id, template_name)
+    if template_id is None:
+        logger.info("----------------- Creating a new Template ---------------------")
+        wait_for_task(create_template(project_id, script, template_name, product_family, template_params))
+        catalog.invalidate_templates()
+        template_id = get_parent_template_id(project_id, template_name)
+    else:
+        template_json = get_template(template_id)
+        if template_hash(template_json.get("templateContent", ""), template_json.get("templateParams")) != \
+                template_hash(script, template_params):
+            logger.info("----------------- Updating the Template content ---------------------")
+            template_json["templateContent"] = script
+            template_json["templateParams"] = template_params or []
+            wait_for_task(update_template(template_json))
+    return template_id
+
+
+def ensure_committed(template_id, content_hash, latest_version=None):
+    '''
+    Commit the template unless its latest version already has the content, waiting for the commit task.
+    :param template_id: Template ID
+    :param content_hash: Hash of the template content
+    :param latest_version: versionsInfo entry of the latest version, as returned by get_latest_version_info
+    :return: Returns Version ID
+    '''
+    if latest_version is not None and content_hash in (latest_version.get("description") or ""):
+        logger.info("----------------- Template content unchanged, version %s already committed ---------------------",
+                    latest_version["version"])
+        return latest_version["id"]
+
+    logger.info("----------------- Committing the Template ---------------------")
+    wait_for_task(commit_template(template_id, "Committing template " + content_hash))
+    # Versions read while the commit task was running are not kept
+    catalog.invalidate_versions(template_id)
+    return get_latest_version_info(template_id)["id"]
+
+
+def ensure_template_version(script, template_params=None, project_name="DNAC-Templates",
+                            template_name=dnac_config.TEMPLATE_NAME, product_family=dnac_config.PRODUCT_FAMILY):
+    '''
+    Make sure the latest committed version of the template has the given content,
+    creating, updating and committing only what is missing or changed.
+    Each step waits for the DNAC task of the previous one.
+    :param script: Template content
+    :param template_params: List of template parameter definitions
+    :param project_name: Template Programmer Project Name
+    :param template_name: Template Name. Configured via dnac_config.TEMPLATE_NAME.
+    :param product_family: Product Family of the device. Configured via dnac_config.PRODUCT_FAMILY.
+    :return: Returns (Version ID, content hash)
+    '''
+    content_hash = template_hash(script, template_params)
+    with metrics.step("project"):
+        project_id = ensure_project(project_name)
+    with metrics.step("template"):
+        template_id = ensure_template(project_id, script, template_params, template_name, product_family)
+    with metrics.step("version"):
+        latest_version = get_latest_version_info(template_id)
+    with metrics.step("commit"):
+        return ensure_committed(template_id, content_hash, latest_version), content_hash
+
+
+def deployment_hash(content_hash, params=None):
+    '''
+    Hash of what a device runs: the template content hash and the parameter values deployed with it.
+    :param content_hash: Hash of the committed template content
+    :param params: Template parameter values of the device
+    :return: content_hash itself when there are no parameter values
+    '''
+    if not params:
+        return content_hash
+    digest = hashlib.sha256(content_hash.encode("utf-8"))
+    digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    return HASH_PREFIX + digest.hexdigest()
+
+
+def device_params_for(uuid, params=None, device_params=None):
+    '''
+    Parameter values deployed to one device: params overridden by its entry in device_params.
+    '''
+    return dict(params or {}, **(device_params or {}).get(uuid, {}))
+
+
+def devices_to_deploy(network_uuids, content_hash, state, params=None, device_params=None):
+    '''
+    Filter out devices whose last successful deployment already had this content and parameter values.
+    :param network_uuids: List of Device Network UUIDs
+    :param content_hash: Hash of the committed template content
+    :param state: Deploy state, as returned by load_deploy_state
+    :param params: Template parameter values used for every device
+    :param device_params: Dict of Device Network UUID to parameter values overriding params for that device
+    :return: List of Device Network UUIDs that need the template
+    '''
+    return [uuid for uuid in network_uuids if state.get(uuid, {}).get("hash") !=
+            deployment_hash(content_hash, device_params_for(uuid, params, device_params))]
+
+
+def record_deployment(state, network_uuids, version_id, content_hash, params=None, device_params=None):
+    '''
+    Record a successful deployment of a template version to devices in the deploy state.
+    '''
+    for uuid in network_uuids:
+        state[uuid] = {"hash": deployment_hash(content_hash, device_params_for(uuid, params, device_params)),
+                       "versionId": version_id}
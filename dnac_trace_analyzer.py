@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+"""
+This script triages the collected logs of many devices at once.
+Error lines of the decoded trace text are reduced to signatures by replacing timestamps, addresses,
+identifiers and counters with placeholders, and counted per signature, device and process, so the
+same fault seen on hundreds of devices shows up as one line of the report.
+Collections are analyzed in parallel by a process pool; lines are checked with a cheap byte search
+for an error level before the full regular expression runs. Binary trace files are not read, their
+records are decoded on the device into the text member the EEM Script adds to each collection; a
+collection with binary members and no decoded member is reported with a warning.
+
+Usage: python3 dnac_trace_analyzer.py [collection dir or tarball ...] [--top N] [--json report.json]
+Without paths every collection of ARCHIVE_STORE is analyzed.
+"""
+
+import dnac_config
+from dnac_api_helper import setup_logging
+from dnac_ingest import ArchiveStore, decompressed, parse_archive_name, UNKNOWN_DEVICE
+import argparse
+import itertools
+import json
+import logging
+import os
+import re
+import tarfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Byte strings one of which an error line must contain, checked before the full regular expression
+PREFILTER = (b"ERR", b"CRIT", b"EMERG", b"ALERT", b"err")
+
+# Decoded IOS-XE trace line, e.g.
+# 2018/05/04 11:12:13.123 {dbm_R0-0}{1}: [dbm] [1234]: UUID: 0, ra: 0, TID: 0 (ERR): message
+TRACE_LINE = re.compile(rb"\{(?P<process>[^}]*)\}\{\d+\}: \[(?P<module>[^\]]*)\] .*?\((?P<level>EMERG|ALERT|CRIT|ERR|ERROR)\): (?P<message>.*)")
+# Any other text line with an error level word
+GENERIC_LINE = re.compile(rb"\b(?P<level>EMERG|ALERT|CRIT|ERR|ERROR)\b[\]):]*\s*(?P<message>.*)")
+
+# Variable parts of a message, replaced in this order
+NORMALIZE = [
+    (re.compile(r"\d{4}[/-]\d\d[/-]\d\d[ T]\d\d:\d\d:\d\d(\.\d+)?"), "<TS>"),
+    (re.compile(r"\b\d\d:\d\d:\d\d(\.\d+)?\b"), "<TS>"),
+    (re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"), "<UUID>"),
+    (re.compile(r"\b(?:[0-9a-fA-F]{2}[:.-]){5}[0-9a-fA-F]{2}\b|\b(?:[0-9a-fA-F]{4}\.){2}[0-9a-fA-F]{4}\b"), "<MAC>"),
+    (re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}(?:/\d{1,2})?\b"), "<IP>"),
+    (re.compile(r"\b0x[0-9a-fA-F]+\b"), "<HEX>"),
+    (re.compile(r"\b[0-9a-fA-F]*\d[0-9a-fA-F]*[a-fA-F][0-9a-fA-F]*\b|\b[0-9a-fA-F]*[a-fA-F][0-9a-fA-F]*\d[0-9a-fA-F]*\b"), "<HEX>"),
+    (re.compile(r"[-+]?\b\d+(\.\d+)?\b"), "<N>"),
+]
+
+
+def normalize_message(message):
+    '''
+    Reduce an error message to its signature.
+    :param message: Message text
+    :return: Message with timestamps, UUIDs, MAC and IP addresses, hex values and numbers replaced
+    '''
+    for pattern, placeholder in NORMALIZE:
+        message = pattern.sub(placeholder, message)
+    return " ".join(message.split())
+
+
+def scan_lines(lines, default_process, counts, examples):
+    '''
+    Count the error signatures of an iterable of byte lines.
+    '''
+    for line in lines:
+        if not any(token in line for token in PREFILTER):
+            continue
+        match = TRACE_LINE.search(line)
+        if match is not None:
+            process = match.group("process").decode("utf-8", "replace").split("_R")[0] or default_process
+        else:
+            match = GENERIC_LINE.search(line)
+            if match is None:
+                continue
+            process = default_process
+        signature = match.group("level").decode() + ": " + normalize_message(match.group("message").decode("utf-8", "replace"))
+        counts[(signature, process)] += 1
+        examples.setdefault(signature, line.decode("utf-8", "replace").strip())
+
+
+def iter_members(path, store=None):
+    '''
+    Yield (member name, binary file object) for each file of a collection.
+    :param path: Collection directory of the ArchiveStore, or a tarball
+    :param store: Store directory of the collection, default the store the collection directory is in
+    '''
+    if os.path.isdir(path):
+        archive = ArchiveStore(store) if store else ArchiveStore.store_for(path)
+        for member in archive.load_manifest(path)["members"]:
+            with archive.open_member(member) as fileobj:
+                yield member["name"], fileobj
+    else:
+        with tarfile.open(path, "r|*") as tar:
+            for member in tar:
+                if member.isfile():
+                    yield member.name, tar.extractfile(member)
+
+
+def collection_source(path):
+    '''
+    :return: (device, process) of a collection directory or tarball
+    '''
+    if os.path.isdir(path):
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+        return manifest["device"], manifest["process"]
+    parsed = parse_archive_name(path)
+    return UNKNOWN_DEVICE, parsed[0] if parsed else "unknown"
+
+
+def analyze_collection(path, store=None):
+    '''
+    Count the error signatures of one collection. Runs in a worker process.
+    :param path: Collection directory of the ArchiveStore, or a tarball
+    :param store: Store directory of the collection, see iter_members
+    :return: (device, {(signature, process): count}, {signature: example line}, names of the binary members,
+              True if the collection has trace text decoded on the device)
+    '''
+    device, process = collection_source(path)
+    counts = defaultdict(int)
+    examples = {}
+    binary = []
+    decoded = False
+    for name, fileobj in iter_members(path, store):
+        # Rotated trace files and logs (*.gz) are collected as well
+        fileobj = decompressed(fileobj)
+        sample = fileobj.read(4096)
+        if b"\0" in sample:
+            # Binary trace files, decoded on the device, and other binary files, e.g. core files
+            binary.append(name)
+            continue
+        decoded = decoded or "_decoded_" in os.path.basename(name)
+        # The sample is completed to a whole line, the rest of the member is read line by line
+        lines = itertools.chain((sample + fileobj.readline()).splitlines(), fileobj)
+        scan_lines(lines, process, counts, examples)
+    return device, dict(counts), examples, binary, decoded
+
+
+def find_collections(store=dnac_config.ARCHIVE_STORE):
+    '''
+    :return: List of all collection directories of the store
+    '''
+    return ArchiveStore(store).collections()
+
+
+def analyze(paths, workers=None, store=None):
+    '''
+    Analyze many collections in parallel and merge the results.
+    :param paths: Collection directories and tarballs
+    :param workers: Worker processes, default one per CPU
+    :param store: Store directory of the collections, default the store each collection directory is in
+    :return: dict of signature to {"count", "devices": {device: {process: count}}, "example"}
+    '''
+    paths = list(paths)
+    report = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(analyze_collection, paths, itertools.repeat(store), chunksize=4)
+        for path, (device, counts, examples, binary, decoded) in zip(paths, results):
+            if binary and not decoded:
+                # E.g. collected before the EEM Script decoded the traces, its binary records are not counted
+                logger.warning("%s: %d binary members not analyzed, no trace text decoded on the device: %s",
+                               path, len(binary), ", ".join(binary))
+            for (signature, process), count in counts.items():
+                entry = report.setdefault(signature, {"count": 0, "devices": {}, "example": examples[signature]})
+                entry["count"] += count
+                processes = entry["devices"].setdefault(device, {})
+                processes[process] = processes.get(process, 0) + count
+    return report
+
+
+def print_report(report, top=50):
+    ranked = sorted(report.items(), key=lambda item: (-len(item[1]["devices"]), -item[1]["count"]))
+    print("{:>8} {:>8}  {}".format("devices", "count", "signature"))
+    for signature, entry in ranked[:top]:
+        print("{:>8} {:>8}  {}".format(len(entry["devices"]), entry["count"], signature))
+        for device, processes in sorted(entry["devices"].items()):
+            print("{:>18}  {} {}".format("", device, ", ".join("{}={}".format(p, c) for p, c in sorted(processes.items()))))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Cluster the errors of collected trace logs by signature")
+    parser.add_argument("paths", nargs="*", help="collection directories or tarballs (default: all of --store)")
+    parser.add_argument("--store", default=dnac_config.ARCHIVE_STORE, help="store directory (default %(default)s)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--top", type=int, default=50, help="signatures to print (default %(default)s)")
+    parser.add_argument("--json", help="also write the full report to this JSON file")
+    args = parser.parse_args()
+    setup_logging(quiet=True)
+
+    if args.paths:
+        report = analyze(args.paths, args.workers)
+    else:
+        report = analyze(find_collections(args.store), args.workers, args.store)
+    print_report(report, args.top)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
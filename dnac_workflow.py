@@ -0,0 +1,84 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.0 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+"""
+This file contains a small executor for workflows expressed as a dependency graph of steps.
+Each step declares the steps whose results it needs and receives them as keyword arguments.
+A step starts as soon as the steps it needs have finished, so independent branches (e.g. the device
+UUID lookup and the template steps) run at the same time and a run takes as long as its critical path.
+Steps run in a copy of the context of run(), so they talk to the cluster in use (see use_cluster).
+"""
+
+from dnac_metrics import metrics
+import contextvars
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+
+class Workflow(object):
+    '''
+    Steps added with add() and run on a thread pool by run().
+    Steps can only depend on steps added before them, so the graph has no cycles.
+    '''
+
+    def __init__(self):
+        self._steps = {}   # step name -> (function, names of the steps it needs)
+
+    def add(self, name, func, requires=()):
+        '''
+        :param name: Step name, also the keyword its result is passed as to the steps that need it
+        :param func: Function called with the results of the required steps as keyword arguments
+        :param requires: Names of the steps that must finish first
+        '''
+        if name in self._steps:
+            raise ValueError("Duplicate workflow step " + name)
+        unknown = [required for required in requires if required not in self._steps]
+        if unknown:
+            raise ValueError("Workflow step " + name + " requires unknown steps " + ", ".join(unknown))
+        self._steps[name] = (func, tuple(requires))
+
+    def _run_step(self, name, func, inputs):
+        logger.debug("Workflow step %s started", name)
+        with metrics.step(name):
+            result = func(**inputs)
+        logger.debug("Workflow step %s finished", name)
+        return result
+
+    def run(self, max_workers=None):
+        '''
+        Run all steps, each one as soon as the steps it requires have finished.
+        When a step fails no further step is started, the steps already running are waited for
+        and the exception of the failed step is raised.
+        :param max_workers: Steps running at once, default all steps
+        :return: dict of step name to result
+        '''
+        results = {}
+        waiting = dict(self._steps)
+        running = {}
+        with ThreadPoolExecutor(max_workers=max_workers or max(1, len(self._steps))) as executor:
+            while waiting or running:
+                for name, (func, requires) in list(waiting.items()):
+                    if all(required in results for required in requires):
+                        del waiting[name]
+                        inputs = dict((required, results[required]) for required in requires)
+                        context = contextvars.copy_context()
+                        running[executor.submit(context.run, self._run_step, name, func, inputs)] = name
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+        return results